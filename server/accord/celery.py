@@ -2,24 +2,65 @@ from __future__ import absolute_import, unicode_literals
 import os
 from celery import Celery
 from celery.schedules import crontab
+from celery.signals import worker_init
+from django.core.exceptions import ImproperlyConfigured
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'accord.settings')
 
 app = Celery("accord")
-app.config_from_object("celeryconfig", namespace='CELERY')
+app.config_from_object("accord.celeryconfig", namespace='CELERY')
 app.autodiscover_tasks()
 app.conf.timezone = "UTC"
 
+# Result backends which can't join the subtasks of a chord, the nightly analytics sync is a chord
+CHORD_UNSUPPORTED_BACKENDS = ("rpc", "amqp", "disabled")
+
 
 app.conf.beat_schedule = {
     "periodic-analytics-fetch-every-day": {
         "task": "insights.tasks.update_analytics",
         "schedule": crontab(hour='1'),
         "args": ()
+    },
+    "daily-metric-partitions-maintenance": {
+        "task": "insights.tasks.maintain_metric_partitions",
+        "schedule": crontab(hour='0', minute='30'),
+        "args": ()
+    },
+    "daily-linkwall-counters-compaction": {
+        "task": "linktree.tasks.compact_linkwall_counters",
+        "schedule": crontab(hour='0', minute='15'),
+        "args": ()
+    },
+    "linkwall-events-flush-every-ten-seconds": {
+        "task": "linktree.tasks.flush_linkwall_events",
+        "schedule": 10.0,
+        "args": ()
     }
 }
 
 
+# update_analytics routes its chunks to one queue per platform, a worker has to consume them explicitly:
+#   celery -A accord worker -Q celery,analytics.instagram,analytics.youtube
+# or one worker pool per platform, e.g. `celery -A accord worker -Q analytics.youtube`,
+# so that a slow or rate limited platform does not hold back the other one
+
+
+def check_chord_backend(celery_app: Celery) -> None:
+    """
+    Raises ImproperlyConfigured when the result backend can't run the analytics chord
+    """
+    result_backend = str(celery_app.conf.result_backend or "disabled")
+    scheme = result_backend.split("://")[0]
+    if scheme in CHORD_UNSUPPORTED_BACKENDS:
+        raise ImproperlyConfigured(f"CELERY_RESULT_BACKEND {result_backend} does not support chords, "
+                                   "use a backend shared by every worker e.g redis://")
+
+
+@worker_init.connect
+def on_worker_init(sender=None, **kwargs) -> None:
+    check_chord_backend(app)
+
 
 @app.task(bind=True)
 def debug_task(self):
@@ -1,8 +1,9 @@
 import os
 
 
-CELERY_BROKER_URL = f"ampq://{os.getenv('CELERY_USER', 'jarden')}:{os.getenv('CELERY_PASSWORD', 'krispi@103904')}@{os.getenv('CELERY_HOST_NAME', 'localhost')}:5672/{os.getenv('CELERY_VIRTUAL_HOST', 'accord_host')}"
-CELERY_RESULT_BACKEND = f"ampq://{os.getenv('CELERY_USER', 'jarden')}:{os.getenv('CELERY_PASSWORD', 'krispi@103904')}@{os.getenv('CELERY_HOST_NAME', 'localhost')}:5672/{os.getenv('CELERY_VIRTUAL_HOST', 'accord_host')}"
+CELERY_BROKER_URL = f"amqp://{os.getenv('CELERY_USER', 'jarden')}:{os.getenv('CELERY_PASSWORD', 'krispi@103904')}@{os.getenv('CELERY_HOST_NAME', 'localhost')}:5672/{os.getenv('CELERY_VIRTUAL_HOST', 'accord_host')}"
+# Analytics sync runs as a chord, which needs a result backend readable by every worker, rpc:// is refused at worker start
+CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND', f"redis://{os.getenv('CELERY_HOST_NAME', 'localhost')}:6379/0")
 CELERY_ACCEPT_CONTENT = ["application/json"]
 CELERY_RESULT_SERIALIZER = "json"
-CELERY_TASK_SERIALIZER = "json"
\ No newline at end of file
+CELERY_TASK_SERIALIZER = "json"
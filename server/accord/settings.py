@@ -43,6 +43,66 @@ DEBUG = os.getenv('DEBUG', False) == "True"
 #Domain name of the front end site, used for creating httponly cookie
 FRONT_END_DOMAIN = "localhost" 
 
+#Maximum number of social media handles synced concurrently by the analytics task
+DIGGER_CONCURRENCY = int(os.getenv('DIGGER_CONCURRENCY', 20))
+
+#Number of social media handles synced by a single analytics subtask
+ANALYTICS_CHUNK_SIZE = int(os.getenv('ANALYTICS_CHUNK_SIZE', 500))
+
+#ETag cache of the YouTube Data API responses, "lru" (per process), "django" (CACHES default) or a redis:// url
+DIGGER_RESPONSE_CACHE = os.getenv('DIGGER_RESPONSE_CACHE', "lru")
+
+#Seconds a response is kept by the "django" and redis response caches
+DIGGER_RESPONSE_CACHE_TTL = int(os.getenv('DIGGER_RESPONSE_CACHE_TTL', 7 * 24 * 60 * 60))
+
+#Url of the redis server backing the default cache, every process shares it. Unset falls back to a per-process LocMemCache
+CACHE_URL = os.getenv('CACHE_URL')
+
+#Seconds an entry is kept at most in a per-process cache, the invalidations made by a worker don't reach the others
+LOCAL_CACHE_MAX_TTL = int(os.getenv('LOCAL_CACHE_MAX_TTL', 5))
+
+#Alias in CACHES of the token -> user -> account cache shared by the auth middleware and DRF
+AUTH_CACHE = os.getenv('AUTH_CACHE', "default")
+
+#Seconds a resolved token is cached, changes to the user or its accounts invalidate it at once (LOCAL_CACHE_MAX_TTL at most on locmem)
+AUTH_CACHE_TTL = int(os.getenv('AUTH_CACHE_TTL', 300))
+
+#Seconds a key which matches no token is cached
+AUTH_CACHE_INVALID_TTL = int(os.getenv('AUTH_CACHE_INVALID_TTL', 30))
+
+#Alias in CACHES of the serialized public link walls
+LINKWALL_SNAPSHOT_CACHE = os.getenv('LINKWALL_SNAPSHOT_CACHE', "default")
+
+#Seconds a serialized link wall is cached, changes to the wall refresh it at once (LOCAL_CACHE_MAX_TTL at most on locmem)
+LINKWALL_SNAPSHOT_TTL = int(os.getenv('LINKWALL_SNAPSHOT_TTL', 60*60*24))
+
+#Buffer of the linkwall view and click events, "memory" (per process) or a redis:// url
+LINKWALL_EVENT_BUFFER = os.getenv('LINKWALL_EVENT_BUFFER', "memory")
+
+#Maximum number of buffered linkwall events, further events are refused until the buffer is flushed
+LINKWALL_EVENT_BUFFER_SIZE = int(os.getenv('LINKWALL_EVENT_BUFFER_SIZE', 10000))
+
+#Number of linkwall events bulk inserted at once
+LINKWALL_EVENT_BATCH_SIZE = int(os.getenv('LINKWALL_EVENT_BATCH_SIZE', 500))
+
+#Seconds between flushes of the in-memory linkwall event buffer, 0 disables the flusher thread
+LINKWALL_EVENT_FLUSH_INTERVAL = float(os.getenv('LINKWALL_EVENT_FLUSH_INTERVAL', 5))
+
+#Seconds a batch popped from the redis linkwall event buffer may take to be written before another flush requeues it
+LINKWALL_EVENT_PROCESSING_TIMEOUT = int(os.getenv('LINKWALL_EVENT_PROCESSING_TIMEOUT', 300))
+
+#Days of raw linkwall view and click rows kept once compacted into daily counters, 0 keeps every row
+LINKWALL_EVENT_RETENTION_DAYS = int(os.getenv('LINKWALL_EVENT_RETENTION_DAYS', 0))
+
+#Monthly partitions of the weekly handle metric tables created ahead of the current month (Postgres only)
+HANDLE_METRICS_PARTITIONS_AHEAD = int(os.getenv('HANDLE_METRICS_PARTITIONS_AHEAD', 3))
+
+#Months of weekly handle metric rows kept, 0 keeps every month. Facts and rollups are not affected
+HANDLE_METRICS_RETENTION_MONTHS = int(os.getenv('HANDLE_METRICS_RETENTION_MONTHS', 0))
+
+#What happens to the partitions past the retention, "archive" (detach) or "drop"
+HANDLE_METRICS_RETENTION_ACTION = os.getenv('HANDLE_METRICS_RETENTION_ACTION', "archive")
+
 
 ALLOWED_HOSTS = []
 
@@ -114,7 +174,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'accounts.authentication.CachedTokenAuthentication',
     ]
 }
 
@@ -156,6 +216,18 @@ DATABASES = {
 
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.0/topics/cache/
+
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        }
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
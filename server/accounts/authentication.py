@@ -0,0 +1,162 @@
+from hashlib import sha256
+from typing import Dict, Iterable, List, NamedTuple, Tuple, Union
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.http import HttpRequest
+from django.utils.functional import SimpleLazyObject
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+
+from accounts.models import Account
+from utils import get_cache_timeout
+
+
+# Cached in place of an entry for keys which do not match any token
+INVALID_TOKEN = "invalid"
+
+
+class TokenAuthEntry(NamedTuple):
+    """
+    Token resolved to the ids of its user and of the accounts of the user, cached as a whole\n
+    Only ids and flags are cached, the models are read lazily on first use
+
+    user_id -- Id of the user owning the token\n
+    is_active -- User.is_active\n
+    accounts -- (id, username) of the accounts of the user ordered by id\n
+    loaded -- Accounts read along with the entry on a cache miss by id, `account.user` is set, never cached [Optional]
+    """
+    user_id: int
+    is_active: bool
+    accounts: List[Tuple[int, str]]
+    loaded: Dict[int, Account] = None
+
+    def get_account(self, access_user: str = None) -> Union[Account, None]:
+        """
+        Returns the account named `access_user`, or the first account of the user when not given\n
+        Unless it was loaded with the entry, the account and its user are read in one query when the account is first used
+        """
+        for account_id, username in self.accounts:
+            if access_user is None or username == access_user:
+                if self.loaded is not None and account_id in self.loaded:
+                    return self.loaded[account_id]
+                return SimpleLazyObject(lambda: Account.objects.select_related("user").get(id=account_id))
+        return None
+
+    def get_user(self, account: Account = None) -> User:
+        """
+        Returns the user of the token, read with the account when one is given
+        """
+        if account is not None:
+            return SimpleLazyObject(lambda: account.user)
+        return SimpleLazyObject(lambda: User.objects.get(id=self.user_id))
+
+
+class TokenAuthCache:
+    """
+    Caches token -> user -> accounts in one of the CACHES of the django settings, keyed by the sha256 of the token\n
+    Keys which match no token are cached as well, for a shorter time\n
+    Entries hold ids and flags only, no model instances (e.g the password hash of the user) are written to the cache\n
+    Invalidations only reach the other workers through a shared cache, a per-process cache keeps entries a few seconds
+
+    Keyword Arguments:\n
+    alias -- Alias of the cache in CACHES [default=settings.AUTH_CACHE]\n
+    timeout -- Seconds an entry is kept [default=settings.AUTH_CACHE_TTL]\n
+    invalid_timeout -- Seconds an unknown key is kept [default=settings.AUTH_CACHE_INVALID_TTL]\n
+    """
+    key_prefix = "auth:token:"
+
+    def __init__(self, alias: str = None, timeout: int = None, invalid_timeout: int = None) -> None:
+        self.alias = alias or settings.AUTH_CACHE
+        self.timeout = settings.AUTH_CACHE_TTL if timeout is None else timeout
+        self.invalid_timeout = settings.AUTH_CACHE_INVALID_TTL if invalid_timeout is None else invalid_timeout
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get_key(self, token_key: str) -> str:
+        # Hashed, the keys of a shared cache would list every live token otherwise
+        return f"{self.key_prefix}{sha256(token_key.encode()).hexdigest()}"
+
+    def load(self, token_key: str) -> Union[TokenAuthEntry, None]:
+        token = Token.objects.filter(key=token_key).values("user_id", "user__is_active").first()
+        if token is None:
+            return None
+        # The request which missed the cache uses the accounts without reading them again
+        accounts: List[Account] = list(Account.objects.select_related("user").filter(user_id=token["user_id"]).order_by("id"))
+        return TokenAuthEntry(token["user_id"], token["user__is_active"], [(account.id, account.username) for account in accounts],
+                              {account.id: account for account in accounts})
+
+    def resolve(self, token_key: str) -> Union[TokenAuthEntry, None]:
+        """
+        Returns the entry of the token, None when the key matches no token
+        """
+        key = self.get_key(token_key)
+        entry = self.cache.get(key)
+        if entry is None:
+            entry = self.load(token_key)
+            if entry is None:
+                self.cache.set(key, INVALID_TOKEN, get_cache_timeout(self.cache, self.invalid_timeout))
+            else:
+                self.cache.set(key, entry._replace(loaded=None), get_cache_timeout(self.cache, self.timeout))
+        if entry == INVALID_TOKEN:
+            return None
+        return entry
+
+    def invalidate(self, token_keys: Iterable[str]) -> None:
+        self.cache.delete_many([self.get_key(token_key) for token_key in token_keys])
+
+    def invalidate_user(self, user_id: int) -> None:
+        """
+        Drops the entries of every token of the user, on logout, password change, account changes
+        """
+        self.invalidate(Token.objects.filter(user_id=user_id).values_list("key", flat=True))
+
+
+token_auth_cache = TokenAuthCache()
+
+
+def get_token_key(request: HttpRequest) -> Union[str, None]:
+    if (token_str := request.META.get('HTTP_AUTHORIZATION', None)) is None:
+        return None
+    return token_str.replace("Token ", "")
+
+
+def resolve_request_token(request: HttpRequest) -> Union[TokenAuthEntry, None]:
+    """
+    Resolves the token of the request once, the entry is kept on the request as `token_auth`
+    """
+    if not hasattr(request, "token_auth"):
+        token_key = get_token_key(request)
+        setattr(request, "token_auth", None if token_key is None else token_auth_cache.resolve(token_key))
+    return request.token_auth
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication reading the token resolved by AccountAuthenticationMiddleware,
+    or the TokenAuthCache when the middleware did not run
+    """
+
+    def authenticate(self, request: Request) -> Union[Tuple[User, Token], None]:
+        django_request: HttpRequest = request._request
+        if getattr(django_request, "token_auth", None) is None:
+            return super().authenticate(request)
+        entry: TokenAuthEntry = django_request.token_auth
+        # The user is read along with the account set by AccountAuthenticationMiddleware
+        return self.check_user(entry, get_token_key(django_request), getattr(django_request, "account", None))
+
+    def authenticate_credentials(self, key: str) -> Tuple[User, Token]:
+        entry = token_auth_cache.resolve(key)
+        if entry is None:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        return self.check_user(entry, key)
+
+    def check_user(self, entry: TokenAuthEntry, token_key: str, account: Account = None) -> Tuple[User, Token]:
+        if not entry.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        return (entry.get_user(account), SimpleLazyObject(lambda: Token.objects.get(key=token_key)))
@@ -0,0 +1,21 @@
+# Generated by Django 4.0 on 2026-10-18 13:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_socialmediahandle_is_disabled'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='socialmediahandle',
+            index=models.Index(condition=models.Q(('is_disabled', False)), fields=['handle_uid'], name='active_handle_uid_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='socialmediahandle',
+            index=models.Index(condition=models.Q(('is_disabled', False)), fields=['platform', 'id'], name='active_handle_platform_idx'),
+        ),
+    ]
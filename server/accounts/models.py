@@ -304,6 +304,14 @@ class SocialMediaHandle(models.Model):
     is_disabled = models.BooleanField(default=False)
     rates = models.JSONField(default=dict)  # {"ad_name": {...data}}
 
+    class Meta:
+        indexes = [
+            # Handle insights look up enabled handles by uid
+            models.Index(fields=["handle_uid"], condition=Q(is_disabled=False), name="active_handle_uid_idx"),
+            # The analytics task pages through the enabled handles of a platform by id
+            models.Index(fields=["platform", "id"], condition=Q(is_disabled=False), name="active_handle_platform_idx"),
+        ]
+
 
 
     @staticmethod
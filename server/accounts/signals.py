@@ -0,0 +1,30 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from accounts.authentication import token_auth_cache
+from accounts.models import Account
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_token_auth(sender, instance: User, **kwargs) -> None:
+    """
+    Password changes, deactivation and deletion of the user drop the cached token entries
+    """
+    token_auth_cache.invalidate_user(instance.pk)
+
+
+@receiver(post_save, sender=Account)
+@receiver(post_delete, sender=Account)
+def invalidate_account_token_auth(sender, instance: Account, **kwargs) -> None:
+    """
+    Cached entries hold the accounts of the user, any saved change (e.g disable_account) drops them
+    """
+    token_auth_cache.invalidate_user(instance.user_id)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_token_auth(sender, instance: Token, **kwargs) -> None:
+    token_auth_cache.invalidate([instance.key])
@@ -0,0 +1,91 @@
+from unittest.mock import patch
+from django.core.cache import caches
+from django.db import connection
+from django.test.client import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from accounts.authentication import INVALID_TOKEN, token_auth_cache
+from accounts.models import Account
+from rest_framework.authtoken.models import Token
+
+
+class TestTokenAuthCache(APITestCase):
+
+    def setUp(self) -> None:
+        caches[token_auth_cache.alias].clear()
+        self.account, self.token_obj = Account.get_test_account()
+        self.content_type = "application/json"
+        self.autheticated_client = Client(HTTP_AUTHORIZATION=f"Token {self.token_obj.key}", HTTP_CONTENT_TYPE=self.content_type)
+
+    def get_auth_queries(self, queries) -> list:
+        return [query["sql"] for query in queries
+                if any(table in query["sql"] for table in ('"authtoken_token"', '"auth_user"', '"accounts_account"'))]
+
+    def test_token_is_resolved_once(self) -> None:
+        with CaptureQueriesContext(connection) as first:
+            self.assertEqual(self.autheticated_client.get(reverse('retrieve-edit-account')).status_code, 200)
+        # The token with its user, then the accounts with their user, which the request uses as they are
+        self.assertEqual(len(self.get_auth_queries(first.captured_queries)), 2)
+        with CaptureQueriesContext(connection) as second:
+            res = self.autheticated_client.get(reverse('retrieve-edit-account'))
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json()["data"]["username"], self.account.username)
+        # Only the account and its user are read by id, the token is not looked up again
+        auth_queries = self.get_auth_queries(second.captured_queries)
+        self.assertEqual(len(auth_queries), 1)
+        self.assertNotIn('"authtoken_token"', auth_queries[0])
+
+    def test_entries_hold_no_secrets(self) -> None:
+        token_auth_cache.resolve(self.token_obj.key)
+        key = token_auth_cache.get_key(self.token_obj.key)
+        self.assertNotIn(self.token_obj.key, key)
+        entry = token_auth_cache.cache.get(key)
+        self.assertEqual(entry, (self.account.user_id, True, [(self.account.id, self.account.username)], None))
+        self.assertNotIn(self.account.user.password, str(entry))
+
+    def test_unknown_token_is_cached_as_invalid(self) -> None:
+        client = Client(HTTP_AUTHORIZATION="Token not-a-token", HTTP_CONTENT_TYPE=self.content_type)
+        self.assertEqual(client.get(reverse('retrieve-edit-account')).status_code, 401)
+        self.assertEqual(token_auth_cache.cache.get(token_auth_cache.get_key("not-a-token")), INVALID_TOKEN)
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(client.get(reverse('retrieve-edit-account')).status_code, 401)
+        self.assertEqual(self.get_auth_queries(context.captured_queries), [])
+
+    def test_account_changes_invalidate(self) -> None:
+        self.autheticated_client.get(reverse('retrieve-edit-account'))
+        self.account.disable_account()
+        self.assertIsNone(token_auth_cache.cache.get(token_auth_cache.get_key(self.token_obj.key)))
+        self.assertTrue(token_auth_cache.resolve(self.token_obj.key).get_account().is_disabled_account)
+
+    def test_password_change_and_logout_invalidate(self) -> None:
+        key = token_auth_cache.get_key(self.token_obj.key)
+        token_auth_cache.resolve(self.token_obj.key)
+        user = self.account.user
+        user.set_password("another-password")
+        user.save()
+        self.assertIsNone(token_auth_cache.cache.get(key))
+
+        self.assertEqual(self.autheticated_client.get(reverse('logout')).status_code, 202)
+        self.assertIsNone(token_auth_cache.cache.get(key))
+        self.assertFalse(Token.objects.filter(key=self.token_obj.key).exists())
+        self.assertEqual(self.autheticated_client.get(reverse('retrieve-edit-account')).status_code, 401)
+
+    def test_per_process_cache_keeps_entries_briefly(self) -> None:
+        with patch.object(token_auth_cache.cache, "set", wraps=token_auth_cache.cache.set) as cache_set, \
+                self.settings(LOCAL_CACHE_MAX_TTL=5):
+            token_auth_cache.resolve(self.token_obj.key)
+        self.assertGreater(token_auth_cache.timeout, 5)
+        self.assertEqual(cache_set.call_args.args[2], 5)
+
+    def test_inactive_user_is_rejected(self) -> None:
+        user = self.account.user
+        user.is_active = False
+        user.save()
+        self.assertEqual(self.autheticated_client.get(reverse('retrieve-edit-account')).status_code, 401)
+
+    def test_access_user(self) -> None:
+        entry = token_auth_cache.resolve(self.token_obj.key)
+        self.assertEqual(entry.get_account(self.account.username).id, self.account.id)
+        self.assertIsNone(entry.get_account("someone-else"))
@@ -8,7 +8,7 @@ from rest_framework.response import Response
 from rest_framework.authtoken.models import Token
 from django.contrib.auth.models import User
 from django.core.exceptions import BadRequest, ValidationError
-from rest_framework.authentication import TokenAuthentication
+from accounts.authentication import CachedTokenAuthentication
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework import status
@@ -208,7 +208,7 @@ class AccountLoginAPIView(APIView):
                 if not user.check_password(data["password"]):
                     response_body["error"] = "Password is incorrect."
                 else:
-                    token: Token = Token.objects.get(user=user)
+                    token, _ = Token.objects.get_or_create(user=user)
                     response_body["token"] = token.key
                     response_body["entity_type"] = account.entity_type
                     response_body["username"] = account.username
@@ -237,13 +237,15 @@ class AccountLoginAPIView(APIView):
 
 
 class AccountLogoutAPIVIew(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get(self, request: Request) -> Response:
         _status = status.HTTP_403_FORBIDDEN
         response = Response({"logged_out": True}, status=_status)
         if request.account is not None:
+            # Revokes the token, the cached entries are dropped by the post_delete signal
+            request.auth.delete()
             _status = status.HTTP_202_ACCEPTED
             response = remove_httponly_cookie(
                 Response({"logged_out": True}, status=_status))
@@ -251,7 +253,7 @@ class AccountLogoutAPIVIew(APIView):
 
 
 class RetrieveAndEditAccountAPIView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     ACCOUNT_EDIT_WHITELIST_FIELDS = (
@@ -394,7 +396,7 @@ class ResetPasswordView(APIView, AuthenticationEngine):
 
 
 class ChangePasswordView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def post(self, request: Request) -> Response:
@@ -430,7 +432,7 @@ class ChangePasswordView(APIView):
 
 
 class RetrieveAndDeleteSocialHandlesAPIView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
     serializer = SocialMediaHandlePublicSerializer
 
@@ -480,7 +482,7 @@ class RetrieveAndDeleteSocialHandlesAPIView(APIView):
 
 
 class PlatformMetricVisibilityView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     @staticmethod
@@ -0,0 +1,123 @@
+from typing import Any, Dict, List, Tuple, Union
+from urllib.parse import urlparse
+from utils import is_in_debug_mode
+from utils.errors import RateLimitExceeded
+from utils.types import RequestMethod
+from .request_manager import BaseRequestManager
+from .resilience import RequestErrorType
+from .types import AbstractRequestStruct, AbstractResponseStruct
+import aiohttp
+import asyncio
+
+
+
+class AsyncRequestManager(BaseRequestManager):
+    """
+    asyncio counterpart of BaseRequestManager, backed by an aiohttp.ClientSession\n
+    Shares base urls, headers and pool settings with the manager it is built from,\n
+    so the same request structs can be awaited through either of them.\n
+
+    The session is bound to the running event loop, it is created lazily on the first request\n
+    and must be released with `await manager.close()` before the loop is closed.\n
+    """
+
+    @classmethod
+    def from_manager(cls, manager: BaseRequestManager) -> 'AsyncRequestManager':
+        async_manager = cls(dict(manager.base_url_record), pool_connections=manager.pool_connections,
+                            pool_maxsize=manager.pool_maxsize, pool_block=manager.pool_block,
+                            timeout=manager.timeout, keep_alive=manager.keep_alive,
+                            rate_limiter=manager.rate_limiter, retry_policy=manager.retry_policy,
+                            circuit_breakers=manager.circuit_breakers, response_cache=manager.response_cache)
+        async_manager.headers = manager.headers
+        return async_manager
+
+    def get_client_timeout(self) -> aiohttp.ClientTimeout:
+        connect, read = self.timeout if isinstance(self.timeout, tuple) else (self.timeout, self.timeout)
+        return aiohttp.ClientTimeout(connect=connect, sock_read=read)
+
+    def create_session(self) -> aiohttp.ClientSession:
+        """
+        Returns a new session whose connector mirrors the pooled HTTPAdapter of the sync manager\n
+        pool_block has no aiohttp equivalent, the connector always waits for a free connection
+        """
+        connector = aiohttp.TCPConnector(limit=self.pool_connections * self.pool_maxsize,
+                                         limit_per_host=self.pool_maxsize, force_close=not self.keep_alive)
+        return aiohttp.ClientSession(connector=connector, timeout=self.get_client_timeout())
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = self.create_session()
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    @staticmethod
+    def encode_params(params: Dict[str, Any]) -> List[Tuple[str, str]]:
+        """
+        aiohttp only accepts str/int/float query values, values are encoded the way requests does
+        """
+        encoded = []
+        for key, value in params.items():
+            if value is None:
+                continue
+            values = value if isinstance(value, (list, tuple)) else [value]
+            encoded += [(key, item if isinstance(item, str) else str(item)) for item in values]
+        return encoded
+
+    async def make_request(self, request: AbstractRequestStruct, **extra_params) -> AbstractResponseStruct:
+        url: str = None
+        _headers = self.get_request_headers(request)
+        try:
+            url = self.get_url(request)
+            params, data = request.get_params()
+            method = "GET"
+            if request.method == RequestMethod.Post:
+                method = "POST"
+            params |= extra_params
+            cache_key, cached, _headers = self.prepare_cache(request, url, params, _headers)
+            breaker = self.circuit_breakers.get(url)
+            attempt = 0
+            while True:
+                if not breaker.allow():
+                    return self.get_error_response(request, url, None, RequestErrorType.CircuitOpen, f"Circuit of {urlparse(url).netloc} is open")
+                try:
+                    if self.rate_limiter is not None:
+                        await self.rate_limiter.acquire_async(request)
+                    async with self.session.request(method, url, params=self.encode_params(params),
+                                                    data=data or None, headers=_headers) as res:
+                        self.record_response(request, breaker, res.status, res.headers)
+                        if self.retry_policy.should_retry(request, attempt, res.status):
+                            retry_headers = res.headers
+                        elif res.status == 304 and cached is not None:
+                            return cached.response
+                        else:
+                            try:
+                                data = await res.json(content_type=None)
+                            except ValueError:
+                                return self.get_error_response(request, str(res.url), res.status, RequestErrorType.InvalidResponse, "Response body is not JSON")
+                            response = request.response_struct.from_data(str(res.url), res.status, data)
+                            if cache_key is not None:
+                                self.response_cache.store(cache_key, res.headers, data, response)
+                            return response
+                except RateLimitExceeded as exc:
+                    breaker.release()
+                    return self.get_error_response(request, url, 429, RequestErrorType.RateLimited, str(exc))
+                except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+                    breaker.record_failure()
+                    if not self.retry_policy.should_retry(request, attempt):
+                        return self.get_error_response(request, url, None, RequestErrorType.Network, repr(exc))
+                    retry_headers = None
+                except BaseException:
+                    # Cancelled or unexpected, a half open trial must not be left without outcome
+                    breaker.release()
+                    raise
+                await self.retry_policy.sleep_async(attempt, retry_headers)
+                attempt += 1
+        except Exception as exc:
+            if is_in_debug_mode():
+                raise exc
+            return self.get_error_response(request, url, None, RequestErrorType.Unexpected, repr(exc))
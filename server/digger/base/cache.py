@@ -0,0 +1,183 @@
+from collections import OrderedDict
+from hashlib import sha256
+from threading import Lock
+from typing import Any, Dict, Mapping, NamedTuple, Tuple, Union
+from .types import AbstractRequestStruct, AbstractResponseStruct
+import json
+import pickle
+
+
+# Entries of the shared backends expire after a week, ETags of stale entries would rarely match anyway
+DEFAULT_TIMEOUT = 7 * 24 * 60 * 60
+
+
+class CachedResponse(NamedTuple):
+    etag: str
+    response: AbstractResponseStruct
+
+
+class CacheBackend:
+    """
+    Storage of the ResponseCache, values are CachedResponse
+    """
+
+    def get(self, key: str) -> Union[CachedResponse, None]: ...
+
+    def set(self, key: str, value: CachedResponse) -> None: ...
+
+    def delete(self, key: str) -> None: ...
+
+
+class LRUCacheBackend(CacheBackend):
+    """
+    In-process cache keeping the `max_entries` most recently used responses\n
+    Responses are kept as they are, a 304 hands back the very same parsed objects
+    """
+
+    def __init__(self, max_entries: int = 1024) -> None:
+        self.max_entries = max_entries
+        self.entries: 'OrderedDict[str, CachedResponse]' = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key: str) -> Union[CachedResponse, None]:
+        with self.lock:
+            if (value := self.entries.get(key)) is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: CachedResponse) -> None:
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self.lock:
+            self.entries.pop(key, None)
+
+
+class DjangoCacheBackend(CacheBackend):
+    """
+    Stores responses in one of the CACHES of the django settings
+
+    Keyword Arguments:\n
+    alias -- Alias of the django cache [default="default"]\n
+    timeout -- Seconds an entry is kept [default=DEFAULT_TIMEOUT]\n
+    """
+
+    def __init__(self, alias: str = "default", timeout: int = DEFAULT_TIMEOUT, prefix: str = "digger:etag:") -> None:
+        self.alias = alias
+        self.timeout = timeout
+        self.prefix = prefix
+
+    @property
+    def cache(self):
+        from django.core.cache import caches
+        return caches[self.alias]
+
+    def get(self, key: str) -> Union[CachedResponse, None]:
+        return self.cache.get(self.prefix + key)
+
+    def set(self, key: str, value: CachedResponse) -> None:
+        self.cache.set(self.prefix + key, value, self.timeout)
+
+    def delete(self, key: str) -> None:
+        self.cache.delete(self.prefix + key)
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Stores pickled responses in redis, shared by every worker\n
+    Needs the optional `redis` package
+
+    Keyword Arguments:\n
+    url -- Redis connection url, e.g redis://localhost:6379/0\n
+    timeout -- Seconds an entry is kept [default=DEFAULT_TIMEOUT]\n
+    """
+
+    def __init__(self, url: str, timeout: int = DEFAULT_TIMEOUT, prefix: str = "digger:etag:") -> None:
+        try:
+            import redis
+        except ImportError as exc:
+            raise ImportError("RedisCacheBackend requires the redis package, install it with `pip install redis`") from exc
+        self.client = redis.Redis.from_url(url)
+        self.timeout = timeout
+        self.prefix = prefix
+
+    def get(self, key: str) -> Union[CachedResponse, None]:
+        if (value := self.client.get(self.prefix + key)) is None:
+            return None
+        return pickle.loads(value)
+
+    def set(self, key: str, value: CachedResponse) -> None:
+        self.client.set(self.prefix + key, pickle.dumps(value), ex=self.timeout)
+
+    def delete(self, key: str) -> None:
+        self.client.delete(self.prefix + key)
+
+
+def get_default_backend() -> CacheBackend:
+    """
+    Backend named by DIGGER_RESPONSE_CACHE in the settings: "lru" (default), "django" or a redis:// url\n
+    Entries of the shared backends expire after DIGGER_RESPONSE_CACHE_TTL seconds
+    """
+    from django.conf import settings
+    backend = getattr(settings, "DIGGER_RESPONSE_CACHE", "lru")
+    timeout = getattr(settings, "DIGGER_RESPONSE_CACHE_TTL", DEFAULT_TIMEOUT)
+    if backend == "django":
+        return DjangoCacheBackend(timeout=timeout)
+    if backend.startswith("redis://") or backend.startswith("rediss://"):
+        return RedisCacheBackend(backend, timeout=timeout)
+    return LRUCacheBackend()
+
+
+class ResponseCache:
+    """
+    Conditional request cache of the request structs with `cacheable = True`\n
+    Stores the ETag and the parsed response of every GET, keyed by request struct, url, params and the owner of the resource,
+    the `cache_identity` of the struct, so that entries survive token rotation. Structs without one are keyed by access token\n
+    The next identical request is sent with If-None-Match, a 304 returns the stored response struct\n
+
+    Keyword Arguments:\n
+    backend -- Storage of the entries [default=get_default_backend()]\n
+    """
+
+    def __init__(self, backend: CacheBackend = None) -> None:
+        self._backend = backend
+
+    @property
+    def backend(self) -> CacheBackend:
+        # Resolved lazily, managers are instantiated at import time, before the settings may be read
+        if self._backend is None:
+            self._backend = get_default_backend()
+        return self._backend
+
+    @staticmethod
+    def get_key(request: AbstractRequestStruct, url: str, params: Dict[str, Any]) -> str:
+        if (identity := getattr(request, "cache_identity", None)) is not None:
+            identity = f"identity:{identity}"
+        else:
+            access_token = getattr(request, "access_token", None) or ""
+            identity = f"token:{sha256(access_token.encode()).hexdigest()}"
+        encoded_params = json.dumps(params, sort_keys=True, default=str)
+        return sha256(f"{type(request).__module__}.{type(request).__name__}|{url}|{encoded_params}|{identity}".encode()).hexdigest()
+
+    def prepare(self, request: AbstractRequestStruct, url: str, params: Dict[str, Any],
+                headers: Union[Dict, None]) -> Tuple[Union[str, None], Union[CachedResponse, None], Union[Dict, None]]:
+        """
+        Returns (key, cached entry, headers with If-None-Match), key is None for requests that are not cached
+        """
+        if not getattr(request, "cacheable", False):
+            return None, None, headers
+        key = self.get_key(request, url, params)
+        if (cached := self.backend.get(key)) is not None:
+            headers = (headers or {}) | {"If-None-Match": cached.etag}
+        return key, cached, headers
+
+    def store(self, key: str, headers: Mapping[str, str], data: Any, response: AbstractResponseStruct) -> None:
+        etag = headers.get("ETag")
+        if etag is None and isinstance(data, dict):
+            etag = data.get("etag")
+        if etag is not None and not getattr(response, "error", None):
+            self.backend.set(key, CachedResponse(etag, response))
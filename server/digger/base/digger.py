@@ -2,10 +2,13 @@ from datetime import datetime
 from typing import Dict, List, Tuple, Union
 from accounts.models import Account, SocialMediaHandle
 from digger.base.types import AbstractDigger, AbstractResponseStruct, CreatorMetricModel, LongLiveTokenResponse
+from insights.models import HandleMetricFact, PlatformMetricRollup
 from linktree.models import LinkWall, LinkwallMediaHandles
-from utils import get_current_time, merge_metric
+from utils import merge_metric
 from utils.datastructures import MetricTable
+from utils.types import RollupGranularity
 from django.db.models import QuerySet
+from django.db.models.query_utils import Q
 
 
 class Digger(AbstractDigger):
@@ -14,6 +17,8 @@ class Digger(AbstractDigger):
     Wrapper object responsible for all the request-response-model operations involved in the api fetching\n
     Each Platform will have their own digger class.
     """
+    # Weekly metric model of the platform
+    metric_model = None
 
     def exchange_code_for_token(self, code: str, redirect_uri: str) -> AbstractResponseStruct:
         """
@@ -80,6 +85,19 @@ class Digger(AbstractDigger):
         Update the social media handle data
         """
         pass
+
+    async def update_handle_insights_async(self, social_media_handle: 'SocialMediaHandle') -> 'SocialMediaHandleMetrics':
+        """
+        asyncio variant of update_handle_insights\n
+        Requests are awaited through the digger's async_request_manager, database work runs through sync_to_async\n
+        """
+        pass
+
+    async def update_handle_data_async(self, social_media_handle: 'SocialMediaHandle') -> 'SocialMediaHandle':
+        """
+        asyncio variant of update_handle_data
+        """
+        pass
     
     def update_all_handles_insights(self, account: 'Account') -> List['SocialMediaHandleMetrics']:
         """
@@ -87,10 +105,11 @@ class Digger(AbstractDigger):
         """
         pass
 
-    def calculate_platform_metric(self, account: 'Account',start_date: datetime = None, end_date: datetime = get_current_time()) -> MetricTable:
+    def calculate_platform_metric(self, account: 'Account',start_date: datetime = None, end_date: datetime = None,
+                                  granularity: str = RollupGranularity.Day, metric_names: List[str] = None) -> MetricTable:
         """
         Calculates all the metrics from the social handle and updates the platfrom metric similarly
-        Return MetricTable
+        Return MetricTable, one row per RollupGranularity period, of metric_names only when provided
         """
         pass
     
@@ -101,17 +120,79 @@ class Digger(AbstractDigger):
         """
         pass
 
-    def get_metric_table_from_queryset(self, queryset: QuerySet) -> MetricTable:
+    def get_metric_table_from_queryset(self, queryset: QuerySet, metric_names: List[str] = None) -> MetricTable:
         """
         Returns MetricTable from the provided queryset
+        When metric_names are provided only their columns are loaded, get_columns and get_metric_rows skip the deferred ones
         """
-        if queryset.exists():
-            return MetricTable(queryset.first().get_columns(), *list(queryset))
+        if metric_names is not None:
+            queryset = queryset.only("id", "handle", "platform", "created_on", "expired_on", "meta_data", *metric_names)
+        metrics = list(queryset)
+        if len(metrics) > 0:
+            return MetricTable(metrics[0].get_columns(), "day", *metrics)
         return MetricTable()
 
-    def get_handle_insights(self, handle: 'SocialMediaHandle', start_date: datetime = None, end_date: datetime = get_current_time()) -> MetricTable:
+    def get_metric_columns(self, metric_names: List[str] = None) -> List[str]:
+        """
+        Metric names of the platform metric model, in their order, limited to metric_names when provided
+        """
+        columns = self.metric_model.get_fact_metric_names()
+        if metric_names is None:
+            return columns
+        return [column for column in columns if column in metric_names]
+
+    def get_additive_columns(self, columns: List[str]) -> List[str]:
+        """
+        Columns summed into prev_totals, the NON_ADDITIVE_METRICS of the platform metric model have no total over days
+        """
+        return [column for column in columns if column not in self.metric_model.NON_ADDITIVE_METRICS]
+
+    def get_metric_table_from_facts(self, columns: List[str], lookup: Q, start_date: datetime = None, end_date: datetime = None) -> MetricTable:
+        """
+        Returns MetricTable of the HandleMetricFact matching the lookup, summed per day in the database\n
+        The weekly JSON metric rows are not loaded into python, the totals of the days before start_date are added as prev_totals\n
+
+        Keyword Arguments:\n
+        columns -- Metric names of the platform metric model, only their facts are read\n
+        lookup -- Filters the facts e.g Q(handle__account=account) & Q(platform=Platform.Instagram)\n
+        start_date -- First day of the table [Optional]\n
+        end_date -- Last day of the table [Optional]\n
+        """
+        prev_totals = None
+        if start_date is not None:
+            prev_totals = HandleMetricFact.objects.get_totals(lookup & Q(metric__in=self.get_additive_columns(columns)), start_date.date())
+            lookup &= Q(day__gte=start_date.date())
+        lookup &= Q(metric__in=columns)
+        if end_date is not None:
+            lookup &= Q(day__lte=end_date.date())
+        return MetricTable.from_daily_totals(columns, HandleMetricFact.objects.get_daily_totals(lookup), prev_totals=prev_totals)
+
+    def get_metric_table_from_rollups(self, columns: List[str], lookup: Q, start_date: datetime = None, end_date: datetime = None,
+                                      granularity: str = RollupGranularity.Day) -> MetricTable:
+        """
+        Returns MetricTable of the PlatformMetricRollup matching the lookup, the rows are read as they are stored\n
+        The totals of the days before start_date are added as prev_totals\n
+
+        Keyword Arguments:\n
+        columns -- Metric names of the platform metric model, only their rollups are read\n
+        lookup -- Filters the rollups e.g Q(account=account) & Q(platform=Platform.Instagram)\n
+        start_date -- Day of the first period of the table [Optional]\n
+        end_date -- Last day of the table [Optional]\n
+        granularity -- RollupGranularity of the rows [default=day]\n
+        """
+        start_day = start_date.date() if start_date is not None else None
+        end_day = end_date.date() if end_date is not None else None
+        period_totals = PlatformMetricRollup.objects.get_period_totals(lookup & Q(metric__in=columns), granularity, start_day, end_day)
+        prev_totals = None
+        if start_day is not None:
+            prev_totals = PlatformMetricRollup.objects.get_totals(lookup & Q(metric__in=self.get_additive_columns(columns)),
+                                                                  PlatformMetricRollup.objects.get_period_start(start_day, granularity))
+        return MetricTable.from_daily_totals(columns, period_totals, granularity, prev_totals)
+
+    def get_handle_insights(self, handle: 'SocialMediaHandle', start_date: datetime = None, end_date: datetime = None,
+                            metric_names: List[str] = None) -> MetricTable:
         """
-        Returns MetricTable, containing all insights of the handle
+        Returns MetricTable, containing all insights of the handle, of metric_names only when provided
 
         """
         pass
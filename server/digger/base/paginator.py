@@ -0,0 +1,73 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Iterator, Union
+from .types import AbstractRequestManager, AbstractRequestStruct, AbstractResponseStruct
+
+
+
+class Paginator:
+    """
+    Lazily iterates the items of a paginated request, page by page\n
+    Pages are read through the `get_items` and `get_next_page_params` hooks of the response struct,\n
+    the params of the next page are sent as extra params of the same request struct.\n
+    Iteration stops on the last page, on the first response with an error, or after `max_items`\n
+
+    Keyword Arguments:\n
+    request -- Request struct of the first page\n
+    manager -- Request manager the pages are requested through\n
+    max_items -- Maximum number of items yielded [Optional]\n
+    prefetch -- Request the next page in the background while the items of the current one are consumed [default=False]\n
+    """
+
+    def __init__(self, request: AbstractRequestStruct, manager: AbstractRequestManager,
+                 max_items: int = None, prefetch: bool = False) -> None:
+        self.request = request
+        self.manager = manager
+        self.max_items = max_items
+        self.prefetch = prefetch
+        # Last page requested, holds the error when the iteration stopped on one
+        self.last_response: AbstractResponseStruct = None
+
+    @property
+    def error(self) -> Any:
+        return getattr(self.last_response, "error", None)
+
+    def fetch(self, page_params: Dict[str, Any]) -> AbstractResponseStruct:
+        return self.request(self.manager, **page_params)
+
+    def pages(self) -> Iterator[AbstractResponseStruct]:
+        """
+        Yields the response of every page, only the pages without error are yielded
+        """
+        executor: Union[ThreadPoolExecutor, None] = ThreadPoolExecutor(max_workers=1) if self.prefetch else None
+        try:
+            response = self.fetch({})
+            while True:
+                self.last_response = response
+                if response.error:
+                    return
+                next_page_params = response.get_next_page_params()
+                next_page: Union[Future, None] = None
+                if next_page_params is not None and executor is not None:
+                    next_page = executor.submit(self.fetch, next_page_params)
+                yield response
+                if next_page_params is None:
+                    return
+                response = next_page.result() if next_page is not None else self.fetch(next_page_params)
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    def __iter__(self) -> Iterator[Any]:
+        if self.max_items is not None and self.max_items <= 0:
+            return
+        count = 0
+        pages = self.pages()
+        try:
+            for response in pages:
+                for item in response.get_items():
+                    yield item
+                    count += 1
+                    if self.max_items is not None and count >= self.max_items:
+                        return
+        finally:
+            pages.close()
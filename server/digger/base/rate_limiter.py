@@ -0,0 +1,320 @@
+from collections import OrderedDict
+from datetime import datetime
+from hashlib import sha256
+from threading import Lock
+from typing import Dict, Mapping, Tuple, Union
+from utils.errors import RateLimitExceeded
+from .types import AbstractRequestStruct
+import asyncio
+import json
+import math
+import time
+import pytz
+
+
+
+class Clock:
+    """
+    Time source of the rate limiters, swapped with SimulatedClock in tests
+    """
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+    def time(self) -> float:
+        return time.time()
+
+    def sleep(self, seconds: float) -> None:
+        time.sleep(seconds)
+
+    async def sleep_async(self, seconds: float) -> None:
+        await asyncio.sleep(seconds)
+
+
+class SimulatedClock(Clock):
+    """
+    Deterministic clock, sleeping only moves the time forward\n
+
+    Keyword Arguments:\n
+    now -- Starting unix timestamp [default=0]\n
+    """
+
+    def __init__(self, now: float = 0) -> None:
+        self.now = now
+        self.slept = 0.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def time(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+    def sleep(self, seconds: float) -> None:
+        self.slept += seconds
+        self.advance(seconds)
+
+    async def sleep_async(self, seconds: float) -> None:
+        self.sleep(seconds)
+
+
+class TokenBucket:
+    """
+    Refills `rate` tokens per second up to `capacity`\n
+    `throttle` scales the refill rate and `blocked_until` stops the bucket, both are driven by platform usage headers
+    """
+
+    def __init__(self, rate: float, capacity: float, now: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = now
+        self.throttle = 1.0
+        self.blocked_until = 0.0
+
+    def get_rate(self, throttle: float = 1.0) -> float:
+        return self.rate * self.throttle * throttle
+
+    def refill(self, now: float, throttle: float = 1.0) -> None:
+        if 0 < self.blocked_until <= now:
+            # The throttle which came with the block does not outlive it
+            blocked_until, self.blocked_until = self.blocked_until, 0.0
+            self.refill(blocked_until, throttle)
+            self.throttle = 1.0
+        if now > self.updated_at:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.get_rate(throttle))
+            self.updated_at = now
+
+    def get_wait(self, cost: float, now: float, throttle: float = 1.0, blocked_until: float = 0.0) -> float:
+        """
+        Seconds to wait until `cost` tokens are available\n
+        `blocked_until` is a block on top of the bucket's own, e.g app wide, which restores `throttle` once it passes
+        """
+        self.refill(now, throttle)
+        block_wait = max(0.0, self.blocked_until - now, blocked_until - now)
+        if self.tokens >= cost:
+            return block_wait
+        # Tokens missing are refilled after the blocks, at the rate they restore
+        rate = self.rate * (1.0 if self.blocked_until > now else self.throttle) * (1.0 if blocked_until > now else throttle)
+        if rate <= 0:
+            return math.inf
+        return block_wait + (cost - self.tokens) / rate
+
+    def consume(self, cost: float) -> None:
+        """
+        Tokens may go negative, the debt is paid by the waits of the following reservations
+        """
+        self.tokens -= cost
+
+
+class RateLimiter:
+    """
+    Token bucket rate limiter of a platform, one bucket per (endpoint key, access token)\n
+    The endpoint key is `rate_limit_key` of the request struct, falling back to its url_key\n
+
+    Keyword Arguments:\n
+    limits -- Record of endpoint key to (requests per second, burst) [Optional]\n
+    default_limit -- (requests per second, burst) of endpoint keys missing in limits\n
+    max_wait -- Longest wait in seconds a reservation accepts, RateLimitExceeded is raised beyond it [default=60]\n
+    clock -- Time source [default=Clock()]\n
+    """
+    default_limit: Tuple[float, float] = (10, 20)
+    limits: Dict[str, Tuple[float, float]] = {}
+    max_wait: float = 60
+    max_buckets: int = 10000
+
+    def __init__(self, limits: Dict[str, Tuple[float, float]] = None, default_limit: Tuple[float, float] = None,
+                 max_wait: float = None, clock: Clock = None) -> None:
+        if limits is not None:
+            self.limits = limits
+        if default_limit is not None:
+            self.default_limit = default_limit
+        if max_wait is not None:
+            self.max_wait = max_wait
+        self.clock = clock or Clock()
+        self.buckets: 'OrderedDict[Tuple[str, str], TokenBucket]' = OrderedDict()
+        self.lock = Lock()
+
+    def get_endpoint_key(self, request: AbstractRequestStruct) -> str:
+        return getattr(request, "rate_limit_key", None) or request.url_key
+
+    @staticmethod
+    def get_token_key(request: AbstractRequestStruct) -> str:
+        access_token = getattr(request, "access_token", None)
+        if not access_token:
+            return ""
+        return sha256(access_token.encode()).hexdigest()[:16]
+
+    def get_bucket(self, endpoint_key: str, token_key: str) -> TokenBucket:
+        key = (endpoint_key, token_key)
+        if (bucket := self.buckets.get(key)) is not None:
+            self.buckets.move_to_end(key)
+            return bucket
+        rate, capacity = self.limits.get(endpoint_key, self.default_limit)
+        bucket = self.buckets[key] = TokenBucket(rate, capacity, self.clock.monotonic())
+        if len(self.buckets) > self.max_buckets:
+            self.buckets.popitem(last=False)
+        return bucket
+
+    def get_throttle(self) -> float:
+        """
+        Platform wide refill scale, applied on top of every bucket's own throttle
+        """
+        return 1.0
+
+    def get_wait(self, request: AbstractRequestStruct, now: float) -> float:
+        bucket = self.get_bucket(self.get_endpoint_key(request), self.get_token_key(request))
+        return bucket.get_wait(1, now, self.get_throttle())
+
+    def commit(self, request: AbstractRequestStruct) -> None:
+        self.get_bucket(self.get_endpoint_key(request), self.get_token_key(request)).consume(1)
+
+    def reserve(self, request: AbstractRequestStruct) -> float:
+        """
+        Reserves capacity for the request and returns the seconds to wait before sending it\n
+        Raises RateLimitExceeded without reserving anything when the wait is longer than max_wait
+        """
+        with self.lock:
+            wait = self.get_wait(request, self.clock.monotonic())
+            if wait > self.max_wait:
+                raise RateLimitExceeded(self.get_endpoint_key(request), wait)
+            self.commit(request)
+            return wait
+
+    def acquire(self, request: AbstractRequestStruct) -> None:
+        if (wait := self.reserve(request)) > 0:
+            self.clock.sleep(wait)
+
+    async def acquire_async(self, request: AbstractRequestStruct) -> None:
+        if (wait := self.reserve(request)) > 0:
+            await self.clock.sleep_async(wait)
+
+    def update_from_headers(self, request: AbstractRequestStruct, headers: Mapping[str, str]) -> None:
+        """
+        Adapts the limits from the usage headers of the platform's response
+        """
+        pass
+
+
+class GraphRateLimiter(RateLimiter):
+    """
+    Graph API limiter, adapts to the usage percentages Graph reports on every response\n
+    X-App-Usage throttles the whole app, X-Business-Use-Case-Usage throttles the buckets of the access token\n
+    Refill rate decreases linearly once usage crosses `throttle_threshold` percent and stops at 100 percent,
+    a stopped refill always comes with a block and is restored to full rate once the block passes\n
+    """
+    # Graph allows 200 calls per user per hour
+    default_limit = (200 / 3600, 50)
+    throttle_threshold: float = 75
+    # Usage headers without a reset time block the app, or the token, this long
+    app_block_seconds: float = 600
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.app_throttle = 1.0
+        self.app_blocked_until = 0.0
+
+    def get_throttle(self) -> float:
+        return self.app_throttle
+
+    def expire_app_block(self, now: float) -> None:
+        """
+        Restores the app throttle once the app wide block passed, buckets accrue nothing for the blocked time
+        """
+        if 0 < self.app_blocked_until <= now:
+            for bucket in self.buckets.values():
+                bucket.refill(self.app_blocked_until, self.app_throttle)
+            self.app_throttle = 1.0
+            self.app_blocked_until = 0.0
+
+    def get_wait(self, request: AbstractRequestStruct, now: float) -> float:
+        self.expire_app_block(now)
+        bucket = self.get_bucket(self.get_endpoint_key(request), self.get_token_key(request))
+        return bucket.get_wait(1, now, self.get_throttle(), self.app_blocked_until)
+
+    def get_throttle_from_usage(self, usage: Dict[str, Union[int, float]]) -> float:
+        percent = max([value for key, value in usage.items()
+                       if key in ("call_count", "total_cputime", "total_time") and isinstance(value, (int, float))] or [0])
+        if percent <= self.throttle_threshold:
+            return 1.0
+        return max(0.0, (100 - percent) / (100 - self.throttle_threshold))
+
+    @staticmethod
+    def parse_header(headers: Mapping[str, str], name: str) -> Union[Dict, None]:
+        if (value := headers.get(name)) is None:
+            return None
+        try:
+            return json.loads(value)
+        except ValueError:
+            return None
+
+    def update_from_headers(self, request: AbstractRequestStruct, headers: Mapping[str, str]) -> None:
+        now = self.clock.monotonic()
+        with self.lock:
+            self.expire_app_block(now)
+            if (app_usage := self.parse_header(headers, "X-App-Usage")) is not None:
+                self.app_throttle = self.get_throttle_from_usage(app_usage)
+                if self.app_throttle == 0:
+                    self.app_blocked_until = now + self.app_block_seconds
+            if (business_usage := self.parse_header(headers, "X-Business-Use-Case-Usage")) is not None:
+                usages = [usage for business in business_usage.values() for usage in business]
+                if len(usages) == 0:
+                    return
+                token_key = self.get_token_key(request)
+                throttle = min(self.get_throttle_from_usage(usage) for usage in usages)
+                regain_in = max(usage.get("estimated_time_to_regain_access") or 0 for usage in usages) * 60
+                if throttle == 0 and regain_in == 0:
+                    regain_in = self.app_block_seconds
+                for (endpoint_key, bucket_token_key), bucket in self.buckets.items():
+                    if bucket_token_key == token_key:
+                        bucket.refill(now, self.app_throttle)
+                        bucket.throttle = throttle
+                        if regain_in > 0:
+                            bucket.blocked_until = now + regain_in
+
+
+class YoutubeRateLimiter(RateLimiter):
+    """
+    YouTube limiter, token buckets per (endpoint key, access token) plus the project's daily quota units\n
+    Every request struct spends its `quota_cost` from the quota of its url_key, quotas reset at midnight Pacific Time\n
+
+    Keyword Arguments:\n
+    daily_quota -- Record of url_key to the quota units available per day [Optional]\n
+    """
+    default_limit = (5, 10)
+    daily_quota: Dict[str, int] = {"default": 10000, "analytics": 10000}
+    quota_timezone = pytz.timezone("America/Los_Angeles")
+
+    def __init__(self, *args, daily_quota: Dict[str, int] = None, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        if daily_quota is not None:
+            self.daily_quota = daily_quota
+        self.quota_day = None
+        self.quota_used: Dict[str, int] = {}
+
+    def get_quota_day(self) -> datetime:
+        return datetime.fromtimestamp(self.clock.time(), tz=self.quota_timezone).date()
+
+    def get_seconds_to_quota_reset(self) -> float:
+        now = datetime.fromtimestamp(self.clock.time(), tz=self.quota_timezone)
+        midnight = self.quota_timezone.localize(datetime.combine(now.date(), datetime.min.time()))
+        return 24 * 60 * 60 - (now - midnight).total_seconds()
+
+    def get_quota_remaining(self, url_key: str) -> Union[int, float]:
+        if (quota_day := self.get_quota_day()) != self.quota_day:
+            self.quota_day = quota_day
+            self.quota_used = {}
+        if url_key not in self.daily_quota:
+            return math.inf
+        return self.daily_quota[url_key] - self.quota_used.get(url_key, 0)
+
+    def get_wait(self, request: AbstractRequestStruct, now: float) -> float:
+        if getattr(request, "quota_cost", 1) > self.get_quota_remaining(request.url_key):
+            return self.get_seconds_to_quota_reset()
+        return super().get_wait(request, now)
+
+    def commit(self, request: AbstractRequestStruct) -> None:
+        super().commit(request)
+        self.quota_used[request.url_key] = self.quota_used.get(request.url_key, 0) + getattr(request, "quota_cost", 1)
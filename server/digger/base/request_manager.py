@@ -1,6 +1,12 @@
-from typing import Dict, Union
+from typing import Dict, Tuple, Union
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
 from utils import is_in_debug_mode
+from utils.errors import RateLimitExceeded
 from utils.types import RequestMethod
+from .cache import CachedResponse, ResponseCache
+from .rate_limiter import RateLimiter
+from .resilience import CircuitBreaker, CircuitBreakerRegistry, RequestErrorType, RetryPolicy, make_request_error
 from .types import AbstractRequestManager, AbstractRequestStruct, AbstractResponseStruct
 from log_engine.log import logger
 import requests
@@ -8,45 +14,178 @@ import requests
 
 
 class BaseRequestManager(AbstractRequestManager):
+    """
+    Holds the base urls of a platform and a pooled, keep-alive requests.Session\n
+    Every request made through the manager reuses the open connections of the session,\n
+    so repeated calls to the same host skip the TCP+TLS handshake.\n
 
-    def __init__(self, base_url: Union[str, Dict[str, str]]) -> None:
+    Keyword Arguments:\n
+    base_url -- Base url, or record of url_key to base url\n
+    pool_connections -- Number of per-host connection pools cached by the session [default=10]\n
+    pool_maxsize -- Maximum number of connections kept alive per host [default=20]\n
+    pool_block -- Wait for a free connection instead of opening more than pool_maxsize per host [default=False]\n
+    timeout -- Seconds as (connect, read) or a single value for both [default=(3.05, 30)]\n
+    keep_alive -- Keep connections open between requests [default=True]\n
+    rate_limiter -- Limiter every request waits on before being sent, shared by all managers of a platform [Optional]\n
+    retry_policy -- Backoff of retried GET requests [default=RetryPolicy()]\n
+    circuit_breakers -- Per host circuit breakers, shared by all managers by default\n
+    response_cache -- ETag cache of the GET requests whose struct is cacheable [Optional]\n
+    """
+    pool_connections: int = 10
+    pool_maxsize: int = 20
+    pool_block: bool = False
+    timeout: Union[float, Tuple[float, float]] = (3.05, 30)
+    keep_alive: bool = True
+    rate_limiter: RateLimiter = None
+    retry_policy: RetryPolicy = RetryPolicy()
+    circuit_breakers: CircuitBreakerRegistry = CircuitBreakerRegistry()
+    response_cache: ResponseCache = None
+
+    def __init__(self, base_url: Union[str, Dict[str, str]], pool_connections: int = None,
+                 pool_maxsize: int = None, pool_block: bool = None,
+                 timeout: Union[float, Tuple[float, float]] = None, keep_alive: bool = None,
+                 rate_limiter: RateLimiter = None, retry_policy: RetryPolicy = None,
+                 circuit_breakers: CircuitBreakerRegistry = None, response_cache: ResponseCache = None) -> None:
         self.base_url_record = {}
         self.headers = None
         if isinstance(base_url, str):
             self.base_url_record["default"] = base_url
         elif isinstance(base_url, dict):
             self.base_url_record = base_url
+        if pool_connections is not None:
+            self.pool_connections = pool_connections
+        if pool_maxsize is not None:
+            self.pool_maxsize = pool_maxsize
+        if pool_block is not None:
+            self.pool_block = pool_block
+        if timeout is not None:
+            self.timeout = timeout
+        if keep_alive is not None:
+            self.keep_alive = keep_alive
+        if rate_limiter is not None:
+            self.rate_limiter = rate_limiter
+        if retry_policy is not None:
+            self.retry_policy = retry_policy
+        if circuit_breakers is not None:
+            self.circuit_breakers = circuit_breakers
+        if response_cache is not None:
+            self.response_cache = response_cache
+        self._session: requests.Session = None
+
+    def create_session(self) -> requests.Session:
+        """
+        Returns a new session with a pooled adapter mounted for both http and https
+        """
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_connections,
+                              pool_maxsize=self.pool_maxsize, pool_block=self.pool_block)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers["Connection"] = "keep-alive" if self.keep_alive else "close"
+        return session
+
+    @property
+    def session(self) -> requests.Session:
+        """
+        Session is created lazily, managers are instantiated at import time by the diggers
+        """
+        if self._session is None:
+            self._session = self.create_session()
+        return self._session
+
+    def close(self) -> None:
+        if self._session is not None:
+            self._session.close()
+            self._session = None
 
     def get_url(self, request: AbstractRequestStruct) -> str:
         return self.base_url_record[request.url_key] + request.endpoint
-    
-    def make_request(self, request: AbstractRequestStruct, **extra_params) -> AbstractResponseStruct:
-        res: requests.Response = None
-        url: str = None
+
+    def get_request_headers(self, request: AbstractRequestStruct) -> Union[Dict, None]:
         _headers: Dict = None
         if request.get_headers():
-            _headers = request.get_headers()
+            _headers = dict(request.get_headers())
         if self.headers:
-            _headers |= self.headers
+            _headers = (_headers or {}) | self.headers
+        return _headers
+
+    def get_error_response(self, request: AbstractRequestStruct, url: str, status_code: Union[int, None],
+                           error_type: str, message: str) -> AbstractResponseStruct:
+        logger.error(f"{type(request).__name__} to {url} failed with {error_type}: {message}")
+        return request.response_struct.from_error(url, status_code, make_request_error(error_type, message, status_code))
+
+    def prepare_cache(self, request: AbstractRequestStruct, url: str, params: Dict,
+                      headers: Union[Dict, None]) -> Tuple[Union[str, None], Union[CachedResponse, None], Union[Dict, None]]:
+        if self.response_cache is None or request.method != RequestMethod.Get:
+            return None, None, headers
+        return self.response_cache.prepare(request, url, params, headers)
+
+    def record_response(self, request: AbstractRequestStruct, breaker: CircuitBreaker, status_code: int, headers) -> None:
+        if status_code >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        if self.rate_limiter is not None:
+            self.rate_limiter.update_from_headers(request, headers)
+
+    def make_request(self, request: AbstractRequestStruct, acquired: bool = False, **extra_params) -> AbstractResponseStruct:
+        """
+        Sends the request through the rate limiter and the host's circuit breaker, retrying as per retry_policy\n
+        Never returns None, failures without a usable platform response come back as
+        response structs whose error is built by make_request_error\n
+        acquired -- The request already holds a rate limiter token for its first attempt, retries take their own [default=False]
+        """
+        res: requests.Response = None
+        url: str = None
+        _headers = self.get_request_headers(request)
         try:
             url = self.get_url(request)
             params, data = request.get_params()
-            caller = requests.get
+            caller = self.session.get
             if request.method == RequestMethod.Post:
-                caller = requests.post
+                caller = self.session.post
             params |= extra_params
-            res = caller(url=url, params=params, data=data, headers=_headers)
-            data = res.json()
-            return request.response_struct.from_data(res.url, res.status_code, data)            
+            cache_key, cached, _headers = self.prepare_cache(request, url, params, _headers)
+            breaker = self.circuit_breakers.get(url)
+            attempt = 0
+            while True:
+                if not breaker.allow():
+                    return self.get_error_response(request, url, None, RequestErrorType.CircuitOpen, f"Circuit of {urlparse(url).netloc} is open")
+                try:
+                    if self.rate_limiter is not None and not acquired:
+                        self.rate_limiter.acquire(request)
+                    acquired = False
+                    res = caller(url=url, params=params, data=data, headers=_headers, timeout=self.timeout)
+                except RateLimitExceeded as exc:
+                    breaker.release()
+                    return self.get_error_response(request, url, 429, RequestErrorType.RateLimited, str(exc))
+                except requests.RequestException as exc:
+                    breaker.record_failure()
+                    if self.retry_policy.should_retry(request, attempt):
+                        self.retry_policy.sleep(attempt)
+                        attempt += 1
+                        continue
+                    return self.get_error_response(request, url, None, RequestErrorType.Network, repr(exc))
+                except BaseException:
+                    breaker.release()
+                    raise
+                self.record_response(request, breaker, res.status_code, res.headers)
+                if self.retry_policy.should_retry(request, attempt, res.status_code):
+                    self.retry_policy.sleep(attempt, res.headers)
+                    attempt += 1
+                    continue
+                break
+            if res.status_code == 304 and cached is not None:
+                return cached.response
+            try:
+                data = res.json()
+            except ValueError:
+                return self.get_error_response(request, res.url, res.status_code, RequestErrorType.InvalidResponse, "Response body is not JSON")
+            response = request.response_struct.from_data(res.url, res.status_code, data)
+            if cache_key is not None:
+                self.response_cache.store(cache_key, res.headers, data, response)
+            return response
         except Exception as exc:
             if is_in_debug_mode():
                 raise exc
-            else:
-                logger.error(exc)
-
-
-
-
-
-
-
+            return self.get_error_response(request, url, None, RequestErrorType.Unexpected, repr(exc))
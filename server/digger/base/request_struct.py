@@ -1,4 +1,5 @@
 from typing import Any, Dict, List, Tuple, Union
+from digger.base.paginator import Paginator
 from digger.base.types import AbstractRequestManager, AbstractRequestStruct, AbstractResponseStruct
 from utils.types import RequestMethod
 
@@ -52,7 +53,20 @@ class RequestStruct(AbstractRequestStruct):
     def __call__(self, manager: AbstractRequestManager, **extra_params) -> AbstractResponseStruct:
         response =  manager.make_request(self, **extra_params)
         return self.process_after_request(manager, response)
-        
+
+    async def call_async(self, manager: AbstractRequestManager, **extra_params) -> AbstractResponseStruct:
+        """
+        Same as calling the struct, but awaits an AsyncRequestManager
+        """
+        response = await manager.make_request(self, **extra_params)
+        return self.process_after_request(manager, response)
+
+    def paginate(self, manager: AbstractRequestManager, max_items: int = None, prefetch: bool = False) -> Paginator:
+        """
+        Returns a lazy iterator over the items of every page of the request
+        """
+        return Paginator(self, manager, max_items=max_items, prefetch=prefetch)
+
     
     
     @classmethod
@@ -0,0 +1,140 @@
+from threading import Lock
+from typing import Dict, Mapping, Tuple, Union
+from urllib.parse import urlparse
+from utils.types import RequestMethod
+from .rate_limiter import Clock
+from .types import AbstractRequestStruct
+import random
+
+
+
+class RequestErrorType:
+    """
+    `type` of the error set on response structs when no usable response came back from the platform
+    """
+    Network = "network_error"
+    CircuitOpen = "circuit_open"
+    RateLimited = "rate_limited"
+    InvalidResponse = "invalid_response"
+    Unexpected = "unexpected_error"
+
+
+def make_request_error(error_type: str, message: str, code: int = None) -> Dict[str, Union[str, int, None]]:
+    """
+    Errors are shaped like Graph API errors, so every `response.error` can be logged and inspected the same way
+    """
+    return {"type": error_type, "message": message, "code": code}
+
+
+class RetryPolicy:
+    """
+    Retries idempotent (GET) requests with jittered exponential backoff\n
+    Network failures and `retry_statuses` are retried, a Retry-After header is honoured up to max_delay\n
+
+    Keyword Arguments:\n
+    max_attempts -- Total attempts including the first one [default=3]\n
+    base_delay -- Seconds of the first backoff, doubled on every retry [default=0.5]\n
+    max_delay -- Upper bound of a single backoff in seconds [default=8]\n
+    clock -- Time source used to sleep between attempts [default=Clock()]\n
+    """
+    retry_statuses: Tuple[int, ...] = (429, 500, 502, 503, 504)
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.5, max_delay: float = 8,
+                 clock: Clock = None, rng: random.Random = None) -> None:
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.clock = clock or Clock()
+        self.rng = rng or random.Random()
+
+    def should_retry(self, request: AbstractRequestStruct, attempt: int, status_code: int = None) -> bool:
+        """
+        attempt -- Zero based index of the attempt that just failed\n
+        status_code -- Status of the response, None when the request failed on the network\n
+        """
+        if request.method != RequestMethod.Get or attempt + 1 >= self.max_attempts:
+            return False
+        return status_code is None or status_code in self.retry_statuses
+
+    def get_delay(self, attempt: int, headers: Mapping[str, str] = None) -> float:
+        retry_after = (headers or {}).get("Retry-After")
+        if retry_after is not None and retry_after.isdigit():
+            return min(self.max_delay, float(retry_after))
+        # Full jitter, spreads the retries of concurrent workers hitting the same incident
+        return self.rng.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def sleep(self, attempt: int, headers: Mapping[str, str] = None) -> None:
+        self.clock.sleep(self.get_delay(attempt, headers))
+
+    async def sleep_async(self, attempt: int, headers: Mapping[str, str] = None) -> None:
+        await self.clock.sleep_async(self.get_delay(attempt, headers))
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and fails fast for `recovery_timeout` seconds\n
+    Then a single trial request is let through (half open), its outcome closes or re-opens the circuit,
+    a request allowed through must either record an outcome or release the circuit\n
+    """
+    Closed = "closed"
+    Open = "open"
+    HalfOpen = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 30, clock: Clock = None) -> None:
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.clock = clock or Clock()
+        self.state = self.Closed
+        self.failures = 0
+        self.opened_at = 0.0
+        self.lock = Lock()
+
+    def allow(self) -> bool:
+        with self.lock:
+            if self.state == self.Closed:
+                return True
+            if self.state == self.Open and self.clock.monotonic() - self.opened_at >= self.recovery_timeout:
+                self.state = self.HalfOpen
+                return True
+            return False
+
+    def release(self) -> None:
+        """
+        Gives back the half open trial of a request which ended without an outcome, e.g rate limited or cancelled\n
+        The circuit re-opens as it was, the next allow() lets a new trial through
+        """
+        with self.lock:
+            if self.state == self.HalfOpen:
+                self.state = self.Open
+
+    def record_success(self) -> None:
+        with self.lock:
+            self.state = self.Closed
+            self.failures = 0
+
+    def record_failure(self) -> None:
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HalfOpen or self.failures >= self.failure_threshold:
+                self.state = self.Open
+                self.opened_at = self.clock.monotonic()
+
+
+class CircuitBreakerRegistry:
+    """
+    One CircuitBreaker per host, shared by every manager holding the registry
+    """
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 30, clock: Clock = None) -> None:
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.clock = clock or Clock()
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.lock = Lock()
+
+    def get(self, url: str) -> CircuitBreaker:
+        host = urlparse(url).netloc
+        with self.lock:
+            if host not in self.breakers:
+                self.breakers[host] = CircuitBreaker(self.failure_threshold, self.recovery_timeout, self.clock)
+            return self.breakers[host]
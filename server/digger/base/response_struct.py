@@ -14,6 +14,18 @@ class ResponseStruct(AbstractResponseStruct):
     
     def has_error(self) -> bool:
         return self.error != None
+
+    def get_items(self) -> List[Any]:
+        """
+        Items of the page, iterated by the Paginator
+        """
+        return []
+
+    def get_next_page_params(self) -> Union[Dict[str, Any], None]:
+        """
+        Extra params requesting the next page, None on the last page
+        """
+        return None
     
     
 
@@ -26,5 +38,19 @@ class ResponseStruct(AbstractResponseStruct):
         kwargs = cls.process_data(args)
         return cls(url, status_code, **kwargs)
     
+    @classmethod
+    def from_error(cls, url: str, status_code: Union[int, None], error: Dict[str, Any]):
+        """
+        Builds the response for a request that got no usable response from the platform\n
+        Structs are built as if the platform returned the error, so their fields keep the empty defaults
+        """
+        try:
+            response = cls(url, status_code, error=error)
+        except Exception:
+            response = cls.__new__(cls)
+            ResponseStruct.__init__(response, url, status_code)
+        response.error = error
+        return response
+
     def to_kwargs(self) -> Dict[str, Any]:
         return vars(self)
\ No newline at end of file
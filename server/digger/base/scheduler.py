@@ -0,0 +1,35 @@
+from typing import Any, Awaitable, Callable, Iterable, List, NamedTuple, Union
+import asyncio
+
+
+
+class ScheduledResult(NamedTuple):
+    item: Any
+    result: Any = None
+    error: Union[BaseException, None] = None
+
+
+class BoundedScheduler:
+    """
+    Runs a coroutine for every item while keeping at most `concurrency` of them in flight\n
+    A failing item never cancels the others, its exception is returned in ScheduledResult.error\n
+
+    Keyword Arguments:\n
+    concurrency -- Maximum number of coroutines awaited at the same time [default=20]\n
+    """
+
+    def __init__(self, concurrency: int = 20) -> None:
+        assert concurrency > 0, "concurrency must be a positive integer"
+        self.concurrency = concurrency
+
+    async def run(self, items: Iterable[Any], worker: Callable[[Any], Awaitable[Any]]) -> List[ScheduledResult]:
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run_item(item: Any) -> ScheduledResult:
+            async with semaphore:
+                try:
+                    return ScheduledResult(item, result=await worker(item))
+                except Exception as exc:
+                    return ScheduledResult(item, error=exc)
+
+        return list(await asyncio.gather(*[run_item(item) for item in items]))
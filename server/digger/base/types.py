@@ -13,6 +13,9 @@ class AbstractResponseStruct:
     @classmethod
     def from_data(cls, url,kwargs) -> 'AbstractResponseStruct': ...
 
+    @classmethod
+    def from_error(cls, url, status_code, error) -> 'AbstractResponseStruct': ...
+
     def to_kwargs(self) -> Dict[str, Any]: ...
 
 class AbstractRequestStruct:
@@ -22,10 +25,19 @@ class AbstractRequestStruct:
     ignorable_fields: List[str] = []
     _ignored_fields: List[str] = ["response_struct", "url_key", "endpoint", 
                                     "ignorable_fields", "_gnorable_fields",
-                                    "status_code", "headers", "method", "params_query", "params_data"]
+                                    "status_code", "headers", "method", "params_query", "params_data",
+                                    "rate_limit_key", "quota_cost", "cacheable", "cache_identity"]
     headers: Dict = None
     method: str = None
     status_code = 200
+    # Bucket of the platform rate limiter, defaults to url_key
+    rate_limit_key: str = None
+    # Units of the platform's daily quota spent by the request
+    quota_cost: int = 1
+    # GET responses are cached by ETag when the manager has a response cache
+    cacheable: bool = False
+    # Owner of the cached resource e.g the channel id, cache entries fall back to the access token when unset
+    cache_identity: str = None
 
     def get_headers(self) -> Union[None,Dict[str, str]]:
         return self.headers
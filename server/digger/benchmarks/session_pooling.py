@@ -0,0 +1,95 @@
+"""
+Compares the pooled request managers against a connection-per-call baseline.
+Replays the stub server's canned Graph/YouTube responses, so no tokens or network are needed.
+
+Usage (from the server directory):
+    python -m digger.benchmarks.session_pooling [--requests 200] [--tls]
+"""
+
+from argparse import ArgumentParser
+from time import perf_counter
+from typing import Dict, List
+import os
+import statistics
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "accord.settings")
+django.setup()
+
+from digger.base.request_manager import BaseRequestManager  # noqa: E402
+from digger.instagram.request_struct import InstagramUserDataRequest, InstagramUserInsightsRequest  # noqa: E402
+from digger.youtube.request_struct import YoutubeTimeBasedChannelReportRequest  # noqa: E402
+from digger.benchmarks.stub_server import start_stub_server  # noqa: E402
+import requests  # noqa: E402
+
+
+IG_USER_ID = "17841400000000000"
+
+
+class UnpooledRequestManager(BaseRequestManager):
+    """
+    Pre-pooling behaviour, every call goes through requests.get/post and opens a new connection
+    """
+
+    @property
+    def session(self):
+        return requests
+
+
+def build_requests() -> List:
+    return [
+        InstagramUserDataRequest(IG_USER_ID, "token"),
+        InstagramUserInsightsRequest(IG_USER_ID, "token"),
+        YoutubeTimeBasedChannelReportRequest("token", start_date="2022-01-14", end_date="2022-01-15"),
+    ]
+
+
+def run(manager: BaseRequestManager, count: int) -> Dict[str, float]:
+    request_structs = build_requests()
+    latencies = []
+    for index in range(count):
+        request = request_structs[index % len(request_structs)]
+        started = perf_counter()
+        response = manager.make_request(request)
+        latencies.append((perf_counter() - started) * 1000)
+        assert response is not None and response.status_code == 200, f"Stub rejected {request.endpoint}"
+    latencies.sort()
+    return {
+        "total_s": sum(latencies) / 1000,
+        "mean_ms": statistics.mean(latencies),
+        "p50_ms": latencies[len(latencies) // 2],
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1],
+    }
+
+
+def main() -> None:
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--tls", action="store_true", help="Serve the stub over https to include the TLS handshake")
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(tls=args.tls)
+    if server.cert_path:
+        # Both requests.get and Session honour the bundle, keeping the comparison fair
+        os.environ["REQUESTS_CA_BUNDLE"] = server.cert_path
+    base_urls = {"default": f"{base_url}/v12.0", "analytics": f"{base_url}/v2"}
+    try:
+        pooled = BaseRequestManager(base_urls)
+        results = {
+            "unpooled": run(UnpooledRequestManager(base_urls), args.requests),
+            "pooled": run(pooled, args.requests),
+        }
+        pooled.close()
+    finally:
+        server.shutdown()
+
+    print(f"{args.requests} requests over {'https' if args.tls else 'http'}")
+    for name, result in results.items():
+        print(f"{name:>9}: total {result['total_s']:.3f}s  mean {result['mean_ms']:.2f}ms  "
+              f"p50 {result['p50_ms']:.2f}ms  p95 {result['p95_ms']:.2f}ms")
+    print(f"  speedup: {results['unpooled']['total_s'] / results['pooled']['total_s']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
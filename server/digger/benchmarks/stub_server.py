@@ -0,0 +1,203 @@
+"""
+Local stub of the Graph/YouTube hosts used by the digger benchmarks and tests.
+Replays canned JSON responses keyed by path, over HTTP/1.1 so keep-alive connections are honoured.
+Served either by http.server (requests based managers) or aiohttp (AsyncRequestManager).
+"""
+
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Event, Thread
+from typing import Dict, Tuple, Union
+from urllib.parse import urlparse
+from aiohttp import web
+import asyncio
+import json
+import os
+import ssl
+import tempfile
+
+
+CANNED_RESPONSES: Dict[str, Dict] = {
+    "/v12.0/17841400000000000": {
+        "id": "17841400000000000",
+        "followers_count": 1204,
+        "media_count": 87,
+        "name": "Byta Tigris",
+        "profile_picture_url": "https://scontent.cdninstagram.com/avatar.jpg",
+        "username": "bytatigris",
+        "biography": "Benchmark handle",
+        # Field expanded insights of InstagramUserProfileInsightsRequest, ignored by InstagramUserDataRequest
+        "day_insights": {"data": [
+            {"name": "impressions", "period": "day", "values": [{"value": 312, "end_time": "2022-01-15T08:00:00+0000"}]},
+            {"name": "reach", "period": "day", "values": [{"value": 201, "end_time": "2022-01-15T08:00:00+0000"}]},
+            {"name": "follower_count", "period": "day", "values": [{"value": 3, "end_time": "2022-01-15T08:00:00+0000"}]},
+            {"name": "profile_views", "period": "day", "values": [{"value": 17, "end_time": "2022-01-15T08:00:00+0000"}]}
+        ]},
+        "lifetime_insights": {"data": [
+            {"name": "audience_city", "period": "lifetime",
+             "values": [{"value": {"Mumbai, Maharashtra": 40, "Pune, Maharashtra": 12}, "end_time": "2022-01-15T08:00:00+0000"}]},
+            {"name": "audience_country", "period": "lifetime", "values": [{"value": {"IN": 52}, "end_time": "2022-01-15T08:00:00+0000"}]},
+            {"name": "audience_gender_age", "period": "lifetime",
+             "values": [{"value": {"F.18-24": 20, "M.25-34": 32}, "end_time": "2022-01-15T08:00:00+0000"}]}
+        ]}
+    },
+    "/v12.0/17841400000000000/insights": {
+        "data": [
+            {"name": "impressions", "period": "day", "values": [{"value": 312, "end_time": "2022-01-15T08:00:00+0000"}]},
+            {"name": "reach", "period": "day", "values": [{"value": 201, "end_time": "2022-01-15T08:00:00+0000"}]},
+            {"name": "follower_count", "period": "day", "values": [{"value": 3, "end_time": "2022-01-15T08:00:00+0000"}]},
+            {"name": "profile_views", "period": "day", "values": [{"value": 17, "end_time": "2022-01-15T08:00:00+0000"}]},
+            # Day and lifetime (demographic) insights share the endpoint, both are replayed for either request
+            {"name": "audience_city", "period": "lifetime",
+             "values": [{"value": {"Mumbai, Maharashtra": 40, "Pune, Maharashtra": 12}, "end_time": "2022-01-15T08:00:00+0000"}]},
+            {"name": "audience_country", "period": "lifetime", "values": [{"value": {"IN": 52}, "end_time": "2022-01-15T08:00:00+0000"}]},
+            {"name": "audience_gender_age", "period": "lifetime",
+             "values": [{"value": {"F.18-24": 20, "M.25-34": 32}, "end_time": "2022-01-15T08:00:00+0000"}]}
+        ]
+    },
+    "/v2/reports": {
+        "columnHeaders": [
+            {"name": "day", "columnType": "DIMENSION", "dataType": "STRING"},
+            {"name": "views", "columnType": "METRIC", "dataType": "INTEGER"},
+            {"name": "estimatedMinutesWatched", "columnType": "METRIC", "dataType": "INTEGER"}
+        ],
+        "rows": [["2022-01-14", 5, 2], ["2022-01-15", 6, 4]]
+    },
+}
+
+
+class CannedResponseHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out as separate writes, Nagle would stall every reused connection on the delayed ACK
+    disable_nagle_algorithm = True
+    responses: Dict[str, Dict] = CANNED_RESPONSES
+
+    def _reply(self) -> None:
+        path = urlparse(self.path).path
+        status_code = 200
+        payload = self.responses.get(path)
+        if payload is None:
+            status_code = 404
+            payload = {"error": {"message": f"Unknown path {path}", "code": 404}}
+        body = json.dumps(payload).encode()
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        self._reply()
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length", 0))
+        if length:
+            self.rfile.read(length)
+        self._reply()
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+def _self_signed_context() -> Tuple[ssl.SSLContext, str]:
+    from ipaddress import IPv4Address
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from cryptography.x509.oid import NameOID
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    now = datetime.utcnow()
+    certificate = (x509.CertificateBuilder().subject_name(name).issuer_name(name)
+                   .public_key(key.public_key()).serial_number(x509.random_serial_number())
+                   .not_valid_before(now - timedelta(days=1)).not_valid_after(now + timedelta(days=1))
+                   .add_extension(x509.SubjectAlternativeName([x509.IPAddress(IPv4Address("127.0.0.1"))]), critical=False)
+                   .sign(key, hashes.SHA256()))
+    directory = tempfile.mkdtemp()
+    cert_path, key_path = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    with open(cert_path, "wb") as cert_file:
+        cert_file.write(certificate.public_bytes(serialization.Encoding.PEM))
+    with open(key_path, "wb") as key_file:
+        key_file.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.TraditionalOpenSSL,
+                                         serialization.NoEncryption()))
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert_path, key_path)
+    return context, cert_path
+
+
+def start_stub_server(tls: bool = False, responses: Union[Dict[str, Dict], None] = None) -> Tuple[ThreadingHTTPServer, str]:
+    """
+    Starts the stub on a free local port in a daemon thread\n
+    Returns (server, base_url), call server.shutdown() when done\n
+    With tls=True the self-signed certificate path is kept on server.cert_path
+    """
+    handler = CannedResponseHandler
+    if responses is not None:
+        handler = type("StubHandler", (CannedResponseHandler,), {"responses": responses})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    scheme = "http"
+    server.cert_path = None
+    if tls:
+        context, server.cert_path = _self_signed_context()
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+        scheme = "https"
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"{scheme}://127.0.0.1:{server.server_address[1]}"
+
+
+def create_stub_app(responses: Union[Dict[str, Dict], None] = None) -> web.Application:
+    """
+    aiohttp application replaying the same canned responses as CannedResponseHandler
+    """
+    canned_responses = CANNED_RESPONSES if responses is None else responses
+
+    async def reply(request: web.Request) -> web.Response:
+        payload = canned_responses.get(request.path)
+        if payload is None:
+            return web.json_response({"error": {"message": f"Unknown path {request.path}", "code": 404}}, status=404)
+        return web.json_response(payload)
+
+    app = web.Application()
+    app.router.add_route("*", "/{tail:.*}", reply)
+    return app
+
+
+class AsyncStubServer(Thread):
+    """
+    Runs the aiohttp stub on its own event loop, so it can serve requests made from any other loop
+    """
+
+    def __init__(self, app: web.Application) -> None:
+        super().__init__(daemon=True)
+        self.app = app
+        self.loop = asyncio.new_event_loop()
+        self.started = Event()
+        self.port: int = None
+
+    def run(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        runner = web.AppRunner(self.app)
+        self.loop.run_until_complete(runner.setup())
+        self.loop.run_until_complete(web.TCPSite(runner, "127.0.0.1", 0).start())
+        self.port = runner.addresses[0][1]
+        self.started.set()
+        self.loop.run_forever()
+        self.loop.run_until_complete(runner.cleanup())
+        self.loop.close()
+
+    def shutdown(self) -> None:
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.join()
+
+
+def start_async_stub_server(responses: Union[Dict[str, Dict], None] = None) -> Tuple[AsyncStubServer, str]:
+    """
+    aiohttp counterpart of start_stub_server\n
+    Returns (server, base_url), call server.shutdown() when done
+    """
+    server = AsyncStubServer(create_stub_app(responses))
+    server.start()
+    server.started.wait()
+    return server, f"http://127.0.0.1:{server.port}"
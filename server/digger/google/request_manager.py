@@ -2,7 +2,7 @@ from digger.base.request_manager import BaseRequestManager
 
 
 class GoogleRequestManager(BaseRequestManager):
-    def __init__(self) -> None:
+    def __init__(self, **pool_kwargs) -> None:
         super().__init__({
             "default": "https://www.googleapis.com"
-        })
\ No newline at end of file
+        }, **pool_kwargs)
\ No newline at end of file
@@ -1,22 +1,28 @@
 from datetime import datetime
+from asgiref.sync import sync_to_async
 from django.db.models.query import QuerySet
 from django.db.models.query_utils import Q
 from accounts.models import Account, SocialMediaHandle
+from digger.base.async_request_manager import AsyncRequestManager
 from digger.base.digger import Digger
+from digger.base.scheduler import ScheduledResult
 from insights.models import InstagramHandleMetricModel
 from utils.datastructures import MetricTable
 from utils.errors import OAuthPlatformAuthorizationFailure
 from .types import InstagramPlalformMetric
 from utils import date_to_string, get_current_time
-from utils.types import Platform
-from .request_manager import InstagramRequestManager
+from utils.types import GraphErrorCodes, Platform, RollupGranularity
+from .request_manager import FacebookGraphAPIException, InstagramRequestManager
 from .request_struct import *
 from log_engine.log import logger
+import asyncio
 
 
 class InstagramDigger(Digger):
 
+    metric_model = InstagramHandleMetricModel
     request_manager = InstagramRequestManager()
+    async_request_manager = AsyncRequestManager.from_manager(request_manager)
 
     def get_long_lived_token(self, short_lived_token: str) -> FacebookLongLiveTokenResponse:
         request = FacebookLongLiveTokenRequest(short_lived_token)
@@ -36,29 +42,13 @@ class InstagramDigger(Digger):
             access_token = handle.access_token
 
         request = FacebookPageAccountsRequest(access_token)
-        # breakpoint()
-        response: FacebookPagesAccountsResponse = request(self.request_manager)
-        handle_uids = handle_queryset.values_list('handle_uid', flat=True)
-        recent_uids: List[str] = []
+        handle_uids = set(handle_queryset.values_list('handle_uid', flat=True))
         pages: List[FacebookPageData] = []
 
-
-        def validate_page_data(page: FacebookPageData) -> bool:
-            if page.instagram_business_account is not None \
-                and page.instagram_business_account.id not in handle_uids \
-                    and page.instagram_business_account.id not in recent_uids:
-                recent_uids.append(page.instagram_business_account.id)
-                return True
-            return False
-
-            
-
-
-        while response.error == None and len(response.pages) > 0:
-            pages += list(filter(validate_page_data, response.pages))
-            if response.paging.after == None:
-                break
-            response: FacebookPagesAccountsResponse = request(self.request_manager, after=response.paging.after)
+        for page in request.paginate(self.request_manager):
+            if page.instagram_business_account is not None and page.instagram_business_account.id not in handle_uids:
+                handle_uids.add(page.instagram_business_account.id)
+                pages.append(page)
         
         handles: List[SocialMediaHandle] = list(map(lambda data: SocialMediaHandle.from_ig_user_data(account, data.instagram_business_account) , pages))
         media_handles = SocialMediaHandle.objects.bulk_create(handles)
@@ -85,6 +75,14 @@ class InstagramDigger(Digger):
     def update_handle_data(self, social_media_handle: SocialMediaHandle) -> SocialMediaHandle:
         request = InstagramUserDataRequest(social_media_handle.handle_uid, social_media_handle.access_token)
         response: InstagramUserDataResponse = request(self.request_manager)
+        return self.set_handle_data(social_media_handle, response)
+
+    async def update_handle_data_async(self, social_media_handle: SocialMediaHandle) -> SocialMediaHandle:
+        request = InstagramUserDataRequest(social_media_handle.handle_uid, social_media_handle.access_token)
+        response: InstagramUserDataResponse = await request.call_async(self.async_request_manager)
+        return await sync_to_async(self.set_handle_data)(social_media_handle, response)
+
+    def set_handle_data(self, social_media_handle: SocialMediaHandle, response: InstagramUserDataResponse) -> SocialMediaHandle:
         social_media_handle.last_date_time_of_token_use = get_current_time()
         if response.error:
             logger.error(f"SocialMediaHandle[platform={social_media_handle.platform}, username={social_media_handle.username}] is returning {response.error} on InstagramUserDataRequest")
@@ -99,21 +97,96 @@ class InstagramDigger(Digger):
     
 
     def update_handle_insights(self, social_media_handle: SocialMediaHandle, save: bool=True) -> InstagramHandleMetricModel:
+        """
+        Syncs the handle data along with its insights, fetched in a single field expanded request
+        """
+        request = InstagramUserProfileInsightsRequest(social_media_handle.handle_uid, social_media_handle.access_token)
+        response: InstagramUserProfileInsightsResponse = request(self.request_manager)
+        if self.is_expansion_error(response):
+            response = InstagramUserProfileInsightsResponse.from_responses(
+                *[request(self.request_manager) for request in self.get_handle_analytics_requests(social_media_handle)])
+        handle_metric = self.set_handle_profile_insights(social_media_handle, response)
+        if save:
+            handle_metric.save()
+        return handle_metric
+
+    async def update_handle_insights_async(self, social_media_handle: SocialMediaHandle, save: bool=True) -> InstagramHandleMetricModel:
+        request = InstagramUserProfileInsightsRequest(social_media_handle.handle_uid, social_media_handle.access_token)
+        response: InstagramUserProfileInsightsResponse = await request.call_async(self.async_request_manager)
+        if self.is_expansion_error(response):
+            response = InstagramUserProfileInsightsResponse.from_responses(*await asyncio.gather(
+                *[request.call_async(self.async_request_manager) for request in self.get_handle_analytics_requests(social_media_handle)]))
+        handle_metric = await sync_to_async(self.set_handle_profile_insights)(social_media_handle, response)
+        if save:
+            await sync_to_async(handle_metric.save)()
+        return handle_metric
+
+    def set_handle_profile_insights(self, social_media_handle: SocialMediaHandle, response: InstagramUserProfileInsightsResponse) -> InstagramHandleMetricModel:
+        self.set_handle_data(social_media_handle, response.user_data)
+        return self.set_handle_insights(social_media_handle, response.demographic_insights, response.insights)
+
+    def set_handle_insights(self, social_media_handle: SocialMediaHandle, demographic_response: InstagramUserDemographicInsightsResponse,
+                            user_insights_response: InstagramUserInsightsResponse) -> InstagramHandleMetricModel:
         handle_metric: InstagramHandleMetricModel = InstagramHandleMetricModel.objects.get_or_create(handle=social_media_handle)
-        demographic_request = InstagramUserDemographicInsightsRequest(social_media_handle.handle_uid, access_token=social_media_handle.access_token)
-        demographic_response: InstagramUserDemographicInsightsResponse = demographic_request(self.request_manager)        
         handle_metric.set_metrics_from_user_demographic_response(demographic_response)
-        user_insights_request = InstagramUserInsightsRequest(social_media_handle.handle_uid, social_media_handle.access_token)
-        user_insights_request: InstagramUserInsightsResponse = user_insights_request(self.request_manager)
-        handle_metric.set_metrics_from_user_insight_response(user_insights_request)
-        handle_metric.media_count[date_to_string(get_current_time())] = social_media_handle.media_count
-
+        handle_metric.set_metrics_from_user_insight_response(user_insights_response)
+        handle_metric.merge_days("media_count", {date_to_string(get_current_time()): {"TOTAL": social_media_handle.media_count}})
         social_media_handle.last_date_time_of_token_use = get_current_time()
-        social_media_handle = self.update_handle_data(social_media_handle)
-        if save:
-            handle_metric.save()
         return handle_metric
     
+    @staticmethod
+    def is_expansion_error(response: InstagramUserProfileInsightsResponse) -> bool:
+        """
+        True when Graph refused the field expanded insights, e.g demographic insights of handles under 100 followers\n
+        Rate limits, open circuits, network and token errors would fail the separate requests just the same
+        """
+        if not isinstance(response.error, dict):
+            return False
+        return response.error.get("code") in (GraphErrorCodes.InvalidParameter, GraphErrorCodes.Permission)
+
+    def get_handle_analytics_requests(self, social_media_handle: SocialMediaHandle) -> List[RequestStruct]:
+        """
+        Returns the separate (user data, user insights, demographic insights) requests of a handle\n
+        Used when the field expanded request fails, e.g demographic insights of handles under 100 followers
+        """
+        return [
+            InstagramUserDataRequest(social_media_handle.handle_uid, social_media_handle.access_token),
+            InstagramUserInsightsRequest(social_media_handle.handle_uid, social_media_handle.access_token),
+            InstagramUserDemographicInsightsRequest(social_media_handle.handle_uid, access_token=social_media_handle.access_token)
+        ]
+
+    def update_handles_analytics_batch(self, social_media_handles: List[SocialMediaHandle], save: bool=True) -> List[ScheduledResult]:
+        """
+        Syncs the data and insights of every handle through Graph API batch requests,\n
+        a field expanded request per handle, 50 handles per round-trip\n
+        Returns a ScheduledResult per handle, a handle that fails to be set never stops the others,
+        handles whose user data still comes back with an API error are failed without being set
+        """
+        requests = [InstagramUserProfileInsightsRequest(social_media_handle.handle_uid, social_media_handle.access_token)
+                    for social_media_handle in social_media_handles]
+        responses: List[InstagramUserProfileInsightsResponse] = self.request_manager.make_batch_request(requests)
+        failed = [position for position, response in enumerate(responses) if self.is_expansion_error(response)]
+        if len(failed) > 0:
+            split_requests: List[RequestStruct] = []
+            for position in failed:
+                split_requests += self.get_handle_analytics_requests(social_media_handles[position])
+            split_responses = self.request_manager.make_batch_request(split_requests)
+            for offset, position in enumerate(failed):
+                responses[position] = InstagramUserProfileInsightsResponse.from_responses(*split_responses[3 * offset:3 * offset + 3])
+        results: List[ScheduledResult] = []
+        for social_media_handle, response in zip(social_media_handles, responses):
+            if response.error:
+                results.append(ScheduledResult(social_media_handle, error=FacebookGraphAPIException(**response.error)))
+                continue
+            try:
+                handle_metric = self.set_handle_profile_insights(social_media_handle, response)
+                if save:
+                    handle_metric.save()
+                results.append(ScheduledResult(social_media_handle, result=handle_metric))
+            except Exception as exc:
+                results.append(ScheduledResult(social_media_handle, error=exc))
+        return results
+    
     def update_all_handles_insights(self, account: Account) -> List[InstagramHandleMetricModel]:
         handle_queryset: QuerySet[SocialMediaHandle] = SocialMediaHandle.objects.filter(Q(account=account) & Q(platform=Platform.Instagram))
         if not handle_queryset.exists():
@@ -124,21 +197,15 @@ class InstagramDigger(Digger):
         return metrics
     
 
-    def calculate_platform_metric(self, account: Account, start_date: datetime = None, end_date: datetime = get_current_time()) -> MetricTable:
-        query_lookup: Q = Q(handle__account=account)
-        if start_date is not None:
-            query_lookup &= Q(created_on__gte=start_date)
-        query_lookup &= Q(expired_on__gte=end_date)
-        handle_metrics: QuerySet[InstagramHandleMetricModel] = InstagramHandleMetricModel.objects.filter(query_lookup)
-        return self.get_metric_table_from_queryset(handle_metrics)
+    def calculate_platform_metric(self, account: Account, start_date: datetime = None, end_date: datetime = None,
+                                  granularity: str = RollupGranularity.Day, metric_names: List[str] = None) -> MetricTable:
+        query_lookup: Q = Q(account=account) & Q(platform=Platform.Instagram)
+        return self.get_metric_table_from_rollups(self.get_metric_columns(metric_names), query_lookup, start_date, end_date, granularity)
     
-    def get_handle_insights(self, handle: 'SocialMediaHandle', start_date: datetime = None, end_date: datetime = ...) -> MetricTable:
+    def get_handle_insights(self, handle: 'SocialMediaHandle', start_date: datetime = None, end_date: datetime = None,
+                            metric_names: List[str] = None) -> MetricTable:
         query_lookup: Q = Q(handle=handle)
-        if start_date is not None:
-            query_lookup &= Q(created_on__gte=start_date)
-        query_lookup &= Q(expired_on__gte=end_date)
-        handle_metrics: QuerySet[InstagramHandleMetricModel] = InstagramHandleMetricModel.objects.filter(query_lookup)
-        return self.get_metric_table_from_queryset(handle_metrics)
+        return self.get_metric_table_from_facts(self.get_metric_columns(metric_names), query_lookup, start_date, end_date)
     
     
         
@@ -1,4 +1,12 @@
+from typing import Dict, List, Union
+from digger.base.rate_limiter import GraphRateLimiter
 from digger.base.request_manager import BaseRequestManager
+from digger.base.resilience import RequestErrorType
+from digger.base.types import AbstractRequestStruct, AbstractResponseStruct
+from utils.errors import RateLimitExceeded
+from utils.types import GraphErrorCodes, RequestMethod
+from .request_struct import FacebookBatchRequest
+from .response_struct import FacebookBatchResponse
 import json
 
 
@@ -13,10 +21,82 @@ class FacebookGraphAPIException(Exception):
 
 
 class InstagramRequestManager(BaseRequestManager):
+    rate_limiter = GraphRateLimiter()
+    # Graph API rejects batches of more than 50 requests
+    batch_size: int = 50
 
-    def __init__(self) -> None:
+    def __init__(self, **pool_kwargs) -> None:
         super().__init__({
             "graph": "https://graph.instagram.com",
             "oauth": "https://api.instagram.com/oauth",
             "default": "https://graph.facebook.com/v12.0"
-        })
\ No newline at end of file
+        }, **pool_kwargs)
+
+    def is_batchable(self, request: AbstractRequestStruct) -> bool:
+        return request.method == RequestMethod.Get and request.url_key == "default"
+
+    def make_batch_request(self, requests: List[AbstractRequestStruct]) -> List[AbstractResponseStruct]:
+        """
+        Sends the GET requests of graph.facebook.com as Graph API batches of batch_size, other requests one by one\n
+        Returns the response structs in the order of `requests`, built as if every request was sent on its own
+        """
+        responses: List[AbstractResponseStruct] = [None] * len(requests)
+        pending: List[int] = []
+        for index, request in enumerate(requests):
+            if self.is_batchable(request):
+                pending.append(index)
+            else:
+                responses[index] = request(self)
+        for start in range(0, len(pending), self.batch_size):
+            chunk = pending[start:start + self.batch_size]
+            for index, response in zip(chunk, self.send_batch([requests[index] for index in chunk])):
+                responses[index] = response
+        return responses
+
+    def send_batch(self, requests: List[AbstractRequestStruct]) -> List[AbstractResponseStruct]:
+        """
+        Sub requests count against the rate limits of their token as separate calls, the ones over the limit are not sent.\n
+        Requests the batch could not complete (null entries) are sent again on their own, as are all of them
+        when the batch is rejected for its access token, with the rate limiter token they took for the batch
+        """
+        responses: List[AbstractResponseStruct] = [None] * len(requests)
+        batched: List[int] = []
+        for index, request in enumerate(requests):
+            try:
+                if self.rate_limiter is not None:
+                    self.rate_limiter.acquire(request)
+                batched.append(index)
+            except RateLimitExceeded as exc:
+                responses[index] = self.get_error_response(request, self.get_url(request), 429, RequestErrorType.RateLimited, str(exc))
+        if len(batched) == 0:
+            return responses
+        batch_response: FacebookBatchResponse = FacebookBatchRequest([requests[index] for index in batched])(self)
+        entries = batch_response.responses if not batch_response.error else []
+        is_auth_error = self.is_auth_error(batch_response.error)
+        for position, index in enumerate(batched):
+            request = requests[index]
+            if is_auth_error:
+                responses[index] = request(self, acquired=True)
+            elif batch_response.error:
+                responses[index] = request.response_struct.from_error(self.get_url(request), batch_response.status_code, batch_response.error)
+            elif position >= len(entries) or entries[position] is None:
+                responses[index] = request(self, acquired=True)
+            else:
+                responses[index] = self.get_batch_entry_response(request, entries[position])
+        return responses
+
+    @staticmethod
+    def is_auth_error(error: Union[Dict, None]) -> bool:
+        """
+        True for Graph errors of the access token or session
+        """
+        return isinstance(error, dict) and error.get("code") in (GraphErrorCodes.AccessToken, GraphErrorCodes.Session)
+
+    def get_batch_entry_response(self, request: AbstractRequestStruct, entry: dict) -> AbstractResponseStruct:
+        url = self.get_url(request)
+        try:
+            data = json.loads(entry.get("body"))
+        except (TypeError, ValueError):
+            return self.get_error_response(request, url, entry.get("code"), RequestErrorType.InvalidResponse, "Batch entry body is not JSON")
+        response = request.response_struct.from_data(url, entry.get("code"), data)
+        return request.process_after_request(self, response)
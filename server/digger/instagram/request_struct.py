@@ -1,9 +1,15 @@
-from typing import List
+from typing import List, Union
+from urllib.parse import urlencode
 from digger.base.request_struct import RequestStruct
-from digger.instagram.request_manager import InstagramRequestManager
 from digger.instagram.response_struct import *
 from utils import get_secret
 from utils.types import RequestMethod
+import json
+
+
+INSTAGRAM_USER_FIELDS = "id,followers_count,media_count,name,profile_picture_url,username,biography"
+INSTAGRAM_USER_INSIGHT_METRICS = "impressions,reach,follower_count,profile_views"
+INSTAGRAM_USER_DEMOGRAPHIC_METRICS = "audience_city,audience_country,audience_gender_age"
 
 
 
@@ -49,7 +55,7 @@ class InstagramUserDataRequest(RequestStruct):
     def __init__(self, ig_user_id: str, access_token: str) -> None:
         self.endpoint = f"/{ig_user_id}"
         self.access_token = access_token
-        self.fields = "id,followers_count,media_count,name,profile_picture_url,username,biography"
+        self.fields = INSTAGRAM_USER_FIELDS
 
 class InstagramUserDemographicInsightsRequest(RequestStruct):
     method = RequestMethod.Get
@@ -59,7 +65,7 @@ class InstagramUserDemographicInsightsRequest(RequestStruct):
         self.endpoint = f"/{ig_user_id}/insights"
         self.access_token = access_token
         self.period = "lifetime"
-        self.metric = "audience_city,audience_country,audience_gender_age"
+        self.metric = INSTAGRAM_USER_DEMOGRAPHIC_METRICS
         
 
 class InstagramUserInsightsRequest(RequestStruct):
@@ -69,10 +75,28 @@ class InstagramUserInsightsRequest(RequestStruct):
     def __init__(self, ig_user_id: str, access_token: str, period: str = "day", **kwargs) -> None:
         self.endpoint = f"/{ig_user_id}/insights"
         self.access_token = access_token
-        self.metric = "impressions,reach,follower_count,profile_views"
+        self.metric = INSTAGRAM_USER_INSIGHT_METRICS
         self.period = period
 
 
+class InstagramUserProfileInsightsRequest(RequestStruct):
+    """
+    User data, insights and demographic insights of a handle in a single call\n
+    The insights edge is expanded twice, aliased as day_insights and lifetime_insights\n
+    """
+    method = RequestMethod.Get
+    response_struct = InstagramUserProfileInsightsResponse
+
+    def __init__(self, ig_user_id: str, access_token: str, period: str = "day", **kwargs) -> None:
+        self.endpoint = f"/{ig_user_id}"
+        self.access_token = access_token
+        self.fields = ",".join([
+            INSTAGRAM_USER_FIELDS,
+            f"insights.metric({INSTAGRAM_USER_INSIGHT_METRICS}).period({period}).as(day_insights)",
+            f"insights.metric({INSTAGRAM_USER_DEMOGRAPHIC_METRICS}).period(lifetime).as(lifetime_insights)"
+        ])
+
+
 
 
 class InstagramUserMediaListRequest(RequestStruct):
@@ -124,4 +148,40 @@ class InstagramSingleMediaInsightsRequest(RequestStruct):
 class InstagramStoryMediaInsightsRequest(InstagramSingleMediaInsightsRequest):
     def __init__(self,ig_media_id: str, access_token: str, **kwargs) -> None:
         super().__init__(ig_media_id, access_token, media_product_type=InstagramMediaProductTypes.STORY)
-            
\ No newline at end of file
+            
+
+
+def get_app_access_token() -> Union[str, None]:
+    """
+    App access token of the Facebook app, None when the app secrets are not set
+    """
+    client_id, client_secret = get_secret("FACEBOOK_CLIENT_ID"), get_secret("FACEBOOK_CLIENT_SECRET")
+    if not client_id or not client_secret:
+        return None
+    return f"{client_id}|{client_secret}"
+
+
+class FacebookBatchRequest(RequestStruct):
+    """
+    Packs up to 50 GET requests of the graph host into a single POST\n
+    Every sub request keeps its own access_token in its relative_url, the batch itself is authorized
+    with the app access token, so that a single invalid user token does not fail the whole batch\n
+    """
+    endpoint = "/"
+    method = RequestMethod.Post
+    response_struct = FacebookBatchResponse
+    rate_limit_key = "batch"
+
+    def __init__(self, requests: List[RequestStruct], access_token: str = None) -> None:
+        self.access_token = access_token or get_app_access_token() or getattr(requests[0], "access_token", None)
+        self.include_headers = "false"
+        self.batch = json.dumps([{"method": request.method, "relative_url": self.get_relative_url(request)}
+                                 for request in requests])
+
+    @staticmethod
+    def get_relative_url(request: RequestStruct) -> str:
+        params, _ = request.get_params()
+        relative_url = request.endpoint.lstrip("/")
+        if len(params) > 0:
+            relative_url += "?" + urlencode(params)
+        return relative_url
@@ -35,6 +35,14 @@ class FacebookPagesAccountsResponse(ResponseStruct):
                 ig_user_ls.append(page.instagram_business_account)
         return ig_user_ls
 
+    def get_items(self) -> List[FacebookPageData]:
+        return self.pages
+
+    def get_next_page_params(self) -> Union[Dict[str, str], None]:
+        if self.paging.has_after():
+            return {"after": self.paging.after}
+        return None
+
 
 class InstagramUserDataResponse(ResponseStruct):
     def __init__(self, url: str, status_code: int, error = None, id: str = None,
@@ -91,6 +99,34 @@ class InstagramUserInsightsResponse(ResponseStruct):
 
 
 
+class InstagramUserProfileInsightsResponse(ResponseStruct):
+    """
+    Splits the field expanded response into the structs of the separate requests,\n
+    user_data (InstagramUserDataRequest), insights (InstagramUserInsightsRequest)
+    and demographic_insights (InstagramUserDemographicInsightsRequest)\n
+    """
+
+    def __init__(self, url: str, status_code: int, error = None, day_insights: Dict[str, Any] = {},
+                 lifetime_insights: Dict[str, Any] = {}, **kwargs) -> None:
+        self.error = error
+        self.user_data = InstagramUserDataResponse(url, status_code, error=error, **kwargs)
+        self.insights = InstagramUserInsightsResponse(url, status_code, error=error, **day_insights)
+        self.demographic_insights = InstagramUserDemographicInsightsResponse(url, status_code, error=error, **lifetime_insights)
+        super().__init__(url, status_code)
+
+    @classmethod
+    def from_responses(cls, user_data: InstagramUserDataResponse, insights: InstagramUserInsightsResponse,
+                       demographic_insights: InstagramUserDemographicInsightsResponse) -> 'InstagramUserProfileInsightsResponse':
+        """
+        Builds the response from the responses of the separate requests
+        """
+        response = cls(user_data.url, user_data.status_code, error=user_data.error)
+        response.user_data = user_data
+        response.insights = insights
+        response.demographic_insights = demographic_insights
+        return response
+
+
 class InstagramUserMediaListResponse(ResponseStruct):
 
     def __init__(self, url: str, status_code: int, data: List[Dict[str, Any]] = [], paging: Dict[str, Any] = {}, error = None, **kwargs) -> None:
@@ -99,6 +135,14 @@ class InstagramUserMediaListResponse(ResponseStruct):
         self.data = list(map(lambda media: IGMedia(**media), data))
         super().__init__(url, status_code, **kwargs)
 
+    def get_items(self) -> List[IGMedia]:
+        return self.data
+
+    def get_next_page_params(self) -> Union[Dict[str, str], None]:
+        if self.paging.has_after():
+            return {"after": self.paging.after}
+        return None
+
 
 class InstagramSingleMediaDataResponse(ResponseStruct):
 
@@ -136,7 +180,19 @@ class InstagramStoryMediaInsightsResponse(InstagramSingleMediaInsightResponse):
     metrics_class  = InstagramStoryMetrics
 
 
+class FacebookBatchResponse(ResponseStruct):
+    """
+    Entries of a Graph API batch in the order of its requests, as {"code", "body"} dicts\n
+    An entry is None when the platform could not complete the request within the batch\n
+    """
 
+    def __init__(self, url: str, status_code: int, responses: List[Union[Dict[str, Any], None]] = [], error = None, **kwargs) -> None:
+        self.error = error
+        self.responses = responses
+        super().__init__(url, status_code)
 
-
-
+    @staticmethod
+    def process_data(kwargs: Union[Dict, List]) -> Dict:
+        if isinstance(kwargs, list):
+            return {"responses": kwargs}
+        return kwargs
@@ -0,0 +1,106 @@
+from asgiref.sync import async_to_sync
+from django.test import TestCase
+from unittest import TestCase as SimpleTestCase
+import asyncio
+
+from accounts.models import Account, SocialMediaHandle
+from digger.base.async_request_manager import AsyncRequestManager
+from digger.base.scheduler import BoundedScheduler
+from digger.benchmarks.stub_server import CANNED_RESPONSES, start_async_stub_server
+from digger.instagram.digger import InstagramDigger
+from digger.instagram.request_manager import InstagramRequestManager
+from digger.instagram.request_struct import InstagramUserDataRequest, InstagramUserDataResponse
+from insights.models import InstagramHandleMetricModel
+from utils.types import Platform
+
+
+IG_USER_ID = "17841400000000000"
+
+
+class TestAsyncRequestManager(SimpleTestCase):
+
+    def setUp(self) -> None:
+        self.server, self.base_url = start_async_stub_server()
+        self.request_manager = AsyncRequestManager.from_manager(InstagramRequestManager())
+        self.request_manager.base_url_record["default"] = f"{self.base_url}/v12.0"
+
+    def tearDown(self) -> None:
+        self.server.shutdown()
+
+    def test_from_manager_copies_configuration(self) -> None:
+        manager = InstagramRequestManager(pool_maxsize=5, timeout=7)
+        async_manager = AsyncRequestManager.from_manager(manager)
+        self.assertEqual(async_manager.base_url_record, manager.base_url_record)
+        self.assertEqual(async_manager.pool_maxsize, 5)
+        self.assertEqual(async_manager.get_client_timeout().sock_read, 7)
+
+    def test_encode_params(self) -> None:
+        params = AsyncRequestManager.encode_params({"limit": 25, "debug": True, "fields": ["id", "name"], "after": None})
+        self.assertEqual(params, [("limit", "25"), ("debug", "True"), ("fields", "id"), ("fields", "name")])
+
+    def test_make_request(self) -> None:
+
+        async def fetch() -> InstagramUserDataResponse:
+            try:
+                return await InstagramUserDataRequest(IG_USER_ID, "token").call_async(self.request_manager)
+            finally:
+                await self.request_manager.close()
+
+        response: InstagramUserDataResponse = asyncio.run(fetch())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.user.followers_count, CANNED_RESPONSES[f"/v12.0/{IG_USER_ID}"]["followers_count"])
+        self.assertIsNone(self.request_manager._session)
+
+
+class TestBoundedScheduler(SimpleTestCase):
+
+    def test_concurrency_is_bounded(self) -> None:
+        in_flight, peak = 0, 0
+
+        async def worker(item: int) -> int:
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            if item == 3:
+                raise ValueError(item)
+            return item * 2
+
+        results = asyncio.run(BoundedScheduler(concurrency=4).run(range(10), worker))
+        self.assertEqual(peak, 4)
+        self.assertEqual([result.item for result in results], list(range(10)))
+        self.assertIsInstance(results[3].error, ValueError)
+        self.assertEqual(results[5].result, 10)
+
+
+class TestInstagramDiggerAsync(TestCase):
+
+    def setUp(self) -> None:
+        self.account, _ = Account.get_test_account()
+        self.handle = SocialMediaHandle.get_test_handle(Platform.Instagram, self.account)
+        self.handle.access_token = "token"
+        responses = {
+            f"/v12.0/{self.handle.handle_uid}": CANNED_RESPONSES[f"/v12.0/{IG_USER_ID}"],
+            f"/v12.0/{self.handle.handle_uid}/insights": CANNED_RESPONSES[f"/v12.0/{IG_USER_ID}/insights"]
+        }
+        self.server, base_url = start_async_stub_server(responses)
+        self.digger = InstagramDigger()
+        self.digger.async_request_manager = AsyncRequestManager(f"{base_url}/v12.0")
+
+    def tearDown(self) -> None:
+        self.server.shutdown()
+
+    def test_update_handle_insights_async(self) -> None:
+
+        async def update() -> InstagramHandleMetricModel:
+            try:
+                return await self.digger.update_handle_insights_async(self.handle)
+            finally:
+                await self.digger.async_request_manager.close()
+
+        handle_metric: InstagramHandleMetricModel = async_to_sync(update)()
+        self.assertEqual(handle_metric.impressions, {"15-01-2022": {"TOTAL": 312}})
+        self.handle.refresh_from_db()
+        self.assertEqual(self.handle.follower_count, 1204)
+        self.assertEqual(InstagramHandleMetricModel.objects.filter(handle=self.handle).count(), 1)
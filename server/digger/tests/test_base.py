@@ -1,5 +1,6 @@
 from typing import Dict, List, Union
 from digger.base.request_manager import BaseRequestManager
+from digger.benchmarks.stub_server import start_stub_server
 from digger.base.request_struct import RequestStruct
 from unittest import TestCase
 from dataclasses import dataclass
@@ -17,9 +18,9 @@ class JSONResponse:
 
 class JSONPlacesholdResponse(ResponseStruct):
 
-    def __init__(self, url: str, posts: List[JSONResponse] = [], **kwargs) -> None:
+    def __init__(self, url: str, status_code: int, posts: List[JSONResponse] = [], **kwargs) -> None:
         self.posts = posts
-        super().__init__(url, **kwargs)
+        super().__init__(url, status_code, **kwargs)
     
     @staticmethod
     def process_data(kwargs: Union[Dict, List, str]) -> Dict[str, List[JSONResponse]]:
@@ -50,6 +51,20 @@ def test_digger_base() -> None:
     assert response.posts[0].id == 1
 
 
-
-
-
+def test_request_manager_reuses_pooled_session() -> None:
+    server, base_url = start_stub_server(responses={"/posts": [{"userId": 1, "id": 1, "title": "", "body": ""}]})
+    try:
+        request_manager = BaseRequestManager(base_url, pool_maxsize=4, timeout=5)
+        session = request_manager.session
+        adapter = session.get_adapter(base_url)
+        assert adapter._pool_maxsize == 4
+        for _ in range(3):
+            response: JSONPlacesholdResponse = JSONPlaceholderRequest()(request_manager)
+            assert response.status_code == 200
+            assert response.posts[0].id == 1
+        assert request_manager.session is session, "Session must be reused between requests"
+        assert len(adapter.poolmanager.pools) == 1, "All requests to one host should share a single pool"
+        request_manager.close()
+        assert request_manager._session is None
+    finally:
+        server.shutdown()
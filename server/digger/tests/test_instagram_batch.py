@@ -0,0 +1,216 @@
+from typing import Dict, List, Tuple
+from unittest.mock import patch
+from urllib.parse import parse_qs, urlparse
+from django.test import TestCase
+import json
+import os
+import requests
+
+from accounts.models import Account, SocialMediaHandle
+from digger.benchmarks.stub_server import CANNED_RESPONSES
+from digger.base.rate_limiter import RateLimiter, SimulatedClock
+from digger.base.resilience import CircuitBreakerRegistry, RequestErrorType
+from digger.instagram.digger import InstagramDigger
+from digger.instagram.request_manager import FacebookGraphAPIException, InstagramRequestManager
+from digger.instagram.request_struct import *
+from utils import date_to_string, get_current_time
+from utils.types import Platform
+
+
+IG_USER_ID = "17841400000000000"
+
+
+class GraphBatchSession:
+    """
+    Answers Graph API batches from the canned responses of the stub server\n
+    Relative urls listed in `incomplete` get a null entry, as Graph does for requests that timed out within the batch\n
+    With `expansion_error` field expanded insights fail, as for handles under 100 followers\n
+    `batch_error` is the error code the whole batch is rejected with, requests of `invalid_tokens` fail with code 190
+    """
+
+    def __init__(self, incomplete: List[str] = [], batch_error: int = None, expansion_error: bool = False,
+                 invalid_tokens: List[str] = []) -> None:
+        self.incomplete = incomplete
+        self.batch_error = batch_error
+        self.expansion_error = expansion_error
+        self.invalid_tokens = invalid_tokens
+        self.batches: List[List[Dict]] = []
+        self.batch_tokens: List[str] = []
+        self.single_urls: List[str] = []
+
+    def get_entry(self, path: str, fields: str, access_token: str = None) -> Tuple[int, Dict]:
+        if access_token in self.invalid_tokens:
+            return 400, {"error": {"message": "Error validating access token", "code": 190}}
+        if self.expansion_error and "insights.metric" in fields:
+            return 400, {"error": {"message": "Not enough viewers for the media to show insights", "code": 10}}
+        if path.endswith("/insights"):
+            return 200, CANNED_RESPONSES[f"/v12.0/{IG_USER_ID}/insights"]
+        return 200, CANNED_RESPONSES[f"/v12.0/{IG_USER_ID}"]
+
+    @staticmethod
+    def make_response(url: str, status_code: int, payload) -> requests.Response:
+        response = requests.Response()
+        response.url = url
+        response.status_code = status_code
+        response._content = json.dumps(payload).encode()
+        return response
+
+    def post(self, url: str, data: Dict = None, **kwargs) -> requests.Response:
+        if self.batch_error is not None:
+            return self.make_response(url, 400, {"error": {"message": "Batch rejected", "code": self.batch_error}})
+        batch = json.loads(data["batch"])
+        self.batches.append(batch)
+        self.batch_tokens.append(data["access_token"])
+        entries = []
+        for sub_request in batch:
+            if sub_request["relative_url"] in self.incomplete:
+                entries.append(None)
+                continue
+            relative_url = urlparse(sub_request["relative_url"])
+            query = parse_qs(relative_url.query)
+            status_code, payload = self.get_entry(relative_url.path, query.get("fields", [""])[0], query.get("access_token", [None])[0])
+            entries.append({"code": status_code, "body": json.dumps(payload)})
+        return self.make_response(url, 200, entries)
+
+    def get(self, url: str, params: Dict = None, **kwargs) -> requests.Response:
+        self.single_urls.append(url)
+        params = params or {}
+        return self.make_response(url, *self.get_entry(urlparse(url).path, params.get("fields", ""), params.get("access_token")))
+
+
+class TestGraphBatchRequest(TestCase):
+
+    def setUp(self) -> None:
+        self.request_manager = InstagramRequestManager(circuit_breakers=CircuitBreakerRegistry())
+        self.request_manager.rate_limiter = None
+        self.session = GraphBatchSession()
+        self.request_manager._session = self.session
+
+    def test_requests_are_packed_in_batches_of_50(self) -> None:
+        batch_requests = [InstagramUserDataRequest(IG_USER_ID, f"token-{index}") for index in range(120)]
+        responses = self.request_manager.make_batch_request(batch_requests)
+        self.assertEqual([len(batch) for batch in self.session.batches], [50, 50, 20])
+        relative_url = self.session.batches[0][7]["relative_url"]
+        self.assertTrue(relative_url.startswith(f"{IG_USER_ID}?"))
+        self.assertEqual(parse_qs(urlparse(relative_url).query)["access_token"], ["token-7"])
+        self.assertEqual(len(responses), 120)
+        self.assertTrue(all(isinstance(response, InstagramUserDataResponse) for response in responses))
+        self.assertEqual(responses[119].user.followers_count, 1204)
+        self.assertEqual(responses[0].url, f"https://graph.facebook.com/v12.0/{IG_USER_ID}")
+
+    def test_responses_keep_the_order_of_mixed_requests(self) -> None:
+        responses = self.request_manager.make_batch_request([
+            InstagramUserInsightsRequest(IG_USER_ID, "token"),
+            InstagramUserDataRequest(IG_USER_ID, "token"),
+            InstagramUserDemographicInsightsRequest(IG_USER_ID, "token")
+        ])
+        self.assertEqual(len(self.session.batches), 1)
+        self.assertEqual(list(responses[0].impressions.values()), [{"TOTAL": 312}])
+        self.assertEqual(responses[1].user.username, "bytatigris")
+        self.assertEqual(list(responses[2].audience_country.values()), [{"IN": 52}])
+
+    def test_incomplete_entries_are_sent_on_their_own(self) -> None:
+        data_request = InstagramUserDataRequest(IG_USER_ID, "token")
+        self.session.incomplete = [FacebookBatchRequest.get_relative_url(data_request)]
+        responses = self.request_manager.make_batch_request([InstagramUserInsightsRequest(IG_USER_ID, "token"), data_request])
+        self.assertEqual(self.session.single_urls, [f"https://graph.facebook.com/v12.0/{IG_USER_ID}"])
+        self.assertEqual(responses[1].user.media_count, 87)
+
+    def test_requests_sent_again_keep_their_rate_limit_token(self) -> None:
+        self.request_manager.rate_limiter = RateLimiter(default_limit=(1, 1), max_wait=0, clock=SimulatedClock())
+        data_request = InstagramUserDataRequest(IG_USER_ID, "token")
+        self.session.incomplete = [FacebookBatchRequest.get_relative_url(data_request)]
+        responses = self.request_manager.make_batch_request([data_request])
+        self.assertEqual(self.session.single_urls, [f"https://graph.facebook.com/v12.0/{IG_USER_ID}"])
+        self.assertIsNone(responses[0].error)
+        self.assertEqual(responses[0].user.media_count, 87)
+
+    def test_failed_batch_sets_error_on_every_response(self) -> None:
+        self.session.batch_error = 1
+        responses = self.request_manager.make_batch_request([InstagramUserDataRequest(IG_USER_ID, "token")] * 3)
+        self.assertTrue(all(response.error["code"] == 1 for response in responses))
+        self.assertEqual(self.session.single_urls, [])
+
+    def test_batch_rejected_for_its_token_is_sent_request_by_request(self) -> None:
+        self.session.batch_error = 190
+        responses = self.request_manager.make_batch_request([InstagramUserDataRequest(IG_USER_ID, f"token-{index}") for index in range(3)])
+        self.assertEqual(len(self.session.single_urls), 3)
+        self.assertTrue(all(response.error is None for response in responses))
+        self.assertEqual(responses[2].user.username, "bytatigris")
+
+    def test_batch_is_authorized_with_the_app_token(self) -> None:
+        with patch.dict(os.environ, {"FACEBOOK_CLIENT_ID": "app-id", "FACEBOOK_CLIENT_SECRET": "app-secret"}):
+            self.request_manager.make_batch_request([InstagramUserDataRequest(IG_USER_ID, "token")])
+        self.assertEqual(self.session.batch_tokens, ["app-id|app-secret"])
+
+    def test_invalid_entry_body(self) -> None:
+        response = self.request_manager.get_batch_entry_response(InstagramUserDataRequest(IG_USER_ID, "token"), {"code": 500, "body": "<html>"})
+        self.assertEqual(response.error["type"], RequestErrorType.InvalidResponse)
+
+
+class TestInstagramBatchSync(TestCase):
+
+    def setUp(self) -> None:
+        self.account, _ = Account.get_test_account()
+        self.handles = [SocialMediaHandle.get_test_handle(Platform.Instagram, self.account) for _ in range(3)]
+        self.digger = InstagramDigger()
+        self.digger.request_manager = InstagramRequestManager(circuit_breakers=CircuitBreakerRegistry())
+        self.digger.request_manager.rate_limiter = None
+        self.session = GraphBatchSession()
+        self.digger.request_manager._session = self.session
+
+    def test_handles_are_synced_in_one_batch(self) -> None:
+        results = self.digger.update_handles_analytics_batch(self.handles)
+        self.assertEqual([len(batch) for batch in self.session.batches], [3])
+        self.assertTrue(all(scheduled.error is None for scheduled in results))
+        handle = SocialMediaHandle.objects.get(id=self.handles[0].id)
+        self.assertEqual(handle.follower_count, 1204)
+        handle_metric = results[0].result
+        self.assertEqual(list(handle_metric.impressions.values()), [{"TOTAL": 312}])
+        self.assertEqual(list(handle_metric.audience_country.values()), [{"IN": 52}])
+
+    def test_failed_field_expansion_falls_back_to_separate_requests(self) -> None:
+        self.session.expansion_error = True
+        results = self.digger.update_handles_analytics_batch(self.handles)
+        self.assertEqual([len(batch) for batch in self.session.batches], [3, 9])
+        self.assertTrue(all(scheduled.error is None for scheduled in results))
+        self.assertEqual(list(results[2].result.impressions.values()), [{"TOTAL": 312}])
+
+    def test_invalid_token_fails_only_its_handle(self) -> None:
+        self.handles[1].access_token = "revoked-token"
+        self.handles[1].save()
+        self.session.invalid_tokens = ["revoked-token"]
+        results = self.digger.update_handles_analytics_batch(self.handles)
+        # Token errors would fail the separate requests just the same, they are not sent
+        self.assertEqual([len(batch) for batch in self.session.batches], [3])
+        self.assertIsNone(results[0].error)
+        self.assertIsNone(results[2].error)
+        self.assertIsInstance(results[1].error, FacebookGraphAPIException)
+        self.assertEqual(results[1].error.error["code"], 190)
+
+    def test_only_expansion_errors_fall_back_to_separate_requests(self) -> None:
+        self.handles[0].access_token = "revoked-token"
+        self.handles[0].save()
+        self.session.invalid_tokens = ["revoked-token"]
+        self.digger.update_handle_insights(self.handles[0], save=False)
+        self.assertEqual(len(self.session.single_urls), 1)
+        self.digger.request_manager.rate_limiter = RateLimiter(default_limit=(1, 1), max_wait=0, clock=SimulatedClock())
+        self.digger.request_manager.rate_limiter.reserve(InstagramUserProfileInsightsRequest(self.handles[1].handle_uid, self.handles[1].access_token))
+        self.digger.update_handle_insights(self.handles[1], save=False)
+        self.assertEqual(len(self.session.single_urls), 1)
+
+    def test_update_handle_insights_in_a_single_call(self) -> None:
+        handle_metric = self.digger.update_handle_insights(self.handles[0])
+        self.assertEqual(len(self.session.single_urls), 1)
+        self.assertEqual(list(handle_metric.reach.values()), [{"TOTAL": 201}])
+        self.assertEqual(SocialMediaHandle.objects.get(id=self.handles[0].id).media_count, 87)
+        self.session.expansion_error = True
+        handle_metric = self.digger.update_handle_insights(self.handles[1])
+        self.assertEqual(len(self.session.single_urls), 5)
+        self.assertEqual(list(handle_metric.reach.values()), [{"TOTAL": 201}])
+
+    def test_media_count_is_served_in_handle_insights(self) -> None:
+        self.digger.update_handle_insights(self.handles[0])
+        _json = self.digger.get_handle_insights(self.handles[0], metric_names=["media_count"]).json()
+        self.assertEqual(_json["rows"], [[date_to_string(get_current_time()), 87]])
+        self.assertEqual(_json["totals"], {"MEDIA_COUNT_TOTAL": 87})
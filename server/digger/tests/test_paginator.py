@@ -0,0 +1,106 @@
+from typing import Dict, List
+from unittest import TestCase
+import threading
+
+from digger.base.request_struct import RequestStruct
+from digger.base.response_struct import ResponseStruct
+from digger.instagram.response_struct import InstagramUserMediaListResponse
+from digger.youtube.response_struct import YoutubeChannelVideoListResponse
+
+
+class CursorResponse(ResponseStruct):
+
+    def __init__(self, url: str, status_code: int, error=None, items: List[int] = [], next: str = None, **kwargs) -> None:
+        self.error = error
+        self.items = items
+        self.next = next
+        super().__init__(url, status_code, **kwargs)
+
+    def get_items(self) -> List[int]:
+        return self.items
+
+    def get_next_page_params(self) -> Dict[str, str]:
+        if self.next is None:
+            return None
+        return {"cursor": self.next}
+
+
+class CursorRequest(RequestStruct):
+    response_struct = CursorResponse
+    endpoint = "/items"
+
+
+class PagedManager:
+    """
+    Serves `page_count` pages of `page_size` items, records the cursor of every request
+    """
+
+    def __init__(self, page_count: int = 3, page_size: int = 2, error_on_page: int = None) -> None:
+        self.page_count = page_count
+        self.page_size = page_size
+        self.error_on_page = error_on_page
+        self.requested: List[int] = []
+        self.page_requested = threading.Event()
+
+    def make_request(self, request: RequestStruct, cursor: str = "0", **extra_params) -> CursorResponse:
+        page = int(cursor)
+        self.requested.append(page)
+        if page == 1:
+            self.page_requested.set()
+        if page == self.error_on_page:
+            return CursorResponse.from_error("/items", 500, {"message": "Internal error"})
+        items = list(range(page * self.page_size, (page + 1) * self.page_size))
+        next_cursor = str(page + 1) if page + 1 < self.page_count else None
+        return CursorResponse.from_data("/items", 200, {"items": items, "next": next_cursor})
+
+
+class TestPaginator(TestCase):
+
+    def test_pages_are_requested_lazily(self) -> None:
+        manager = PagedManager()
+        items = iter(CursorRequest().paginate(manager))
+        self.assertEqual(manager.requested, [])
+        self.assertEqual([next(items), next(items)], [0, 1])
+        self.assertEqual(manager.requested, [0])
+        self.assertEqual(list(items), [2, 3, 4, 5])
+        self.assertEqual(manager.requested, [0, 1, 2])
+
+    def test_max_items_stops_requesting_pages(self) -> None:
+        manager = PagedManager(page_count=100)
+        self.assertEqual(list(CursorRequest().paginate(manager, max_items=3)), [0, 1, 2])
+        self.assertEqual(manager.requested, [0, 1])
+        self.assertEqual(list(CursorRequest().paginate(manager, max_items=0)), [])
+
+    def test_prefetch_requests_the_next_page_while_consuming(self) -> None:
+        manager = PagedManager()
+        items = iter(CursorRequest().paginate(manager, prefetch=True))
+        self.assertEqual(next(items), 0)
+        # The second page is requested in the background, before the first one is consumed
+        self.assertTrue(manager.page_requested.wait(5))
+        self.assertEqual(manager.requested, [0, 1])
+        self.assertEqual(list(items), [1, 2, 3, 4, 5])
+        self.assertEqual(manager.requested, [0, 1, 2])
+
+    def test_iteration_stops_on_error(self) -> None:
+        paginator = CursorRequest().paginate(PagedManager(error_on_page=1))
+        self.assertEqual(list(paginator), [0, 1])
+        self.assertEqual(paginator.error, {"message": "Internal error"})
+
+
+class TestPlatformPagination(TestCase):
+
+    def test_graph_cursor(self) -> None:
+        response = InstagramUserMediaListResponse.from_data("url", 200, {
+            "data": [{"id": "1"}, {"id": "2"}], "paging": {"cursors": {"before": "b", "after": "a"}}})
+        self.assertEqual([media.id for media in response.get_items()], ["1", "2"])
+        self.assertEqual(response.get_next_page_params(), {"after": "a"})
+        response = InstagramUserMediaListResponse.from_data("url", 200, {"data": [], "paging": {}})
+        self.assertIsNone(response.get_next_page_params())
+
+    def test_youtube_page_token(self) -> None:
+        response = YoutubeChannelVideoListResponse.from_data("url", 200, {
+            "nextPageToken": "CAUQAA", "items": [{"id": {"videoId": "v1"}, "snippet": {"title": "First"}}]})
+        self.assertEqual(response.get_next_page_params(), {"pageToken": "CAUQAA"})
+        self.assertEqual(len(response.get_items()), 1)
+        error_response = YoutubeChannelVideoListResponse.from_error("url", 403, {"message": "quotaExceeded"})
+        self.assertEqual(error_response.get_items(), [])
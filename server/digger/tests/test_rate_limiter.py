@@ -0,0 +1,145 @@
+from datetime import datetime, timezone
+from unittest import TestCase
+import asyncio
+import json
+
+from digger.base.rate_limiter import GraphRateLimiter, RateLimiter, SimulatedClock, YoutubeRateLimiter
+from digger.base.request_struct import RequestStruct
+from digger.youtube.request_struct import YoutubeChannelListRequest, YoutubeChannelVideoListRequest, YoutubeRefreshTokenRequest
+from utils.errors import RateLimitExceeded
+
+
+class TokenRequest(RequestStruct):
+    url_key = "default"
+
+    def __init__(self, access_token: str = "token") -> None:
+        self.access_token = access_token
+
+
+class InsightsRequest(TokenRequest):
+    rate_limit_key = "insights"
+
+
+class TestRateLimiter(TestCase):
+
+    def setUp(self) -> None:
+        self.clock = SimulatedClock()
+        self.limiter = RateLimiter(default_limit=(2, 4), limits={"insights": (1, 1)}, max_wait=10, clock=self.clock)
+
+    def test_burst_then_refill_rate(self) -> None:
+        waits = [self.limiter.reserve(TokenRequest()) for _ in range(6)]
+        self.assertEqual(waits, [0, 0, 0, 0, 0.5, 1.0])
+        self.clock.advance(5)
+        self.assertEqual(self.limiter.reserve(TokenRequest()), 0)
+
+    def test_acquire_sleeps_on_the_clock(self) -> None:
+        for _ in range(5):
+            self.limiter.acquire(TokenRequest())
+        self.assertEqual(self.clock.slept, 0.5)
+        asyncio.run(self.limiter.acquire_async(TokenRequest()))
+        self.assertEqual(self.clock.slept, 1.0)
+
+    def test_buckets_per_endpoint_key_and_token(self) -> None:
+        self.assertEqual(self.limiter.reserve(InsightsRequest()), 0)
+        self.assertEqual(self.limiter.reserve(InsightsRequest()), 1)
+        self.assertEqual(self.limiter.reserve(InsightsRequest("other-token")), 0)
+        self.assertEqual(self.limiter.reserve(TokenRequest()), 0)
+
+    def test_wait_beyond_max_wait_is_not_reserved(self) -> None:
+        limiter = RateLimiter(default_limit=(0.1, 1), max_wait=5, clock=self.clock)
+        limiter.reserve(TokenRequest())
+        with self.assertRaises(RateLimitExceeded) as context:
+            limiter.reserve(TokenRequest())
+        self.assertEqual(context.exception.wait, 10)
+        self.clock.advance(10)
+        self.assertEqual(limiter.reserve(TokenRequest()), 0)
+
+
+class TestGraphRateLimiter(TestCase):
+
+    def setUp(self) -> None:
+        self.clock = SimulatedClock()
+        self.limiter = GraphRateLimiter(default_limit=(1, 1), max_wait=1000, clock=self.clock)
+
+    def test_app_usage_throttles_refill(self) -> None:
+        request = TokenRequest()
+        self.limiter.reserve(request)
+        self.limiter.update_from_headers(request, {"X-App-Usage": json.dumps({"call_count": 90, "total_time": 10, "total_cputime": 5})})
+        self.assertEqual(self.limiter.app_throttle, 0.4)
+        self.assertEqual(self.limiter.reserve(request), 2.5)
+
+    def test_exhausted_app_usage_blocks_every_token(self) -> None:
+        request = TokenRequest()
+        self.limiter.update_from_headers(request, {"X-App-Usage": json.dumps({"call_count": 100})})
+        self.assertEqual(self.limiter.reserve(TokenRequest("other-token")), self.limiter.app_block_seconds)
+
+    def test_business_usage_blocks_the_token_until_regained(self) -> None:
+        request = TokenRequest()
+        self.limiter.reserve(request)
+        usage = {"1784140": [{"type": "instagram", "call_count": 100, "total_cputime": 20, "total_time": 20,
+                              "estimated_time_to_regain_access": 5}]}
+        self.limiter.update_from_headers(request, {"X-Business-Use-Case-Usage": json.dumps(usage)})
+        self.assertEqual(self.limiter.reserve(TokenRequest("other-token")), 0)
+        self.limiter.max_wait = 60
+        with self.assertRaises(RateLimitExceeded) as context:
+            self.limiter.reserve(request)
+        # The missing token is refilled once access is regained
+        self.assertEqual(context.exception.wait, 5 * 60 + 1)
+
+    def test_app_throttle_is_restored_after_the_block(self) -> None:
+        request = TokenRequest()
+        self.limiter.reserve(request)
+        self.limiter.update_from_headers(request, {"X-App-Usage": json.dumps({"call_count": 100})})
+        self.clock.advance(self.limiter.app_block_seconds)
+        self.assertEqual(self.limiter.app_throttle, 0)
+        # No token accrued while blocked, the bucket refills at full rate from the end of the block
+        self.assertEqual(self.limiter.reserve(request), 1)
+        self.assertEqual(self.limiter.app_throttle, 1.0)
+
+    def test_token_throttle_is_restored_after_the_block(self) -> None:
+        request = TokenRequest()
+        self.limiter.reserve(request)
+        usage = {"1784140": [{"type": "instagram", "call_count": 100, "estimated_time_to_regain_access": 5}]}
+        self.limiter.update_from_headers(request, {"X-Business-Use-Case-Usage": json.dumps(usage)})
+        self.clock.advance(5 * 60)
+        self.assertEqual(self.limiter.reserve(request), 1)
+        self.clock.advance(10)
+        self.assertEqual(self.limiter.reserve(request), 0)
+
+    def test_exhausted_token_usage_without_regain_time_is_blocked(self) -> None:
+        request = TokenRequest()
+        self.limiter.reserve(request)
+        usage = {"1784140": [{"type": "instagram", "call_count": 100}]}
+        self.limiter.update_from_headers(request, {"X-Business-Use-Case-Usage": json.dumps(usage)})
+        self.assertEqual(self.limiter.get_wait(request, self.clock.monotonic()), self.limiter.app_block_seconds + 1)
+        self.clock.advance(self.limiter.app_block_seconds)
+        self.assertEqual(self.limiter.reserve(request), 1)
+
+    def test_invalid_headers_are_ignored(self) -> None:
+        self.limiter.update_from_headers(TokenRequest(), {"X-App-Usage": "not-json"})
+        self.assertEqual(self.limiter.app_throttle, 1.0)
+
+
+class TestYoutubeRateLimiter(TestCase):
+
+    def setUp(self) -> None:
+        # 2022-01-15 23:00 Pacific Time
+        self.clock = SimulatedClock(datetime(2022, 1, 16, 7, 0, tzinfo=timezone.utc).timestamp())
+        self.limiter = YoutubeRateLimiter(default_limit=(100, 100), daily_quota={"default": 150}, max_wait=60, clock=self.clock)
+
+    def test_quota_units_per_request_struct(self) -> None:
+        self.limiter.reserve(YoutubeChannelVideoListRequest("token"))
+        self.limiter.reserve(YoutubeRefreshTokenRequest("refresh-token"))
+        for _ in range(50):
+            self.limiter.reserve(YoutubeChannelListRequest("token"))
+        self.assertEqual(self.limiter.get_quota_remaining("default"), 0)
+        with self.assertRaises(RateLimitExceeded) as context:
+            self.limiter.reserve(YoutubeChannelListRequest("token"))
+        self.assertEqual(context.exception.wait, 60 * 60)
+
+    def test_quota_resets_at_pacific_midnight(self) -> None:
+        for _ in range(150):
+            self.limiter.reserve(YoutubeChannelListRequest("token"))
+        self.clock.advance(60 * 60)
+        self.assertEqual(self.limiter.reserve(YoutubeChannelListRequest("token")), 0)
+        self.assertEqual(self.limiter.get_quota_remaining("default"), 149)
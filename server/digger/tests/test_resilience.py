@@ -0,0 +1,175 @@
+from typing import List, Union
+from unittest import TestCase
+from unittest.mock import patch
+import asyncio
+import random
+import requests
+
+from digger.base.async_request_manager import AsyncRequestManager
+from digger.base.rate_limiter import RateLimiter, SimulatedClock
+from digger.base.request_manager import BaseRequestManager
+from digger.base.resilience import CircuitBreaker, CircuitBreakerRegistry, RequestErrorType, RetryPolicy
+from digger.base.request_struct import RequestStruct
+from digger.base.response_struct import ResponseStruct
+from utils.types import RequestMethod
+
+
+class ItemsResponse(ResponseStruct):
+
+    def __init__(self, url: str, status_code: int, error=None, items: List = [], **kwargs) -> None:
+        self.error = error
+        self.items = items
+        super().__init__(url, status_code, **kwargs)
+
+
+class ItemsRequest(RequestStruct):
+    response_struct = ItemsResponse
+    endpoint = "/items"
+
+
+class CreateItemRequest(ItemsRequest):
+    method = RequestMethod.Post
+
+
+class ScriptedSession:
+    """
+    Replays a script of status codes, or exceptions to raise, one per request
+    """
+
+    def __init__(self, script: List[Union[int, Exception]]) -> None:
+        self.script = script
+        self.calls = 0
+
+    def request(self, url: str, **kwargs) -> requests.Response:
+        step = self.script[min(self.calls, len(self.script) - 1)]
+        self.calls += 1
+        if isinstance(step, Exception):
+            raise step
+        response = requests.Response()
+        response.status_code = step
+        response.url = url
+        response._content = b'{"items": [1, 2]}' if step < 400 else b'<html>Bad Gateway</html>'
+        return response
+
+    get = post = request
+
+
+class TestRetryPolicy(TestCase):
+
+    def test_only_get_requests_are_retried(self) -> None:
+        policy = RetryPolicy(max_attempts=3)
+        self.assertTrue(policy.should_retry(ItemsRequest(), 0))
+        self.assertTrue(policy.should_retry(ItemsRequest(), 1, 503))
+        self.assertFalse(policy.should_retry(ItemsRequest(), 2, 503))
+        self.assertFalse(policy.should_retry(ItemsRequest(), 0, 404))
+        self.assertFalse(policy.should_retry(CreateItemRequest(), 0, 503))
+
+    def test_jittered_exponential_delay(self) -> None:
+        policy = RetryPolicy(base_delay=1, max_delay=5, rng=random.Random(7))
+        for attempt, ceiling in enumerate([1, 2, 4, 5, 5]):
+            delay = policy.get_delay(attempt)
+            self.assertTrue(0 <= delay <= ceiling)
+        self.assertEqual(policy.get_delay(0, {"Retry-After": "3"}), 3)
+        self.assertEqual(policy.get_delay(0, {"Retry-After": "120"}), 5)
+
+
+class TestCircuitBreaker(TestCase):
+
+    def test_open_half_open_closed(self) -> None:
+        clock = SimulatedClock()
+        breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=30, clock=clock)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+        clock.advance(30)
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow(), "Only one trial request is let through while half open")
+        breaker.record_failure()
+        clock.advance(29)
+        self.assertFalse(breaker.allow())
+        clock.advance(1)
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.Closed)
+
+    def test_breakers_are_per_host(self) -> None:
+        registry = CircuitBreakerRegistry()
+        self.assertIs(registry.get("https://graph.facebook.com/v12.0/me"), registry.get("https://graph.facebook.com/oauth"))
+        self.assertIsNot(registry.get("https://graph.facebook.com/me"), registry.get("https://www.googleapis.com/youtube"))
+
+
+class TestResilientRequestManager(TestCase):
+
+    def setUp(self) -> None:
+        self.clock = SimulatedClock()
+        self.request_manager = BaseRequestManager("https://api.test", retry_policy=RetryPolicy(max_attempts=3, clock=self.clock),
+                                                  circuit_breakers=CircuitBreakerRegistry(failure_threshold=3, clock=self.clock))
+
+    def run_script(self, script: List[Union[int, Exception]], request: RequestStruct = None) -> ItemsResponse:
+        self.request_manager._session = ScriptedSession(script)
+        return (request or ItemsRequest())(self.request_manager)
+
+    def test_transient_failures_are_retried(self) -> None:
+        response = self.run_script([503, requests.ConnectionError("reset"), 200])
+        self.assertIsNone(response.error)
+        self.assertEqual(response.items, [1, 2])
+        self.assertEqual(self.request_manager._session.calls, 3)
+        self.assertGreater(self.clock.slept, 0)
+
+    def test_exhausted_retries_return_typed_error(self) -> None:
+        response = self.run_script([502])
+        self.assertEqual(response.error["type"], RequestErrorType.InvalidResponse)
+        self.assertEqual(response.status_code, 502)
+        self.assertEqual(response.items, [])
+        # The three failed attempts above opened the circuit of the host
+        response = self.run_script([requests.Timeout("read timeout")])
+        self.assertEqual(response.error["type"], RequestErrorType.CircuitOpen)
+
+    def test_post_is_not_retried(self) -> None:
+        response = self.run_script([requests.ConnectionError("reset"), 200], CreateItemRequest())
+        self.assertEqual(response.error["type"], RequestErrorType.Network)
+        self.assertEqual(self.request_manager._session.calls, 1)
+
+    def test_open_circuit_fails_fast(self) -> None:
+        self.run_script([503, 503, 503])
+        response = self.run_script([200])
+        self.assertEqual(response.error["type"], RequestErrorType.CircuitOpen)
+        self.assertEqual(self.request_manager._session.calls, 0)
+        self.clock.advance(30)
+        self.assertIsNone(self.run_script([200]).error)
+
+    def test_rate_limited_trial_does_not_hold_the_circuit_half_open(self) -> None:
+        self.run_script([503, 503, 503])
+        # Retries sleep jittered delays, whole seconds beyond the waits keep the float clock away from the bounds
+        self.clock.advance(31)
+        self.request_manager.rate_limiter = RateLimiter(default_limit=(1, 1), max_wait=0, clock=self.clock)
+        self.request_manager.rate_limiter.reserve(ItemsRequest())
+        response = self.run_script([200])
+        self.assertEqual(response.error["type"], RequestErrorType.RateLimited)
+        self.assertEqual(self.request_manager.circuit_breakers.get("https://api.test").state, CircuitBreaker.Open)
+        self.clock.advance(2)
+        self.assertIsNone(self.run_script([200]).error)
+
+    def test_unexpected_error_of_the_trial_releases_the_circuit(self) -> None:
+        self.run_script([503, 503, 503])
+        self.clock.advance(31)
+        with patch("digger.base.request_manager.is_in_debug_mode", return_value=False):
+            response = self.run_script([ValueError("unexpected")])
+        self.assertEqual(response.error["type"], RequestErrorType.Unexpected)
+        self.assertIsNone(self.run_script([200]).error)
+
+    def test_async_network_failure_returns_typed_error(self) -> None:
+        async_manager = AsyncRequestManager.from_manager(self.request_manager)
+        async_manager.base_url_record["default"] = "http://127.0.0.1:1"
+
+        async def fetch() -> ItemsResponse:
+            try:
+                return await ItemsRequest().call_async(async_manager)
+            finally:
+                await async_manager.close()
+
+        response = asyncio.run(fetch())
+        self.assertEqual(response.error["type"], RequestErrorType.Network)
+        self.assertIsNone(response.status_code)
+        self.assertEqual(self.request_manager.circuit_breakers.get("http://127.0.0.1:1").failures, 3)
@@ -0,0 +1,120 @@
+from typing import Dict, List
+from unittest import TestCase
+from django.test import override_settings
+import json
+import pickle
+import requests
+
+from digger.base.cache import DEFAULT_TIMEOUT, CachedResponse, DjangoCacheBackend, LRUCacheBackend, ResponseCache, get_default_backend
+from digger.base.request_manager import BaseRequestManager
+from digger.base.resilience import CircuitBreakerRegistry
+from digger.youtube.request_struct import YoutubeChannelListRequest, YoutubeChannelReportRequest, YoutubeMultipleVideoDataRequest
+from digger.youtube.response_struct import YoutubeChannelListResponse
+
+
+CHANNEL_LIST = {
+    "etag": "channel-etag-1",
+    "items": [{"id": "UC123", "snippet": {"title": "Byta Tigris", "description": "", "thumbnails": {"high": {"url": "https://yt3.ggpht.com/avatar"}}}}]
+}
+
+
+class ConditionalSession:
+    """
+    Answers 304 when If-None-Match matches the current etag, records the headers of every request
+    """
+
+    def __init__(self, payload: Dict) -> None:
+        self.payload = payload
+        self.sent_headers: List[Dict] = []
+
+    def get(self, url: str, headers: Dict = None, **kwargs) -> requests.Response:
+        headers = headers or {}
+        self.sent_headers.append(headers)
+        response = requests.Response()
+        response.url = url
+        if headers.get("If-None-Match") == self.payload["etag"]:
+            response.status_code = 304
+            response._content = b""
+        else:
+            response.status_code = 200
+            response.headers["ETag"] = self.payload["etag"]
+            response._content = json.dumps(self.payload).encode()
+        return response
+
+
+class TestResponseCache(TestCase):
+
+    def setUp(self) -> None:
+        self.session = ConditionalSession(dict(CHANNEL_LIST))
+        self.request_manager = BaseRequestManager({"default": "https://www.googleapis.com/youtube/v3"},
+                                                  circuit_breakers=CircuitBreakerRegistry(),
+                                                  response_cache=ResponseCache(LRUCacheBackend()))
+        self.request_manager._session = self.session
+
+    def test_not_modified_reuses_parsed_response(self) -> None:
+        first: YoutubeChannelListResponse = YoutubeChannelListRequest("token")(self.request_manager)
+        second: YoutubeChannelListResponse = YoutubeChannelListRequest("token")(self.request_manager)
+        self.assertNotIn("If-None-Match", self.session.sent_headers[0])
+        self.assertEqual(self.session.sent_headers[1]["If-None-Match"], "channel-etag-1")
+        self.assertIs(second, first)
+        self.assertIs(second.channels[0], first.channels[0])
+        self.assertEqual(second.channels[0].title, "Byta Tigris")
+
+    def test_changed_resource_is_refetched(self) -> None:
+        YoutubeChannelListRequest("token")(self.request_manager)
+        self.session.payload = CHANNEL_LIST | {"etag": "channel-etag-2"}
+        response: YoutubeChannelListResponse = YoutubeChannelListRequest("token")(self.request_manager)
+        self.assertEqual(response.status_code, 200)
+        YoutubeChannelListRequest("token")(self.request_manager)
+        self.assertEqual(self.session.sent_headers[2]["If-None-Match"], "channel-etag-2")
+
+    def test_key_depends_on_struct_params_and_token(self) -> None:
+        url = "https://www.googleapis.com/youtube/v3/channels"
+        key = ResponseCache.get_key(YoutubeChannelListRequest("token"), url, {"part": "snippet"})
+        self.assertEqual(key, ResponseCache.get_key(YoutubeChannelListRequest("token"), url, {"part": "snippet"}))
+        self.assertNotEqual(key, ResponseCache.get_key(YoutubeChannelListRequest("other-token"), url, {"part": "snippet"}))
+        self.assertNotEqual(key, ResponseCache.get_key(YoutubeChannelListRequest("token"), url, {"part": "statistics"}))
+        self.assertNotEqual(key, ResponseCache.get_key(YoutubeMultipleVideoDataRequest("token", []), url, {"part": "snippet"}))
+
+    def test_key_of_a_channel_survives_token_rotation(self) -> None:
+        url = "https://www.googleapis.com/youtube/v3/channels"
+        key = ResponseCache.get_key(YoutubeChannelListRequest("token", "UC123"), url, {"part": "snippet"})
+        self.assertEqual(key, ResponseCache.get_key(YoutubeChannelListRequest("rotated-token", "UC123"), url, {"part": "snippet"}))
+        self.assertNotEqual(key, ResponseCache.get_key(YoutubeChannelListRequest("token", "UC456"), url, {"part": "snippet"}))
+        self.assertNotEqual(key, ResponseCache.get_key(YoutubeChannelListRequest("token"), url, {"part": "snippet"}))
+        YoutubeChannelListRequest("token", "UC123")(self.request_manager)
+        YoutubeChannelListRequest("rotated-token", "UC123")(self.request_manager)
+        self.assertEqual(self.session.sent_headers[1]["If-None-Match"], "channel-etag-1")
+        self.assertNotIn("cache_identity", YoutubeChannelListRequest("token", "UC123").get_params()[0])
+
+    def test_shared_backends_expire_entries(self) -> None:
+        self.assertEqual(DjangoCacheBackend().timeout, DEFAULT_TIMEOUT)
+        with override_settings(DIGGER_RESPONSE_CACHE="django", DIGGER_RESPONSE_CACHE_TTL=60):
+            self.assertEqual(get_default_backend().timeout, 60)
+
+    def test_only_cacheable_structs_are_cached(self) -> None:
+        self.assertTrue(YoutubeMultipleVideoDataRequest.cacheable)
+        self.assertEqual(YoutubeMultipleVideoDataRequest.endpoint, "/videos")
+        self.assertFalse(YoutubeChannelReportRequest.cacheable)
+        key, cached, headers = self.request_manager.response_cache.prepare(YoutubeChannelReportRequest("token"), "url", {}, None)
+        self.assertIsNone(key)
+
+    def test_lru_backend_evicts_least_recently_used(self) -> None:
+        backend = LRUCacheBackend(max_entries=2)
+        backend.set("a", CachedResponse("1", None))
+        backend.set("b", CachedResponse("2", None))
+        backend.get("a")
+        backend.set("c", CachedResponse("3", None))
+        self.assertIsNone(backend.get("b"))
+        self.assertEqual(backend.get("a").etag, "1")
+
+    def test_django_backend_round_trip(self) -> None:
+        backend = DjangoCacheBackend(alias="default")
+        response = YoutubeChannelListResponse.from_data("url", 200, CHANNEL_LIST)
+        backend.set("key", CachedResponse("channel-etag-1", response))
+        cached = backend.get("key")
+        self.assertEqual(cached.etag, "channel-etag-1")
+        self.assertEqual(cached.response.channels[0].id, "UC123")
+        self.assertEqual(pickle.loads(pickle.dumps(cached)).response.channels[0].title, "Byta Tigris")
+        backend.delete("key")
+        self.assertIsNone(backend.get("key"))
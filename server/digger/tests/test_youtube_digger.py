@@ -0,0 +1,86 @@
+from threading import Barrier, BrokenBarrierError, Lock
+from typing import Dict, List
+from unittest import TestCase
+
+from digger.base.request_manager import BaseRequestManager
+from digger.youtube.digger import YoutubeDigger
+from digger.youtube.response_struct import *
+
+
+def report_payload(metric: str, rows: List[List]) -> Dict:
+    return {
+        "columnHeaders": [
+            {"name": "day", "columnType": "DIMENSION", "dataType": "STRING"},
+            {"name": metric, "columnType": "METRIC", "dataType": "INTEGER"}
+        ],
+        "rows": rows
+    }
+
+
+class StubReportRequestManager(BaseRequestManager):
+    """
+    Answers every report at once, reports listed in `failing` return an error\n
+    Requests wait on the `barrier` when given, `peak_in_flight` is the most requests seen in flight at once
+    """
+    payloads = {
+        YoutubeTimeBasedChannelReportResponse: report_payload("views", [["2022-01-15", 6]]),
+        YoutubeSubscriptionBasedChannelReportsResponse: report_payload("subscribersGained", [["2022-01-15", 3]]),
+        YoutubeDemographicsChannelReportResponse: report_payload("viewerPercentage", []),
+        YoutubeSharingServiceChannelReportResponse: report_payload("shares", [["2022-01-15", 2]]),
+    }
+
+    def __init__(self, failing: List = [], barrier: Barrier = None) -> None:
+        self.failing = failing
+        self.barrier = barrier
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.lock = Lock()
+        super().__init__({"analytics": "http://youtubeanalytics.test/v2"})
+
+    def make_request(self, request, **extra_params):
+        with self.lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            if self.barrier is not None:
+                # Only released once every report is in flight, times out when they are fetched one by one
+                self.barrier.wait()
+        except BrokenBarrierError:
+            pass
+        with self.lock:
+            self.in_flight -= 1
+        if request.response_struct in self.failing:
+            return request.response_struct.from_data(self.get_url(request), 403, {"error": {"code": 403}})
+        return request.response_struct.from_data(self.get_url(request), 200, self.payloads[request.response_struct])
+
+
+class Handle:
+    access_token = "token"
+
+
+class TestYoutubeChannelReports(TestCase):
+
+    def get_metrics(self, request_manager: StubReportRequestManager) -> YTMetrics:
+        digger = YoutubeDigger()
+        digger.request_manager = request_manager
+        return digger.get_channel_metrics(Handle())
+
+    def test_reports_are_fetched_concurrently(self) -> None:
+        barrier = Barrier(len(StubReportRequestManager.payloads), timeout=5)
+        request_manager = StubReportRequestManager(barrier=barrier)
+        metrics = self.get_metrics(request_manager)
+        self.assertFalse(barrier.broken)
+        self.assertEqual(request_manager.peak_in_flight, len(StubReportRequestManager.payloads))
+        self.assertEqual(metrics.views, {"2022-01-15": {"TOTAL": 6}})
+        self.assertEqual(metrics.subscribers_gained, {"2022-01-15": {"TOTAL": 3}})
+        self.assertEqual(metrics.shares, {"2022-01-15": {"TOTAL": 2}})
+        self.assertEqual(metrics.viewer_percentage, {})
+
+    def test_failed_time_based_report_returns_none(self) -> None:
+        self.assertIsNone(self.get_metrics(StubReportRequestManager(failing=[YoutubeTimeBasedChannelReportResponse])))
+
+    def test_failed_report_falls_back_to_collected_metrics(self) -> None:
+        metrics = self.get_metrics(StubReportRequestManager(failing=[YoutubeSubscriptionBasedChannelReportsResponse]))
+        self.assertEqual(metrics.views, {"2022-01-15": {"TOTAL": 6}})
+        self.assertEqual(metrics.subscribers_gained, {})
+        self.assertEqual(metrics.shares, {"2022-01-15": {"TOTAL": 2}})
@@ -1,6 +1,9 @@
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import sync_to_async
 from django.db.models.query import QuerySet
 from django.db.models.query_utils import Q
 from accounts.models import Account, SocialMediaHandle
+from digger.base.async_request_manager import AsyncRequestManager
 from digger.base.digger import Digger
 from digger.youtube.request_manager import YoutubeRequestManager
 from digger.youtube.request_struct import *
@@ -8,12 +11,15 @@ from digger.youtube.response_struct import *
 from insights.models import YoutubeHandleMetricModel
 from utils.datastructures import MetricTable
 from utils.errors import OAuthPlatformAuthorizationFailure
-from utils.types import Platform
+from utils.types import Platform, RollupGranularity
+import asyncio
 
 
 
 class YoutubeDigger(Digger):
-    request_manager = YoutubeRequestManager
+    metric_model = YoutubeHandleMetricModel
+    request_manager = YoutubeRequestManager()
+    async_request_manager = AsyncRequestManager.from_manager(request_manager)
 
 
     def exchange_code_for_token(self, code: str, redirect_uri: str) -> YoutubeExchangeCodeForTokenResponse:
@@ -28,7 +34,10 @@ class YoutubeDigger(Digger):
 
     def refresh_handle_token(self, social_media_handle: SocialMediaHandle) -> Union[SocialMediaHandle, None]:
         response: YoutubeRefreshTokenResponse = self.get_refresh_token(social_media_handle)
-        if response.error:
+        return self.set_refreshed_token(social_media_handle, response)
+
+    def set_refreshed_token(self, social_media_handle: SocialMediaHandle, response: YoutubeRefreshTokenResponse) -> Union[SocialMediaHandle, None]:
+        if response is None or response.error:
             return None
         social_media_handle.set_access_token(response.access_token, token_expiration_time=response.expires_in, refresh_token=social_media_handle.refresh_token)
         return social_media_handle
@@ -44,24 +53,15 @@ class YoutubeDigger(Digger):
             access_token = handle.access_token
         
         request = YoutubeChannelListRequest(access_token)
-        response: YoutubeChannelListResponse = request(self.request_manager)
-        handle_uids = handle_queryset.values_list('handle_uid', flat=True)
-        recent_uids: List[str] = []
+        handle_uids = set(handle_queryset.values_list('handle_uid', flat=True))
         channels: List[YTChannel] = []
 
-        def validate_channel_data(channel: YTChannel) -> bool:
-            if channel.id not in handle_uids and channel.id not in recent_uids:
-                recent_uids.append(channel.id)
-                return True
-            return False
-
-        while response.error == None and len(response.channels) > 0:
-            channels += list(filter(validate_channel_data, response.channels))
-            if response.next_page_token == None:
-                break
-            response: YoutubeChannelListResponse = request(self.request_manager, pageToken=response.next_page_token)
+        for channel in request.paginate(self.request_manager):
+            if channel.id not in handle_uids:
+                handle_uids.add(channel.id)
+                channels.append(channel)
         
-        handles: List[SocialMediaHandle]- list(map(lambda data: SocialMediaHandle.from_yt_channel(account, data), channels))
+        handles: List[SocialMediaHandle] = list(map(lambda data: SocialMediaHandle.from_yt_channel(account, data), channels))
         media_handles = SocialMediaHandle.objects.bulk_create(handles)
         self.attach_handles_to_linkwall(account, media_handles)
         handles += list(handle_queryset)
@@ -85,15 +85,21 @@ class YoutubeDigger(Digger):
     def get_time_based_channel_metrics(self, social_media_handle: SocialMediaHandle) -> YTMetrics:
         time_based_request = YoutubeTimeBasedChannelReportRequest(social_media_handle.access_token)
         response: YoutubeTimeBasedChannelReportResponse = time_based_request(self.request_manager)
-        if response.error is not None:
+        return self.merge_time_based_channel_metrics(response)
+
+    def merge_time_based_channel_metrics(self, response: YoutubeTimeBasedChannelReportResponse) -> YTMetrics:
+        if response is None or response.error is not None:
             return None
         return response.metrics
     
     def get_subscription_based_channel_metrics(self, social_media_handle: SocialMediaHandle, yt_metrics: YTMetrics = None) -> YTMetrics:
         subscription_request = YoutubeSubscriptionBasedChannelReportRequest(social_media_handle.access_token)
         response: YoutubeSubscriptionBasedChannelReportsResponse = subscription_request(self.request_manager)
+        return self.merge_subscription_based_channel_metrics(response, yt_metrics)
+
+    def merge_subscription_based_channel_metrics(self, response: YoutubeSubscriptionBasedChannelReportsResponse, yt_metrics: YTMetrics = None) -> YTMetrics:
         subscription_metrics = None
-        if response.error is None:
+        if response is not None and response.error is None:
             subscription_metrics = response.metrics
         else:
             return yt_metrics
@@ -107,8 +113,11 @@ class YoutubeDigger(Digger):
     def get_demography_based_channel_metrics(self, social_media_handle: SocialMediaHandle, yt_metrics: YTMetrics) -> YTMetrics:
         demographic_request = YoutubeDemographicsChannelReportRequest(social_media_handle.access_token)
         response: YoutubeDemographicsChannelReportResponse = demographic_request(self.request_manager)
+        return self.merge_demography_based_channel_metrics(response, yt_metrics)
+
+    def merge_demography_based_channel_metrics(self, response: YoutubeDemographicsChannelReportResponse, yt_metrics: YTMetrics) -> YTMetrics:
         demographic_metrics = None
-        if response.error is None:
+        if response is not None and response.error is None:
             demographic_metrics = response.metrics
         else:
             return yt_metrics
@@ -123,8 +132,11 @@ class YoutubeDigger(Digger):
     def get_sharing_service_based_channel_metrics(self, social_media_handle: SocialMediaHandle, yt_metrics: YTMetrics) -> YTMetrics:
         sharing_request = YoutubeSharingServiceChannelReportRequest(social_media_handle.access_token)
         response: YoutubeSharingServiceChannelReportResponse = sharing_request(self.request_manager)
+        return self.merge_sharing_service_based_channel_metrics(response, yt_metrics)
+
+    def merge_sharing_service_based_channel_metrics(self, response: YoutubeSharingServiceChannelReportResponse, yt_metrics: YTMetrics) -> YTMetrics:
         sharing_service_metrics = None
-        if response.error is None:
+        if response is not None and response.error is None:
             sharing_service_metrics = response.metrics
         else:
             return yt_metrics
@@ -139,12 +151,30 @@ class YoutubeDigger(Digger):
                 return social_media_handle
             return handle
         return social_media_handle
+
+    async def get_social_media_handle_with_updated_token_async(self, social_media_handle: SocialMediaHandle) -> SocialMediaHandle:
+        if not social_media_handle.is_access_token_valid:
+            request = YoutubeRefreshTokenRequest(social_media_handle.refresh_token)
+            response: YoutubeRefreshTokenResponse = await request.call_async(self.async_request_manager)
+            if (handle := await sync_to_async(self.set_refreshed_token)(social_media_handle, response)) == None:
+                return social_media_handle
+            return handle
+        return social_media_handle
     
     def update_handle_data(self, social_media_handle: SocialMediaHandle) -> SocialMediaHandle:
         social_media_handle = self.get_social_media_handle_with_updated_token(social_media_handle)
-        request = YoutubeChannelListRequest(social_media_handle.access_token)
+        request = YoutubeChannelListRequest(social_media_handle.access_token, social_media_handle.handle_uid)
         response: YoutubeChannelListResponse = request(self.request_manager)
-        if response.error == None or len(response.channels) == 0:
+        return self.set_handle_data(social_media_handle, response)
+
+    async def update_handle_data_async(self, social_media_handle: SocialMediaHandle) -> SocialMediaHandle:
+        social_media_handle = await self.get_social_media_handle_with_updated_token_async(social_media_handle)
+        request = YoutubeChannelListRequest(social_media_handle.access_token, social_media_handle.handle_uid)
+        response: YoutubeChannelListResponse = await request.call_async(self.async_request_manager)
+        return await sync_to_async(self.set_handle_data)(social_media_handle, response)
+
+    def set_handle_data(self, social_media_handle: SocialMediaHandle, response: YoutubeChannelListResponse) -> SocialMediaHandle:
+        if response is None or response.error != None or len(response.channels) == 0:
             return social_media_handle
         yt_channel: YTChannel = response.channels[0]
         social_media_handle.username = getattr(yt_channel, "title", "")
@@ -156,22 +186,75 @@ class YoutubeDigger(Digger):
         social_media_handle.save()
         return social_media_handle
     
+    def get_channel_report_requests(self, social_media_handle: SocialMediaHandle) -> List[YoutubeChannelReportRequest]:
+        """
+        Reports are independent of each other, the order here is the order they are merged in
+        """
+        access_token = social_media_handle.access_token
+        return [
+            YoutubeTimeBasedChannelReportRequest(access_token),
+            YoutubeSubscriptionBasedChannelReportRequest(access_token),
+            YoutubeDemographicsChannelReportRequest(access_token),
+            YoutubeSharingServiceChannelReportRequest(access_token)
+        ]
+
+    def merge_channel_reports(self, time_based_response: YoutubeTimeBasedChannelReportResponse,
+                              subscription_response: YoutubeSubscriptionBasedChannelReportsResponse,
+                              demographic_response: YoutubeDemographicsChannelReportResponse,
+                              sharing_response: YoutubeSharingServiceChannelReportResponse) -> Union[YTMetrics, None]:
+        """
+        Returns None if the time based report failed, any other failed report falls back to the metrics merged so far
+        """
+        metrics = self.merge_time_based_channel_metrics(time_based_response)
+        if metrics is None:
+            return None
+        metrics = self.merge_subscription_based_channel_metrics(subscription_response, yt_metrics=metrics)
+        metrics = self.merge_demography_based_channel_metrics(demographic_response, yt_metrics=metrics)
+        metrics = self.merge_sharing_service_based_channel_metrics(sharing_response, yt_metrics=metrics)
+        return metrics
+
+    def get_channel_metrics(self, social_media_handle: SocialMediaHandle) -> Union[YTMetrics, None]:
+        """
+        Fetches all channel reports concurrently on a thread pool and merges them once all have returned
+        """
+        report_requests = self.get_channel_report_requests(social_media_handle)
+        with ThreadPoolExecutor(max_workers=len(report_requests)) as executor:
+            responses = list(executor.map(lambda request: request(self.request_manager), report_requests))
+        return self.merge_channel_reports(*responses)
+
+    async def get_channel_metrics_async(self, social_media_handle: SocialMediaHandle) -> Union[YTMetrics, None]:
+        report_requests = self.get_channel_report_requests(social_media_handle)
+        responses = await asyncio.gather(*[request.call_async(self.async_request_manager) for request in report_requests])
+        return self.merge_channel_reports(*responses)
+
     def update_handle_insights(self, social_media_handle: SocialMediaHandle) -> Union[YoutubeHandleMetricModel, None]:
         social_media_handle = self.get_social_media_handle_with_updated_token(social_media_handle)
-        metrics = self.get_time_based_channel_metrics(social_media_handle)
+        metrics = self.get_channel_metrics(social_media_handle)
         if metrics is None:
             return
-        metrics = self.get_subscription_based_channel_metrics(social_media_handle, yt_metrics=metrics)
-        metrics = self.get_demography_based_channel_metrics(social_media_handle, yt_metrics=metrics)
-        metrics = self.get_sharing_service_based_channel_metrics(social_media_handle, yt_metrics=metrics)
-        ### Converting YTMetric to YoutubeHandleMetricModel
-        yt_metrics_model: YoutubeHandleMetricModel = YoutubeHandleMetricModel.objects.get_or_create(social_media_handle)
-        yt_metrics_model.set_metrics(metrics, save=True)
+        yt_metrics_model = self.set_handle_insights(social_media_handle, metrics)
 
         ### Updating handle
         self.update_handle_data(social_media_handle)
         return yt_metrics_model
 
+    async def update_handle_insights_async(self, social_media_handle: SocialMediaHandle) -> Union[YoutubeHandleMetricModel, None]:
+        social_media_handle = await self.get_social_media_handle_with_updated_token_async(social_media_handle)
+        metrics = await self.get_channel_metrics_async(social_media_handle)
+        if metrics is None:
+            return
+        yt_metrics_model = await sync_to_async(self.set_handle_insights)(social_media_handle, metrics)
+
+        ### Updating handle
+        await self.update_handle_data_async(social_media_handle)
+        return yt_metrics_model
+
+    def set_handle_insights(self, social_media_handle: SocialMediaHandle, metrics: YTMetrics) -> YoutubeHandleMetricModel:
+        ### Converting YTMetric to YoutubeHandleMetricModel
+        yt_metrics_model: YoutubeHandleMetricModel = YoutubeHandleMetricModel.objects.get_or_create(social_media_handle)
+        yt_metrics_model.set_metrics(metrics, save=True)
+        return yt_metrics_model
+
     def update_all_handles_insights(self, account: Account) -> List[YoutubeHandleMetricModel]:
         queryset: QuerySet[SocialMediaHandle] = SocialMediaHandle.objects.filter(Q(account=account) & Q(platform=Platform.Youtube) & Q(is_disabled=False))
         metrics: List[YoutubeHandleMetricModel] = []
@@ -180,21 +263,15 @@ class YoutubeDigger(Digger):
                 metrics.append(insights)
         return metrics
     
-    def calculate_platform_metric(self, account: Account, start_date: datetime = None, end_date: datetime = get_current_time()) -> MetricTable:
-        query_lookup: Q = Q(handle__account=account)
-        if start_date is not None:
-            query_lookup  &= Q(created_on__gte=start_date)
-        query_lookup &= Q(expired_on__gte=end_date)
-        handle_metric_queryset: QuerySet[YoutubeHandleMetricModel] = YoutubeHandleMetricModel.objects.filter(query_lookup)
-        return self.get_metric_table_from_queryset(handle_metric_queryset)
+    def calculate_platform_metric(self, account: Account, start_date: datetime = None, end_date: datetime = None,
+                                  granularity: str = RollupGranularity.Day, metric_names: List[str] = None) -> MetricTable:
+        query_lookup: Q = Q(account=account) & Q(platform=Platform.Youtube)
+        return self.get_metric_table_from_rollups(self.get_metric_columns(metric_names), query_lookup, start_date, end_date, granularity)
     
-    def get_handle_insights(self, handle: 'SocialMediaHandle', start_date: datetime = None, end_date: datetime = ...) -> MetricTable:
+    def get_handle_insights(self, handle: 'SocialMediaHandle', start_date: datetime = None, end_date: datetime = None,
+                            metric_names: List[str] = None) -> MetricTable:
         query_lookup: Q = Q(handle=handle)
-        if start_date is not None:
-            query_lookup  &= Q(created_on__gte=start_date)
-        query_lookup &= Q(expired_on__gte=end_date)
-        handle_metric_queryset: QuerySet[YoutubeHandleMetricModel] = YoutubeHandleMetricModel.objects.filter(query_lookup)
-        return self.get_metric_table_from_queryset(handle_metric_queryset)
+        return self.get_metric_table_from_facts(self.get_metric_columns(metric_names), query_lookup, start_date, end_date)
             
 
             
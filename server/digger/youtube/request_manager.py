@@ -1,11 +1,15 @@
+from digger.base.cache import ResponseCache
+from digger.base.rate_limiter import YoutubeRateLimiter
 from digger.base.request_manager import BaseRequestManager
 
 
 class YoutubeRequestManager(BaseRequestManager):
+    rate_limiter = YoutubeRateLimiter()
+    response_cache = ResponseCache()
 
-    def __init__(self) -> None:
+    def __init__(self, **pool_kwargs) -> None:
         super().__init__({
             "oauth":"https://oauth2.googleapis.com",
             "analytics": "https://youtubeanalytics.googleapis.com/v2",
             "default": "https://www.googleapis.com/youtube/v3"
-        })
\ No newline at end of file
+        }, **pool_kwargs)
\ No newline at end of file
@@ -31,6 +31,7 @@ class YoutubeExchangeCodeForTokenRequest(RequestStruct):
     method = RequestMethod.Post
     response_struct = YoutubeExchangeCodeForTokenResponse
     url_key = "oauth"
+    quota_cost = 0
 
     def __init__(self, code: str, redirect_uri: str) -> None:
         self.code = code
@@ -45,6 +46,7 @@ class YoutubeRefreshTokenRequest(RequestStruct):
     method = RequestMethod.Post
     response_struct = YoutubeRefreshTokenResponse
     url_key = "oauth"
+    quota_cost = 0
 
     def __init__(self, refresh_token: str) -> None:
         self.refresh_token = refresh_token
@@ -78,13 +80,16 @@ class YoutubeChannelListRequest(YoutubeAuthorizedRequest):
 
     KeywordArguments:\n
     access_token -- Channel access token \n
+    channel_id -- Id of the channel owning the token, responses are cached by it [Optional]\n
     """
     endpoint = "/channels"
+    cacheable = True
     method = RequestMethod.Get
     response_struct = YoutubeChannelListResponse
 
-    def __init__(self, access_token: str) -> None:
+    def __init__(self, access_token: str, channel_id: str = None) -> None:
         self.access_token = access_token
+        self.cache_identity = channel_id
         self.part = "snippet,topicDetails,statistics,auditDetails"
         self.mine = True
         super().__init__()
@@ -103,15 +108,19 @@ class YoutubeChannelVideoListRequest(YoutubeAuthorizedRequest):
     Keyword Arguments:\n
     access_token -- Channel Access token\n
     max_results -- Maximum number of videos required [default=10]\n
+    channel_id -- Id of the channel owning the token, responses are cached by it [Optional]\n
 
     
     """
     endpoint = "/search"
+    cacheable = True
     method = RequestMethod.Get
     response_struct = YoutubeChannelVideoListResponse
+    quota_cost = 100
 
-    def __init__(self, access_token: str, max_results: int = 10) -> None:
+    def __init__(self, access_token: str, max_results: int = 10, channel_id: str = None) -> None:
         self.access_token = access_token
+        self.cache_identity = channel_id
         self.part = "snippet"
         self.forMine = True
         self.maxResults = max_results
@@ -128,13 +137,16 @@ class YoutubeMultipleVideoDataRequest(YoutubeAuthorizedRequest):
     Keyword Arguments:\n
     access_token -- Channel Access token
     video_ids -- List of video ids
+    channel_id -- Id of the channel owning the videos, responses are cached by it [Optional]
     """
-    endpoint = '/video'
+    endpoint = '/videos'
+    cacheable = True
     method = RequestMethod.Get
     response_struct = YoutubeMultipleVideoDataResponse
 
-    def __init__(self, access_token: str, video_ids: List) -> None:
+    def __init__(self, access_token: str, video_ids: List, channel_id: str = None) -> None:
         self.access_token = access_token
+        self.cache_identity = channel_id
         self.id = ",".join(video_ids)
         self.part = "snippet,statistics,topicDetails,status"
         super().__init__()
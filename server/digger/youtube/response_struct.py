@@ -43,11 +43,20 @@ class YoutubeChannelListResponse(ResponseStruct):
             self.channels = list(map(lambda data: YTChannel(**data), items))
         super().__init__(url, status_code, **kwargs)
 
+    def get_items(self) -> List[YTChannel]:
+        return self.channels
+
+    def get_next_page_params(self) -> Union[Dict[str, str], None]:
+        if self.next_page_token is None:
+            return None
+        return {"pageToken": self.next_page_token}
+
 
 class YoutubeChannelVideoListResponse(ResponseStruct):
 
     def __init__(self, url: str, status_code: int, error=None, nextPageToken: str = None, items: List[Dict] = None,**kwargs) -> None:
         self.error = error
+        self.next_page_token = nextPageToken
         self.items: List[YTVideo] = None
         if error == None:
             self.items = []
@@ -56,6 +65,14 @@ class YoutubeChannelVideoListResponse(ResponseStruct):
                 self.items.append(YTVideo(video_id, video["snippet"]))
         super().__init__(url, status_code, **kwargs)
 
+    def get_items(self) -> List[YTVideo]:
+        return self.items or []
+
+    def get_next_page_params(self) -> Union[Dict[str, str], None]:
+        if self.next_page_token is None:
+            return None
+        return {"pageToken": self.next_page_token}
+
 
 class YoutubeMultipleVideoDataResponse(ResponseStruct):
 
@@ -70,6 +87,14 @@ class YoutubeMultipleVideoDataResponse(ResponseStruct):
                 self.items.append(YTVideo(**video))
         super().__init__(url, status_code, **kwargs)
 
+    def get_items(self) -> List[YTVideo]:
+        return self.items or []
+
+    def get_next_page_params(self) -> Union[Dict[str, str], None]:
+        if self.next_page_token is None:
+            return None
+        return {"pageToken": self.next_page_token}
+
 class YoutubeChannelReportResponse(ResponseStruct):
 
     def __init__(self, url: str, status_code: int, error = None, columnHeaders: List[Dict[str, str]] = [], rows: List[List[Union[str, int]]] = [], **kwargs) -> None:
@@ -0,0 +1,58 @@
+from typing import Any, Dict, List, Union
+from django.apps import apps
+from django.db import models
+from django.db.models.fields.json import KeyTransform
+
+Number = Union[int, float]
+DayDimensions = Dict[str, Union[Dict[str, Number], List[List[Number]]]]
+
+
+class DimensionJSONField(models.JSONField):
+    """
+    JSONField of {day: {dimension: value}} stored as {day: [[dimension_id, ...], [value, ...]]}\n
+    Dimension labels like city names or M.age18-24 are interned in MetricDimension, every row only holds their ids\n
+    Days are encoded on save and decoded on load, days still stored as {dimension: value} are read as they are\n
+    Only saves intern new labels, lookups resolve the labels already interned and never write
+    """
+
+    @staticmethod
+    def get_dimension_manager() -> models.Manager:
+        return apps.get_model("insights", "MetricDimension").objects
+
+    def from_db_value(self, value: Any, expression: Any, connection: Any) -> Any:
+        value = super().from_db_value(value, expression, connection)
+        if isinstance(expression, KeyTransform):
+            return value
+        return self.decode(value)
+
+    def get_prep_value(self, value: Any) -> Any:
+        # Lookup values, labels which are not interned are encoded as null ids and match no stored day
+        return super().get_prep_value(self.encode(value, intern=False))
+
+    def get_db_prep_save(self, value: Any, connection: Any) -> Any:
+        return super().get_db_prep_save(self.encode(value), connection)
+
+    def encode(self, value: DayDimensions, intern: bool = True) -> DayDimensions:
+        if not isinstance(value, dict) or len(value) == 0:
+            return value
+        labels = {str(label) for dimensions in value.values() if isinstance(dimensions, dict) for label in dimensions}
+        if len(labels) == 0:
+            return value
+        manager = self.get_dimension_manager()
+        ids = manager.get_ids(labels) if intern else manager.get_existing_ids(labels)
+        return {
+            day: [[ids.get(str(label)) for label in dimensions], list(dimensions.values())] if isinstance(dimensions, dict) else dimensions
+            for day, dimensions in value.items()
+        }
+
+    def decode(self, value: DayDimensions) -> DayDimensions:
+        if not isinstance(value, dict) or len(value) == 0:
+            return value
+        dimension_ids = {dimension_id for dimensions in value.values() if isinstance(dimensions, list) for dimension_id in dimensions[0]}
+        if len(dimension_ids) == 0:
+            return value
+        labels = self.get_dimension_manager().get_labels(dimension_ids)
+        return {
+            day: dict(zip((labels[dimension_id] for dimension_id in dimensions[0]), dimensions[1])) if isinstance(dimensions, list) else dimensions
+            for day, dimensions in value.items()
+        }
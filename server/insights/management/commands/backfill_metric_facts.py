@@ -0,0 +1,38 @@
+from datetime import date
+from typing import Dict, List, Set, Tuple, Type
+from django.core.management.base import BaseCommand
+from insights.models import HandleMetricFact, InstagramHandleMetricModel, SocialMediaHandleMetrics, YoutubeHandleMetricModel
+from utils.types import Platform
+
+
+class Command(BaseCommand):
+    help = "Backfills HandleMetricFact, HandleMetricMonthlyTotal and PlatformMetricRollup from the weekly JSON metric models"
+
+    models = {
+        Platform.Instagram: InstagramHandleMetricModel,
+        Platform.Youtube: YoutubeHandleMetricModel,
+    }
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--platform", choices=list(self.models.keys()), help="Only backfill the metrics of the platform")
+        parser.add_argument("--chunk-size", type=int, default=500, help="Weekly rows read per database round-trip")
+
+    def handle(self, *args, **options) -> None:
+        platforms: List[str] = [options["platform"]] if options["platform"] else list(self.models.keys())
+        for platform in platforms:
+            model: Type[SocialMediaHandleMetrics] = self.models[platform]
+            rows, facts = 0, 0
+            written: Dict[int, Tuple[Set[date], Set[str]]] = {}
+            # Oldest first, so the latest week holding a day writes its facts last
+            queryset = model.objects.select_related("handle").order_by("created_on", "id")
+            for metric in queryset.iterator(chunk_size=options["chunk_size"]):
+                metric_facts: List[HandleMetricFact] = HandleMetricFact.objects.replace_for_metric(metric)
+                days, metric_names = written.setdefault(metric.handle.account_id, (set(), set()))
+                days.update(fact.day for fact in metric_facts)
+                metric_names.update(fact.metric for fact in metric_facts)
+                facts += len(metric_facts)
+                rows += 1
+            # Rollups are summed once per account, after every fact of the account is written
+            for account_id, (days, metric_names) in written.items():
+                model.refresh_rollups(account_id, platform, days, metric_names)
+            self.stdout.write(f"{platform}: {facts} facts from {rows} weekly rows, rollups of {len(written)} accounts")
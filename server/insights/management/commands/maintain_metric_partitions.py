@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from insights.tasks import maintain_metric_partitions
+from utils.types import PartitionRetentionAction
+
+
+class Command(BaseCommand):
+    help = "Creates the coming monthly partitions of the weekly metric tables and applies the retention policy to the old ones"
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--months-ahead", type=int, default=settings.HANDLE_METRICS_PARTITIONS_AHEAD,
+                            help="Months after the current one which must have a partition")
+        parser.add_argument("--retention-months", type=int, default=settings.HANDLE_METRICS_RETENTION_MONTHS,
+                            help="Months of rows kept, 0 keeps every month")
+        parser.add_argument("--action", choices=[PartitionRetentionAction.Archive, PartitionRetentionAction.Drop],
+                            default=settings.HANDLE_METRICS_RETENTION_ACTION, help="What happens to the partitions past the retention")
+        parser.add_argument("--dry-run", action="store_true", help="Only print the partitions which would be created and expired")
+
+    def handle(self, *args, **options) -> None:
+        report = maintain_metric_partitions(options["months_ahead"], options["retention_months"], options["action"], options["dry_run"])
+        if report is None:
+            self.stdout.write("Partitioning is only supported on PostgreSQL, nothing to do")
+            return
+        for table, changes in report.items():
+            self.stdout.write(f"{table}: created {', '.join(changes['created']) or '-'}; {options['action']} {', '.join(changes['expired']) or '-'}")
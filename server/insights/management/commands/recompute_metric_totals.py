@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from insights.models import YoutubeHandleMetricModel
+from utils.types import Platform
+
+
+class Command(BaseCommand):
+    help = ("Recomputes the YouTube totals kept as a single number (shares, viewer_percentage, ...) from the days of every weekly row, "
+            "rows written before the totals were kept incrementally hold inflated totals")
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--chunk-size", type=int, default=500, help="Weekly rows read per database round-trip")
+        parser.add_argument("--dry-run", action="store_true", help="Only count the rows whose totals are wrong")
+
+    def handle(self, *args, **options) -> None:
+        rows, corrected = 0, 0
+        queryset = YoutubeHandleMetricModel.objects.select_related("handle").order_by("id")
+        for metric in queryset.iterator(chunk_size=options["chunk_size"]):
+            rows += 1
+            if not metric.recompute_single_totals():
+                continue
+            corrected += 1
+            if not options["dry_run"]:
+                metric.save()
+        action = "would be corrected" if options["dry_run"] else "corrected"
+        self.stdout.write(f"{Platform.Youtube}: {corrected} of {rows} weekly rows {action}")
@@ -1,12 +1,23 @@
-from django.db import models
+from django.db import models, transaction
+from functools import reduce
+from operator import or_
+from datetime import date, timedelta
+from django.db.models import Avg, F, Sum
+from django.db.models.functions import TruncMonth, TruncWeek
 from django.db.models.query import QuerySet
-from typing import  Any, MutableMapping, Optional, Tuple, Union
+from typing import  Any, Dict, List, MutableMapping, Optional, Set, Tuple, Union
 
 from django.db.models.query_utils import Q
-from accounts.models import SocialMediaHandle
+from accounts.models import Account, SocialMediaHandle
 
-from utils import get_current_time, get_handle_metrics_expire_time, merge_metric
-from utils.types import Platform
+from utils import get_current_time, get_handle_metrics_expire_time, merge_metric, string_to_date
+from utils.datastructures import MetricTable, Number
+from utils.types import Platform, RollupGranularity
+from insights.partitions import add_months
+
+
+# Lifetime of a weekly metric row, expired_on - created_on
+METRICS_WEEK = timedelta(days=7)
 
 
 class SocialMediaHandleMetricsManager(models.Manager):
@@ -21,11 +32,12 @@ class SocialMediaHandleMetricsManager(models.Manager):
             _platform = kwargs["platform"]
         elif "platform" not in kwargs and _platform is None:
             _platform = handle.platform
+        created_on = get_current_time()
         metric: models.Model = self.model(
             handle=handle,
             platform=_platform,
-            created_on=get_current_time(),
-            expired_on=get_handle_metrics_expire_time(),
+            created_on=created_on,
+            expired_on=get_handle_metrics_expire_time(created_on),
             meta_data={}
         )
         metric = self.before_create(metric, **kwargs)
@@ -46,7 +58,9 @@ class SocialMediaHandleMetricsManager(models.Manager):
         """
         Returns the latest and active social media metric
         """
-        queryset: QuerySet = self.filter(Q(handle = handle) & Q(expired_on__gte=get_current_time()))
+        now = get_current_time()
+        # The created_on bound is implied by expired_on, it lets Postgres skip the older monthly partitions
+        queryset: QuerySet = self.filter(Q(handle = handle) & Q(expired_on__gte=now) & Q(created_on__gte=now - METRICS_WEEK))
         if queryset.exists():
             return queryset.first()
         return None
@@ -58,7 +72,8 @@ class SocialMediaHandleMetricsManager(models.Manager):
         return self.create(handle=handle, **kwargs)
     
     def retain_old_metric_total(self, metric: models.Model) -> models.Model:
-        queryset: QuerySet = self.filter(Q(handle=metric.handle) & Q(expired_on__lte=metric.created_on)).order_by('-expired_on')
+        queryset: QuerySet = self.filter(Q(handle=metric.handle) & Q(expired_on__lte=metric.created_on)
+                                         & Q(created_on__lte=metric.created_on - METRICS_WEEK)).order_by('-expired_on')
         if queryset.exists():
             old_metric: models.Model = queryset.first()
             totals = {}
@@ -105,4 +120,250 @@ class YoutubeHandleMetricsManager(SocialMediaHandleMetricsManager):
 
 
 
+class HandleMetricFactManager(models.Manager):
+
+    def from_metric(self, metric: models.Model, metric_days: Dict[str, Set[str]] = None) -> List[models.Model]:
+        """
+        Flattens the {day: {dimension: value}} JSON fields of a weekly metric model into facts\n
+        Only the days of metric_days {metric_name: day_strs} are flattened when given
+        """
+        facts: List[models.Model] = []
+        for metric_name in (metric.get_fact_metric_names() if metric_days is None else metric_days.keys()):
+            for day_str, dimensions in (getattr(metric, metric_name, None) or {}).items():
+                if metric_days is not None and day_str not in metric_days[metric_name]:
+                    continue
+                if not isinstance(dimensions, dict):
+                    continue
+                day = string_to_date(day_str).date()
+                for dimension, value in dimensions.items():
+                    if isinstance(value, bool) or not isinstance(value, (int, float)):
+                        continue
+                    facts.append(self.model(handle_id=metric.handle_id, platform=metric.platform, day=day,
+                                            metric=metric_name, dimension=str(dimension), value=value))
+        return facts
+
+    def replace_for_metric(self, metric: models.Model, metric_days: Dict[str, Set[str]] = None) -> List[models.Model]:
+        """
+        Rewrites the facts of the days and metrics held by the weekly metric model, the latest write of a day wins\n
+        Only the days of metric_days {metric_name: day_strs} are rewritten when given, e.g the days merged since the last save\n
+        Returns the facts written
+        """
+        facts = self.from_metric(metric, metric_days)
+        if metric_days is None:
+            metric_days = {}
+            for fact in facts:
+                metric_days.setdefault(fact.metric, set()).add(fact.day)
+        else:
+            metric_days = {metric_name: {string_to_date(day_str).date() for day_str in day_strs} for metric_name, day_strs in metric_days.items()}
+        days = set().union(*metric_days.values())
+        if len(days) == 0:
+            return facts
+        # Dimensions dropped from a rewritten day are deleted too, the lookup is on the (metric, day) pairs rather than on the new facts
+        lookup = reduce(or_, (Q(metric=metric_name) & Q(day__in=metric_dates) for metric_name, metric_dates in metric_days.items()))
+        from insights.models import HandleMetricMonthlyTotal
+        with transaction.atomic():
+            self.filter(Q(handle_id=metric.handle_id) & lookup).delete()
+            self.bulk_create(facts, batch_size=1000)
+            HandleMetricMonthlyTotal.objects.refresh(metric.handle_id, days)
+        return facts
+
+    def get_daily_totals(self, lookup: Q) -> QuerySet:
+        """
+        Sums the facts matching the lookup in the database, GROUP BY day, metric, dimension\n
+        Returns queryset of {"day", "metric", "dimension", "total"} ordered by day
+        """
+        return self.filter(lookup).values("day", "metric", "dimension").annotate(total=Sum("value")).order_by("day")
+
+    def get_totals(self, lookup: Q, before: date) -> Dict[str, Number]:
+        """
+        Sums the facts matching the lookup of every day before `before` as flattened columns e.g IMPRESSIONS_TOTAL\n
+        Whole months are read from HandleMetricMonthlyTotal, only the facts of the month of `before` are summed
+        """
+        from insights.models import HandleMetricMonthlyTotal
+        month_start = before.replace(day=1)
+        month_totals = HandleMetricMonthlyTotal.objects.get_monthly_totals(lookup, month_start)
+        day_totals = (self.filter(lookup & Q(day__gte=month_start) & Q(day__lt=before))
+                      .values("metric", "dimension").annotate(total=Sum("value")).order_by())
+        totals: Dict[str, Number] = {}
+        for row in list(month_totals) + list(day_totals):
+            key = f"{row['metric'].upper()}_{row['dimension']}"
+            totals[key] = totals.get(key, 0) + row["total"]
+        return {key: MetricTable.to_number(total) for key, total in totals.items()}
+
+
+class HandleMetricMonthlyTotalManager(models.Manager):
+
+    def refresh(self, handle_id: int, days: Set[date]) -> None:
+        """
+        Rewrites the totals of the months holding the days from the facts of the handle, a range scan of each month
+        """
+        from insights.models import HandleMetricFact
+        months = {day.replace(day=1) for day in days}
+        with transaction.atomic():
+            self.filter(handle_id=handle_id, month__in=months).delete()
+            for month in months:
+                totals = (HandleMetricFact.objects.filter(handle_id=handle_id, day__gte=month, day__lt=add_months(month, 1))
+                          .values("platform", "metric", "dimension").annotate(total=Sum("value")).order_by())
+                self.bulk_create([self.model(handle_id=handle_id, platform=row["platform"], month=month, metric=row["metric"],
+                                             dimension=row["dimension"], value=row["total"]) for row in totals], batch_size=1000)
+
+    def get_monthly_totals(self, lookup: Q, before: date) -> QuerySet:
+        """
+        Returns queryset of {"metric", "dimension", "total"} summed over the months before the month `before`
+        """
+        return self.filter(lookup & Q(month__lt=before)).values("metric", "dimension").annotate(total=Sum("value")).order_by()
+
+
+
+class PlatformMetricRollupManager(models.Manager):
+    period_truncs = {RollupGranularity.Week: TruncWeek, RollupGranularity.Month: TruncMonth}
+
+    @staticmethod
+    def get_period_start(day: date, granularity: str) -> date:
+        if granularity == RollupGranularity.Week:
+            return day - timedelta(days=day.weekday())
+        if granularity == RollupGranularity.Month:
+            return day.replace(day=1)
+        return day
+
+    @staticmethod
+    def get_period_end(period_start: date, granularity: str) -> date:
+        """
+        First day after the period
+        """
+        if granularity == RollupGranularity.Week:
+            return period_start + timedelta(days=7)
+        if granularity == RollupGranularity.Month:
+            return add_months(period_start, 1)
+        return period_start + timedelta(days=1)
+
+    def refresh(self, account_id: int, platform: str, days: Set[date], metric_names: Set[str], daily_totals: QuerySet,
+                non_additive_metrics: Set[str] = None) -> None:
+        """
+        Rewrites the rollups of the periods holding the days, only for the given metrics\n
+        The day tier is written from daily_totals, week and month tiers are summed from the day tier,
+        the non additive metrics e.g rates and averages are averaged over the days of the period instead\n
+
+        Keyword Arguments:\n
+        account_id -- Account of the handles\n
+        platform -- Social Media Platform\n
+        days -- Days written since the last refresh\n
+        metric_names -- Metrics written since the last refresh\n
+        daily_totals -- HandleMetricFact.objects.get_daily_totals of the account, platform, days and metrics\n
+        non_additive_metrics -- Metrics which can't be summed over days, NON_ADDITIVE_METRICS of the platform metric model [Optional]\n
+
+        Refreshes of the same account are serialized on its Account row, concurrent metric saves of its handles
+        would otherwise insert the same rollups between each other's delete and insert\n
+        """
+        if len(days) == 0:
+            return
+        non_additive_metrics = set(metric_names) & set(non_additive_metrics or [])
+        aggregates = [(Sum, set(metric_names) - non_additive_metrics), (Avg, non_additive_metrics)]
+        lookup: Q = Q(account_id=account_id) & Q(platform=platform) & Q(metric__in=metric_names)
+        with transaction.atomic():
+            list(Account.objects.select_for_update().filter(id=account_id).values_list("id", flat=True))
+            self.filter(lookup & Q(granularity=RollupGranularity.Day) & Q(period_start__in=days)).delete()
+            self.bulk_create([self.model(
+                account_id=account_id,
+                platform=platform,
+                granularity=RollupGranularity.Day,
+                period_start=row["day"],
+                metric=row["metric"],
+                dimension=row["dimension"],
+                value=row["total"]
+            ) for row in daily_totals], batch_size=1000)
+            for granularity, trunc in self.period_truncs.items():
+                periods = {self.get_period_start(day, granularity) for day in days}
+                self.filter(lookup & Q(granularity=granularity) & Q(period_start__in=periods)).delete()
+                # The range on the raw column bounds the index scan, the truncated period can't use the index
+                day_range = Q(period_start__gte=min(periods)) & Q(period_start__lt=self.get_period_end(max(periods), granularity))
+                for aggregate, aggregate_metrics in aggregates:
+                    if len(aggregate_metrics) == 0:
+                        continue
+                    period_totals: QuerySet = (self.filter(lookup & Q(metric__in=aggregate_metrics) & Q(granularity=RollupGranularity.Day) & day_range)
+                                               .annotate(period=trunc("period_start"))
+                                               .filter(period__in=periods)
+                                               .values("period", "metric", "dimension")
+                                               .annotate(total=aggregate("value")))
+                    self.bulk_create([self.model(
+                        account_id=account_id,
+                        platform=platform,
+                        granularity=granularity,
+                        period_start=row["period"],
+                        metric=row["metric"],
+                        dimension=row["dimension"],
+                        value=row["total"]
+                    ) for row in period_totals], batch_size=1000)
+
+    def get_period_totals(self, lookup: Q, granularity: str = RollupGranularity.Day, start_date: date = None, end_date: date = None) -> QuerySet:
+        """
+        Returns queryset of {"day", "metric", "dimension", "total"} of the periods between the dates, ordered by period\n
+        `day` is the first day of the period
+        """
+        lookup &= Q(granularity=granularity)
+        if start_date is not None:
+            lookup &= Q(period_start__gte=self.get_period_start(start_date, granularity))
+        if end_date is not None:
+            lookup &= Q(period_start__lte=end_date)
+        return (self.filter(lookup).order_by("period_start")
+                .values("metric", "dimension", day=F("period_start"), total=F("value")))
+
+    def get_totals(self, lookup: Q, before: date) -> Dict[str, Number]:
+        """
+        Sums every day before `before` as flattened columns e.g IMPRESSIONS_TOTAL\n
+        Whole months are read from the month tier, the rest of the month from the day tier
+        """
+        month_start = before.replace(day=1)
+        lookup &= ((Q(granularity=RollupGranularity.Month) & Q(period_start__lt=month_start))
+                   | (Q(granularity=RollupGranularity.Day) & Q(period_start__gte=month_start) & Q(period_start__lt=before)))
+        totals = self.filter(lookup).values("metric", "dimension").annotate(total=Sum("value")).order_by()
+        return {f"{row['metric'].upper()}_{row['dimension']}": MetricTable.to_number(row["total"]) for row in totals}
+
+
+
+class MetricDimensionManager(models.Manager):
+    """
+    Interns dimension labels, ids and labels are cached for the lifetime of the process\n
+    Ids are never reused, so an id is cached as soon as it is read,
+    a new label is only cached once its row is committed
+    """
+    label_ids: Dict[str, int] = {}
+    id_labels: Dict[int, str] = {}
+
+    def cache(self, label_ids: Dict[str, int]) -> None:
+        self.label_ids.update(label_ids)
+
+    def get_existing_ids(self, labels: Set[str]) -> Dict[str, int]:
+        """
+        Returns {label: id} of the labels already interned, nothing is created
+        """
+        ids = {label: self.label_ids[label] for label in labels if label in self.label_ids}
+        missing = labels - ids.keys()
+        if len(missing) == 0:
+            return ids
+        existing = dict(self.filter(label__in=missing).values_list("label", "id"))
+        self.id_labels.update({dimension_id: label for label, dimension_id in existing.items()})
+        # Read rows may belong to a transaction which is rolled back, they are cached like the created ones
+        transaction.on_commit(lambda: self.cache(existing))
+        return ids | existing
+
+    def get_ids(self, labels: Set[str]) -> Dict[str, int]:
+        """
+        Returns {label: id}, creating the labels which are not interned yet
+        """
+        ids = self.get_existing_ids(labels)
+        missing = labels - ids.keys()
+        if len(missing) == 0:
+            return ids
+        self.bulk_create([self.model(label=label) for label in missing], ignore_conflicts=True)
+        created = dict(self.filter(label__in=missing).values_list("label", "id"))
+        self.id_labels.update({dimension_id: label for label, dimension_id in created.items()})
+        # Runs at once outside of a transaction, a rolled back label would leave a dangling id in the cache
+        transaction.on_commit(lambda: self.cache(created))
+        return ids | created
 
+    def get_labels(self, dimension_ids: Set[int]) -> Dict[int, str]:
+        missing = dimension_ids - self.id_labels.keys()
+        if len(missing) > 0:
+            self.id_labels.update(self.filter(id__in=missing).values_list("id", "label"))
+        return {dimension_id: self.id_labels[dimension_id] for dimension_id in dimension_ids}
@@ -0,0 +1,35 @@
+# Generated by Django 4.0 on 2026-10-18 13:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_socialmediahandle_is_disabled'),
+        ('insights', '0002_instagramhandlemetricmodel_meta_data'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HandleMetricFact',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('platform', models.CharField(max_length=20)),
+                ('day', models.DateField()),
+                ('metric', models.CharField(max_length=64)),
+                ('dimension', models.CharField(default='TOTAL', max_length=255)),
+                ('value', models.FloatField(default=0)),
+                ('handle', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='metric_facts', to='accounts.socialmediahandle')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='handlemetricfact',
+            index=models.Index(fields=['metric', 'day'], name='metric_fact_metric_day_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='handlemetricfact',
+            constraint=models.UniqueConstraint(fields=('handle', 'day', 'metric', 'dimension'), name='unique_handle_metric_fact'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.0 on 2026-10-18 13:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_socialmediahandle_is_disabled'),
+        ('insights', '0003_handlemetricfact'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlatformMetricRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('platform', models.CharField(max_length=20)),
+                ('granularity', models.CharField(max_length=5)),
+                ('period_start', models.DateField()),
+                ('metric', models.CharField(max_length=64)),
+                ('dimension', models.CharField(default='TOTAL', max_length=255)),
+                ('value', models.FloatField(default=0)),
+                ('account', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='metric_rollups', to='accounts.account')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='platformmetricrollup',
+            constraint=models.UniqueConstraint(fields=('account', 'platform', 'granularity', 'period_start', 'metric', 'dimension'), name='unique_platform_metric_rollup'),
+        ),
+    ]
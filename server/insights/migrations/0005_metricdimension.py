@@ -0,0 +1,69 @@
+# Generated by Django 4.0 on 2026-10-18 13:50
+
+from django.db import migrations, models
+import insights.fields
+
+
+DIMENSION_FIELDS = {
+    "instagramhandlemetricmodel": ["audience_city", "audience_country", "audience_gender_age"],
+    "youtubehandlemetricmodel": ["viewer_percentage"],
+}
+
+
+def rewrite_dimension_fields(apps, encode: bool) -> None:
+    """
+    Rewrites every row, the fields are read through DimensionJSONField which reads both layouts
+    """
+    for model_name, field_names in DIMENSION_FIELDS.items():
+        model = apps.get_model("insights", model_name)
+        for row in model.objects.only("id", *field_names).iterator(chunk_size=500):
+            values = {field_name: getattr(row, field_name) for field_name in field_names}
+            if not encode:
+                values = {field_name: models.Value(value, output_field=models.JSONField()) for field_name, value in values.items()}
+            model.objects.filter(id=row.id).update(**values)
+
+
+def encode_dimension_fields(apps, schema_editor) -> None:
+    rewrite_dimension_fields(apps, encode=True)
+
+
+def decode_dimension_fields(apps, schema_editor) -> None:
+    rewrite_dimension_fields(apps, encode=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('insights', '0004_platformmetricrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MetricDimension',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('label', models.CharField(max_length=255, unique=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='instagramhandlemetricmodel',
+            name='audience_city',
+            field=insights.fields.DimensionJSONField(default=dict),
+        ),
+        migrations.AlterField(
+            model_name='instagramhandlemetricmodel',
+            name='audience_country',
+            field=insights.fields.DimensionJSONField(default=dict),
+        ),
+        migrations.AlterField(
+            model_name='instagramhandlemetricmodel',
+            name='audience_gender_age',
+            field=insights.fields.DimensionJSONField(default=dict),
+        ),
+        migrations.AlterField(
+            model_name='youtubehandlemetricmodel',
+            name='viewer_percentage',
+            field=insights.fields.DimensionJSONField(default=dict),
+        ),
+        migrations.RunPython(encode_dimension_fields, decode_dimension_fields),
+    ]
@@ -0,0 +1,72 @@
+from django.db import migrations
+from insights.partitions import add_months
+from utils import get_current_time
+
+
+PARTITIONED_TABLES = ["insights_instagramhandlemetricmodel", "insights_youtubehandlemetricmodel"]
+MONTHS_AHEAD = 3
+
+
+def partition_table(cursor, table: str) -> None:
+    """
+    Moves the rows of the table into a table partitioned by month of created_on\n
+    The primary key of a partitioned table must hold the partition key, so it becomes (id, created_on)
+    """
+    cursor.execute(f'ALTER TABLE "{table}" RENAME TO "{table}_unpartitioned"')
+    cursor.execute(f'CREATE TABLE "{table}" (LIKE "{table}_unpartitioned" INCLUDING DEFAULTS) PARTITION BY RANGE (created_on)')
+    cursor.execute(f'ALTER TABLE "{table}" ADD CONSTRAINT "{table}_partitioned_pkey" PRIMARY KEY (id, created_on)')
+    cursor.execute(f'ALTER SEQUENCE "{table}_id_seq" OWNED BY "{table}".id')
+    cursor.execute(f'ALTER TABLE "{table}" ADD CONSTRAINT "{table}_partitioned_handle_fk" FOREIGN KEY (handle_id) '
+                   f'REFERENCES "accounts_socialmediahandle" (id) DEFERRABLE INITIALLY DEFERRED')
+    cursor.execute(f'CREATE INDEX "{table}_handle_expired_idx" ON "{table}" (handle_id, expired_on)')
+    cursor.execute(f'CREATE TABLE "{table}_default" PARTITION OF "{table}" DEFAULT')
+    cursor.execute(f'SELECT MIN(created_on) FROM "{table}_unpartitioned"')
+    oldest = cursor.fetchone()[0]
+    month = add_months((oldest or get_current_time()).date(), 0)
+    last_month = add_months(get_current_time().date(), MONTHS_AHEAD)
+    while month <= last_month:
+        cursor.execute(f'CREATE TABLE "{table}_p{month:%Y_%m}" PARTITION OF "{table}" '
+                       f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')")
+        month = add_months(month, 1)
+    cursor.execute(f'INSERT INTO "{table}" SELECT * FROM "{table}_unpartitioned"')
+    cursor.execute(f'DROP TABLE "{table}_unpartitioned"')
+
+
+def unpartition_table(cursor, table: str) -> None:
+    cursor.execute(f'ALTER TABLE "{table}" RENAME TO "{table}_partitioned"')
+    cursor.execute(f'CREATE TABLE "{table}" (LIKE "{table}_partitioned" INCLUDING DEFAULTS)')
+    cursor.execute(f'ALTER TABLE "{table}" ADD PRIMARY KEY (id)')
+    cursor.execute(f'ALTER SEQUENCE "{table}_id_seq" OWNED BY "{table}".id')
+    cursor.execute(f'ALTER TABLE "{table}" ADD CONSTRAINT "{table}_handle_fk" FOREIGN KEY (handle_id) '
+                   f'REFERENCES "accounts_socialmediahandle" (id) DEFERRABLE INITIALLY DEFERRED')
+    cursor.execute(f'CREATE INDEX "{table}_handle_id_idx" ON "{table}" (handle_id)')
+    cursor.execute(f'INSERT INTO "{table}" SELECT * FROM "{table}_partitioned"')
+    cursor.execute(f'DROP TABLE "{table}_partitioned" CASCADE')
+
+
+def partition_tables(apps, schema_editor) -> None:
+    # Declarative partitioning is Postgres only, other backends keep the plain tables
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for table in PARTITIONED_TABLES:
+            partition_table(cursor, table)
+
+
+def unpartition_tables(apps, schema_editor) -> None:
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for table in PARTITIONED_TABLES:
+            unpartition_table(cursor, table)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('insights', '0005_metricdimension'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_tables, unpartition_tables),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 4.0 on 2026-10-18 13:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+PARTITIONED_TABLES = ["insights_instagramhandlemetricmodel", "insights_youtubehandlemetricmodel"]
+
+
+def drop_partitioned_handle_indexes(apps, schema_editor) -> None:
+    """
+    The (handle, expired_on) indexes created with the Postgres partitions are replaced by the model indexes
+    """
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for table in PARTITIONED_TABLES:
+            cursor.execute(f'DROP INDEX IF EXISTS "{table}_handle_expired_idx"')
+
+
+def create_partitioned_handle_indexes(apps, schema_editor) -> None:
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for table in PARTITIONED_TABLES:
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS "{table}_handle_expired_idx" ON "{table}" (handle_id, expired_on)')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0007_socialmediahandle_active_indexes'),
+        ('insights', '0006_partition_handle_metrics'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_partitioned_handle_indexes, create_partitioned_handle_indexes),
+        migrations.AlterField(
+            model_name='instagramhandlemetricmodel',
+            name='handle',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='accounts.socialmediahandle'),
+        ),
+        migrations.AlterField(
+            model_name='youtubehandlemetricmodel',
+            name='handle',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='accounts.socialmediahandle'),
+        ),
+        migrations.AddIndex(
+            model_name='instagramhandlemetricmodel',
+            index=models.Index(fields=['handle', '-expired_on'], name='ig_metric_handle_expired_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='youtubehandlemetricmodel',
+            index=models.Index(fields=['handle', '-expired_on'], name='yt_metric_handle_expired_idx'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.0 on 2026-10-18 14:44
+
+from django.db import migrations, models
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth
+import django.db.models.deletion
+
+
+def build_monthly_totals(apps, schema_editor) -> None:
+    """
+    Sums the existing facts of every handle by month
+    """
+    HandleMetricFact = apps.get_model("insights", "HandleMetricFact")
+    HandleMetricMonthlyTotal = apps.get_model("insights", "HandleMetricMonthlyTotal")
+    totals = (HandleMetricFact.objects.annotate(month=TruncMonth("day"))
+              .values("handle_id", "platform", "month", "metric", "dimension").annotate(total=Sum("value")).order_by())
+    batch = []
+    for row in totals.iterator(chunk_size=2000):
+        batch.append(HandleMetricMonthlyTotal(handle_id=row["handle_id"], platform=row["platform"], month=row["month"],
+                                              metric=row["metric"], dimension=row["dimension"], value=row["total"]))
+        if len(batch) >= 2000:
+            HandleMetricMonthlyTotal.objects.bulk_create(batch)
+            batch = []
+    HandleMetricMonthlyTotal.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0007_socialmediahandle_active_indexes'),
+        ('insights', '0007_handle_metric_expired_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HandleMetricMonthlyTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('platform', models.CharField(max_length=20)),
+                ('month', models.DateField()),
+                ('metric', models.CharField(max_length=64)),
+                ('dimension', models.CharField(default='TOTAL', max_length=255)),
+                ('value', models.FloatField(default=0)),
+                ('handle', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='metric_monthly_totals', to='accounts.socialmediahandle')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='handlemetricmonthlytotal',
+            constraint=models.UniqueConstraint(fields=('handle', 'month', 'metric', 'dimension'), name='unique_handle_metric_monthly_total'),
+        ),
+        migrations.RunPython(build_monthly_totals, migrations.RunPython.noop),
+    ]
@@ -1,12 +1,14 @@
-from typing import Dict, List, Union
-from django.db import models
+from datetime import date
+from typing import Dict, Iterable, List, Set, Union
+from django.db import models, transaction
 
-from accounts.models import SocialMediaHandle
+from accounts.models import Account, SocialMediaHandle
 from digger.youtube.types import YTMetrics
-from insights.managers import InstagramHandleMetricsManager, SocialMediaHandleMetricsManager, YoutubeHandleMetricsManager
-from utils import DATE_FORMAT, get_current_time, get_handle_metrics_expire_time, merge_metric, subtract_merge
+from insights.fields import DimensionJSONField
+from insights.managers import HandleMetricFactManager, HandleMetricMonthlyTotalManager, InstagramHandleMetricsManager, MetricDimensionManager, PlatformMetricRollupManager, SocialMediaHandleMetricsManager, YoutubeHandleMetricsManager
+from utils import DATE_FORMAT, apply_metric_delta, get_current_time, get_handle_metrics_expire_time, merge_metric, metric_delta, metric_total_value, string_to_date, subtract_merge
 from django.db.models import JSONField
-from django.db.models.query_utils import DeferredAttribute
+from django.db.models.query_utils import DeferredAttribute, Q
 
 
 
@@ -24,7 +26,8 @@ class SocialMediaHandleMetrics(models.Model):
     average_metrics -- Total average of all the metrics data calculated so far
     """
 
-    handle= models.ForeignKey(SocialMediaHandle, on_delete=models.CASCADE)
+    # Indexed by (handle, expired_on) in the platform models
+    handle= models.ForeignKey(SocialMediaHandle, on_delete=models.CASCADE, db_index=False)
     platform = models.CharField(max_length=20, default='')
     created_on = models.DateTimeField(default=get_current_time)
     expired_on = models.DateTimeField(default=get_handle_metrics_expire_time)
@@ -34,12 +37,67 @@ class SocialMediaHandleMetrics(models.Model):
 
     objects = SocialMediaHandleMetricsManager()
     COLUMN_WHITELIST = ["id", "handle_id", "platform", "created_on", "expired_on", "meta_data"]
+    # Metrics which can't be summed over days e.g rates and averages, they are averaged in the week and month rollups
+    # and left out of the totals before a day
+    NON_ADDITIVE_METRICS: List[str] = []
 
 
     @classmethod
     def get_metric_names(cls) -> List[str]:
         return [key for key, value in vars(cls).items() if key != "id" and isinstance(value, DeferredAttribute)]
 
+    @classmethod
+    def get_fact_metric_names(cls) -> List[str]:
+        """
+        Metric fields mirrored into HandleMetricFact
+        """
+        return [field.name for field in cls._meta.get_fields() if isinstance(field, JSONField) and field.name != "meta_data"]
+
+    def mark_merged_days(self, metric_name: str, days: Iterable[str]) -> None:
+        """
+        Records the days of the metric written since the last save, only they are rewritten into HandleMetricFact
+        """
+        if getattr(self, "_merged_days", None) is None:
+            self._merged_days: Dict[str, Set[str]] = {}
+        self._merged_days.setdefault(metric_name, set()).update(days)
+
+    def get_days_to_write(self, update_fields: Iterable[str] = None) -> Dict[str, Set[str]]:
+        """
+        Returns {metric_name: day_strs} to rewrite into HandleMetricFact, limited to update_fields when given\n
+        Days merged since the last save when any were, else every day of the week (e.g metrics assigned directly)
+        """
+        metric_names = self.get_fact_metric_names()
+        if update_fields is not None:
+            metric_names = [metric_name for metric_name in metric_names if metric_name in update_fields]
+        merged_days: Union[Dict[str, Set[str]], None] = getattr(self, "_merged_days", None)
+        if merged_days is not None:
+            return {metric_name: merged_days[metric_name] for metric_name in metric_names if len(merged_days.get(metric_name, ())) > 0}
+        return {metric_name: set(days) for metric_name in metric_names if len(days := getattr(self, metric_name, None) or {}) > 0}
+
+    def save(self, *args, **kwargs) -> None:
+        """
+        Dual writes the days of the week merged since the last save into HandleMetricFact and refreshes the account's
+        PlatformMetricRollup of those days, only the metrics of update_fields are written when given
+        """
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            metric_days = self.get_days_to_write(kwargs.get("update_fields"))
+            if len(metric_days) > 0:
+                HandleMetricFact.objects.replace_for_metric(self, metric_days)
+                days = {string_to_date(day).date() for day_strs in metric_days.values() for day in day_strs}
+                self.refresh_rollups(self.handle.account_id, self.platform, days, set(metric_days.keys()))
+        self._merged_days = None
+
+    @classmethod
+    def refresh_rollups(cls, account_id: int, platform: str, days: Set[date], metric_names: Set[str]) -> None:
+        """
+        Sums the account's facts of the days into PlatformMetricRollup
+        """
+        daily_totals = HandleMetricFact.objects.get_daily_totals(
+            Q(handle__account_id=account_id) & Q(platform=platform) & Q(day__in=days) & Q(metric__in=metric_names)
+        )
+        PlatformMetricRollup.objects.refresh(account_id, platform, days, metric_names, daily_totals, set(cls.NON_ADDITIVE_METRICS))
+
     def _calculate_collective_metrics(self) -> Dict[str, Union[int ,float]]:
         data = {}
         data["follower_count"] = self.follower_count
@@ -58,8 +116,54 @@ class SocialMediaHandleMetrics(models.Model):
         data = self._calculate_collective_metrics()
         return self.calculate_collective_metrics(**data)
     
+    def get_day_total(self, metric_name: str, value: Dict[str, Union[int, float]]) -> Union[Dict[str, Union[int, float]], int, float]:
+        """
+        Part of meta_data["totals"][metric_name] held by a day of the metric
+        """
+        return value
+
+    def calculate_total(self, metric_name: str) -> Union[Dict[str, Union[int, float]], int, float]:
+        total = {}
+        for value in (getattr(self, metric_name, None) or {}).values():
+            total = apply_metric_delta(total, self.get_day_total(metric_name, value))
+        return total
+
     def set_total_of_metrics(self, metric_name: str) -> None:
-        pass
+        """
+        Recomputes the total of the metric from every day of the week
+        """
+        self.meta_data.setdefault("totals", {})[metric_name] = self.calculate_total(metric_name)
+
+    def ensure_totals(self, *metric_names: str) -> None:
+        """
+        Computes the totals missing from meta_data, e.g of rows written before the totals were kept incrementally
+        """
+        totals = self.meta_data.setdefault("totals", {})
+        for metric_name in metric_names:
+            if metric_name not in totals:
+                self.set_total_of_metrics(metric_name)
+
+    def merge_days(self, metric_name: str, days: Dict[str, Dict[str, Union[int, float]]], replace: bool = True) -> None:
+        """
+        Merges the days into the metric, meta_data["totals"] only moves by the delta of the merged days\n
+        Merging a day again with the same values leaves the totals unchanged\n
+
+        Keyword Arguments:\n
+        metric_name -- Field name of the metric\n
+        days -- {day_str: {dimension: value}}\n
+        replace -- Replace the dimensions of a day, else the new dimensions are merged into the day [default=True]\n
+        """
+        self.ensure_totals(metric_name)
+        attr = getattr(self, metric_name, None) or {}
+        totals = self.meta_data["totals"]
+        for day, value in days.items():
+            old = attr.get(day, {})
+            new = value if replace else old | value
+            attr[day] = new
+            delta = metric_delta(self.get_day_total(metric_name, old), self.get_day_total(metric_name, new))
+            totals[metric_name] = apply_metric_delta(totals[metric_name], delta)
+        setattr(self, metric_name, attr)
+        self.mark_merged_days(metric_name, days.keys())
 
     def calculate_collective_metrics(self, **data) -> Dict[str, Union[int, float]]:
         for key, value in vars(self).items():
@@ -122,6 +226,106 @@ class SocialMediaHandleMetrics(models.Model):
         abstract = True
 
 
+class MetricDimension(models.Model):
+    """
+    Label of a breakdown dimension, e.g "Mumbai, Maharashtra" or M.age18-24
+    DimensionJSONField rows refer to the label by id
+    """
+    label = models.CharField(max_length=255, unique=True)
+
+    objects = MetricDimensionManager()
+
+
+class HandleMetricFact(models.Model):
+    """
+    Value of a metric of a handle on a day, one row per dimension
+    e.g (handle, instagram, 2022-01-15, audience_city, "Mumbai, Maharashtra", 40)
+
+    handle -- Social Media Handle with which it is associated
+    platform -- Social Media Platform
+    day -- Day of the value
+    metric -- Field name of the metric in the platform metric model, e.g impressions
+    dimension -- Key of the value within the day, TOTAL for metrics without breakdown
+    value -- Value of the metric
+    """
+    handle = models.ForeignKey(SocialMediaHandle, on_delete=models.CASCADE, related_name="metric_facts", db_index=False)
+    platform = models.CharField(max_length=20)
+    day = models.DateField()
+    metric = models.CharField(max_length=64)
+    dimension = models.CharField(max_length=255, default="TOTAL")
+    value = models.FloatField(default=0)
+
+    objects = HandleMetricFactManager()
+
+    class Meta:
+        # The unique index leads with (handle, day), it serves the per handle range scans and the foreign key
+        constraints = [
+            models.UniqueConstraint(fields=["handle", "day", "metric", "dimension"], name="unique_handle_metric_fact"),
+        ]
+        indexes = [
+            models.Index(fields=["metric", "day"], name="metric_fact_metric_day_idx"),
+        ]
+
+
+class HandleMetricMonthlyTotal(models.Model):
+    """
+    Sum of the facts of a metric of a handle over a month, rewritten with the facts of the month\n
+    Totals before a day are read from the months before it and the facts of its month
+
+    handle -- Social Media Handle with which it is associated
+    platform -- Social Media Platform
+    month -- First day of the month
+    metric -- Field name of the metric in the platform metric model, e.g impressions
+    dimension -- Key of the value within the day, TOTAL for metrics without breakdown
+    value -- Sum of the metric over the month
+    """
+    handle = models.ForeignKey(SocialMediaHandle, on_delete=models.CASCADE, related_name="metric_monthly_totals", db_index=False)
+    platform = models.CharField(max_length=20)
+    month = models.DateField()
+    metric = models.CharField(max_length=64)
+    dimension = models.CharField(max_length=255, default="TOTAL")
+    value = models.FloatField(default=0)
+
+    objects = HandleMetricMonthlyTotalManager()
+
+    class Meta:
+        # Leads with (handle, month), it serves the per handle range reads and the foreign key
+        constraints = [
+            models.UniqueConstraint(fields=["handle", "month", "metric", "dimension"], name="unique_handle_metric_monthly_total"),
+        ]
+
+
+class PlatformMetricRollup(models.Model):
+    """
+    Sum of a metric over every handle of an account on a platform, for a day, a week or a month
+    Written by SocialMediaHandleMetrics.save for the periods of the days it holds
+
+    account -- Account owning the handles
+    platform -- Social Media Platform
+    granularity -- RollupGranularity of the period
+    period_start -- First day of the period, monday for weeks
+    metric -- Field name of the metric in the platform metric model, e.g impressions
+    dimension -- Key of the value within the day, TOTAL for metrics without breakdown
+    value -- Sum of the metric over the period
+    """
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name="metric_rollups", db_index=False)
+    platform = models.CharField(max_length=20)
+    granularity = models.CharField(max_length=5)
+    period_start = models.DateField()
+    metric = models.CharField(max_length=64)
+    dimension = models.CharField(max_length=255, default="TOTAL")
+    value = models.FloatField(default=0)
+
+    objects = PlatformMetricRollupManager()
+
+    class Meta:
+        # Leads with (account, platform, granularity, period_start), it serves the range reads of the views and the foreign key
+        constraints = [
+            models.UniqueConstraint(fields=["account", "platform", "granularity", "period_start", "metric", "dimension"],
+                                    name="unique_platform_metric_rollup"),
+        ]
+
+
 class InstagramHandleMetricModel(SocialMediaHandleMetrics): 
     """
     Manages Instagram handle metric data for a week
@@ -135,13 +339,19 @@ class InstagramHandleMetricModel(SocialMediaHandleMetrics):
     
     impressions = models.JSONField(default=dict)
     reach = models.JSONField(default=dict)
-    audience_city = models.JSONField(default=dict)
-    audience_gender_age = models.JSONField(default=dict)
-    audience_country = models.JSONField(default=dict)
+    audience_city = DimensionJSONField(default=dict)
+    audience_gender_age = DimensionJSONField(default=dict)
+    audience_country = DimensionJSONField(default=dict)
     profile_views = models.JSONField(default=dict)
     
 
     objects = InstagramHandleMetricsManager()
+    class Meta:
+        indexes = [
+            # get_latest_metrics and retain_old_metric_total
+            models.Index(fields=["handle", "-expired_on"], name="ig_metric_handle_expired_idx"),
+        ]
+
     update_fields = ['follower_count' ,'media_count', 'impressions',
                     'reach', 'audience_city', 'audience_gender_age',"audience_country",
                     "profile_views"
@@ -149,16 +359,11 @@ class InstagramHandleMetricModel(SocialMediaHandleMetrics):
     
 
     def set_metrics_from_user_insight_response(self, response: 'InstagramUserInsightsResponse') -> None:
-        self.set_total_of_metrics("follower_count")
-        self.set_total_of_metrics("media_count")
-        self.impressions |= response.impressions
-        self.set_total_of_metrics("impressions")
-        self.reach |= response.reach
-        self.set_total_of_metrics("reach")
-        self.follower_count |= response.follower_count
-        self.set_total_of_metrics("follower_count")
-        self.profile_views |= response.profile_views
-        self.set_total_of_metrics("impressions")
+        self.ensure_totals("media_count")
+        self.merge_days("impressions", response.impressions)
+        self.merge_days("reach", response.reach)
+        self.merge_days("follower_count", response.follower_count)
+        self.merge_days("profile_views", response.profile_views)
     
 
     def reduce_audience_data(self, metric_name: str, data: Dict[str, Dict[str, Union[int, float]]]):
@@ -169,6 +374,7 @@ class InstagramHandleMetricModel(SocialMediaHandleMetrics):
             last_metric_data: Dict[str, Union[int, float]] = list(metric.values())[-1]
             data = subtract_merge(data, last_metric_data)
         setattr(self, metric_name, data)
+        self.mark_merged_days(metric_name, data.keys())
         self.set_total_of_metrics(metric_name)
 
 
@@ -179,14 +385,12 @@ class InstagramHandleMetricModel(SocialMediaHandleMetrics):
         self.reduce_audience_data("audience_country", response.audience_country)
     
     def set_total_of_metrics(self, metric_name: str) -> None:
-        if "totals"  not in self.meta_data:
-            self.meta_data["totals"] = {}
         if metric_name not in ["audience_city", "audience_gender_age", "audience_country"]:
-            if (attr := getattr(self, metric_name, None)) is not None:
-                self.meta_data["totals"][metric_name] = merge_metric(*attr.values())
+            super().set_total_of_metrics(metric_name)
         else:
+            # Audience metrics are snapshots, the total is the latest day
             if (attr := getattr(self, metric_name, None)) is not None:
-                self.meta_data["totals"][metric_name] = list(attr.values())[-1]
+                self.meta_data.setdefault("totals", {})[metric_name] = list(attr.values())[-1] if len(attr) > 0 else {}
     
     
             
@@ -217,7 +421,7 @@ class YoutubeHandleMetricModel(SocialMediaHandleMetrics):
     average_view_duration = models.JSONField(default=dict)
     subscriber_gained = models.JSONField(default=dict)
     subscriber_lost = models.JSONField(default=dict)
-    viewer_percentage = models.JSONField(default=dict)
+    viewer_percentage = DimensionJSONField(default=dict)
     audience_watch_ratio = models.JSONField(default=dict)
     relative_retention_performance = models.JSONField(default=dict)
     card_impressions = models.JSONField(default=dict)
@@ -237,54 +441,64 @@ class YoutubeHandleMetricModel(SocialMediaHandleMetrics):
     negative_engagement = models.JSONField(default=dict)
     engagement = models.JSONField(default=dict)
  
+    NON_ADDITIVE_METRICS = ["average_view_duration", "average_view_percentage", "viewer_percentage", "audience_watch_ratio",
+                            "relative_retention_performance", "card_click_rate", "card_teaser_click_rate",
+                            "annotation_click_through_rate", "annotation_close_rate"]
+
+    # Totals of these metrics are kept as a single number
+    single_total_metrics = ["viewer_percentage", "shares", "audience_watch_ratio", "relative_retention_performance"]
+
     objects = YoutubeHandleMetricsManager()
 
+    class Meta:
+        indexes = [
+            # get_latest_metrics and retain_old_metric_total
+            models.Index(fields=["handle", "-expired_on"], name="yt_metric_handle_expired_idx"),
+        ]
 
-    def calculate_engagements(self) -> None:
-        total: Dict[str, Union[int, float]] = self.meta_data["totals"]
-        positive_action = total.get("likes",0) + total.get("shares",0) + total.get("comment",0)
-        negative_action = total.get("dislikes", 0)
-        self.positive_engagement |= {get_current_time().strftime(DATE_FORMAT): {"TOTAL": positive_action}}
-        self.negative_engagement |={get_current_time().strftime(DATE_FORMAT): {"TOTAL": negative_action}}
-        self.engagement |= {get_current_time().strftime(DATE_FORMAT): {"TOTAL": positive_action + negative_action}}
-        self.set_total_of_metrics("positive_engagement")
-        self.set_total_of_metrics("negative_engagement")
-        self.set_total_of_metrics("engagement")
-    
-    def calculate_normal_metrics_total(self, data: Dict[str, Dict[str, int]]) -> Union[int, float]:
-        return sum([packet["TOTAL"] for packet in data.values()])
-    
-    
 
-    def set_total_of_metrics(self, metric_name: str) -> None:
-        if "totals" not in self.meta_data:
-            self.meta_data["totals"] = {}
-        if metric_name not in ["viewer_percentage", "shares", "audience_watch_ratio", "relative_retention_performance"]:
-            if (attr := getattr(self, metric_name, None)) is not None:
-                self.meta_data["totals"][metric_name] = merge_metric(*attr.values())
-        else:
-            if metric_name not in self.meta_data["totals"]:
-                self.meta_data["totals"][metric_name] = 0
-            self.meta_data["totals"][metric_name] += self.calculate_normal_metrics_total(getattr(self, metric_name))
+    def calculate_engagements(self, day: str = None) -> None:
+        """
+        Writes the engagements of the day, today when not given, from the totals of the week
+        """
+        total: Dict[str, Union[int, float]] = self.meta_data["totals"]
+        positive_action = sum(metric_total_value(total.get(metric_name, 0)) for metric_name in ("likes", "shares", "comments"))
+        negative_action = metric_total_value(total.get("dislikes", 0))
+        day = day or get_current_time().strftime(DATE_FORMAT)
+        self.merge_days("positive_engagement", {day: {"TOTAL": positive_action}})
+        self.merge_days("negative_engagement", {day: {"TOTAL": negative_action}})
+        self.merge_days("engagement", {day: {"TOTAL": positive_action + negative_action}})
+
+    def recompute_single_totals(self) -> bool:
+        """
+        Recomputes the totals kept as a single number from the days of the week, and the latest engagements built on them\n
+        Corrects the rows whose totals were inflated by adding the whole week on every sync\n
+        Returns True when a total changed
+        """
+        totals = self.meta_data.setdefault("totals", {})
+        previous = {metric_name: totals.get(metric_name) for metric_name in self.single_total_metrics}
+        for metric_name in self.single_total_metrics:
+            self.set_total_of_metrics(metric_name)
+        if all(previous[metric_name] == totals[metric_name] for metric_name in self.single_total_metrics):
+            return False
+        if len(self.engagement or {}) > 0:
+            self.calculate_engagements(max(self.engagement, key=string_to_date))
+        return True
+
+    def get_day_total(self, metric_name: str, value: Dict[str, Union[int, float]]) -> Union[Dict[str, Union[int, float]], int, float]:
+        if metric_name in self.single_total_metrics:
+            return metric_total_value(value)
+        return value
 
     def set_metrics(self, metrics: YTMetrics, save: bool = False) -> None:
         """
-        Combines new metrics with the current data and recalculate the totals and engagements
+        Combines new metrics with the current data, the totals move by the delta of the merged days, and recalculates the engagements
         """
-        self.set_total_of_metrics("follower_count")
-        self.set_total_of_metrics("media_count")
+        self.ensure_totals("follower_count", "media_count")
         for property_name, property_value in metrics.to_dict().items():
             if property_value is None or len(property_value) == 0:
                 continue
-            attr = getattr(self, property_name, None)
-            if attr is None:
-                attr = {}
-            for day, value in property_value.items():
-                if day not in attr:
-                    attr[day] = {}
-                attr[day] |= value
-            setattr(self, property_name, attr)
-            self.set_total_of_metrics(property_name)
+            self.merge_days(property_name, property_value, replace=False)
         self.calculate_engagements()
         if save:
             self.save()
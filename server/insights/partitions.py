@@ -0,0 +1,148 @@
+from datetime import date
+from typing import List, Tuple, Type
+from django.db import connection as default_connection, models, transaction
+import re
+
+from utils.types import PartitionRetentionAction
+
+
+def add_months(month: date, months: int) -> date:
+    """
+    First day of the month `months` after the month of the date
+    """
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+class MonthlyPartitions:
+    """
+    Monthly range partitions on created_on of a weekly metric table, Postgres only\n
+    Partitions are named <table>_pYYYY_MM, rows of months without partition land in <table>_default
+    and are moved out of it when the partition of their month is created\n
+
+    Keyword Arguments:\n
+    model -- Weekly metric model, its table is partitioned by the insights 0006 migration\n
+    connection -- Database connection [default=default connection]\n
+    """
+
+    def __init__(self, model: Type[models.Model], connection=default_connection) -> None:
+        self.table: str = model._meta.db_table
+        self.connection = connection
+        self.name_pattern = re.compile(rf"^{re.escape(self.table)}_p(\d{{4}})_(\d{{2}})$")
+
+    @property
+    def is_supported(self) -> bool:
+        return self.connection.vendor == "postgresql"
+
+    def get_partition_name(self, month: date) -> str:
+        return f"{self.table}_p{month:%Y_%m}"
+
+    def get_archive_name(self, month: date) -> str:
+        return f"{self.table}_archive_{month:%Y_%m}"
+
+    def get_default_name(self) -> str:
+        return f"{self.table}_default"
+
+    def get_bounds(self, month: date) -> Tuple[str, str]:
+        month = month.replace(day=1)
+        return month.isoformat(), add_months(month, 1).isoformat()
+
+    def get_create_sql(self, month: date) -> str:
+        start, end = self.get_bounds(month)
+        return (f'CREATE TABLE IF NOT EXISTS "{self.get_partition_name(month)}" PARTITION OF "{self.table}" '
+                f"FOR VALUES FROM ('{start}') TO ('{end}')")
+
+    def get_default_rows_sql(self, month: date) -> str:
+        start, end = self.get_bounds(month)
+        return (f'SELECT EXISTS (SELECT 1 FROM "{self.get_default_name()}" '
+                f"WHERE created_on >= '{start}' AND created_on < '{end}')")
+
+    def get_move_default_sql(self, month: date) -> List[str]:
+        """
+        A partition can't be created while the default partition holds rows of its month,
+        they are moved into a standalone table which is then attached as the partition of the month
+        """
+        partition_name = self.get_partition_name(month)
+        start, end = self.get_bounds(month)
+        return [
+            f'CREATE TABLE "{partition_name}" (LIKE "{self.table}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)',
+            f'WITH moved AS (DELETE FROM "{self.get_default_name()}" '
+            f"WHERE created_on >= '{start}' AND created_on < '{end}' RETURNING *) "
+            f'INSERT INTO "{partition_name}" SELECT * FROM moved',
+            f'ALTER TABLE "{self.table}" ATTACH PARTITION "{partition_name}" '
+            f"FOR VALUES FROM ('{start}') TO ('{end}')",
+        ]
+
+    def get_retention_sql(self, month: date, action: str) -> List[str]:
+        partition_name = self.get_partition_name(month)
+        if action == PartitionRetentionAction.Drop:
+            return [f'DROP TABLE "{partition_name}"']
+        return [
+            f'ALTER TABLE "{self.table}" DETACH PARTITION "{partition_name}"',
+            f'ALTER TABLE "{partition_name}" RENAME TO "{self.get_archive_name(month)}"',
+        ]
+
+    def get_partitions(self) -> List[Tuple[date, str]]:
+        """
+        Returns (month, name) of the monthly partitions attached to the table, oldest first
+        """
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT child.relname FROM pg_inherits "
+                "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+                "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+                "WHERE parent.relname = %s", [self.table])
+            names = [row[0] for row in cursor.fetchall()]
+        partitions = []
+        for name in names:
+            if (match := self.name_pattern.match(name)) is not None:
+                partitions.append((date(int(match.group(1)), int(match.group(2)), 1), name))
+        return sorted(partitions)
+
+    def get_missing_months(self, today: date, months_ahead: int, partitions: List[Tuple[date, str]]) -> List[date]:
+        existing = {month for month, _ in partitions}
+        months = [add_months(today, offset) for offset in range(months_ahead + 1)]
+        return [month for month in months if month not in existing]
+
+    def get_expired_months(self, today: date, retention_months: int, partitions: List[Tuple[date, str]]) -> List[date]:
+        """
+        Months of the partitions entirely older than the retention, nothing expires when retention_months is 0
+        """
+        if retention_months <= 0:
+            return []
+        oldest_kept = add_months(today, -retention_months)
+        return [month for month, _ in partitions if month < oldest_kept]
+
+    def execute(self, statements: List[str]) -> None:
+        with self.connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
+
+    def create_partition(self, month: date) -> None:
+        """
+        Creates the partition of the month, moving the rows which already landed in the default partition
+        """
+        with transaction.atomic(using=self.connection.alias), self.connection.cursor() as cursor:
+            # Writes to the default partition wait until the partition of the month is attached
+            cursor.execute(f'LOCK TABLE "{self.get_default_name()}" IN SHARE ROW EXCLUSIVE MODE')
+            cursor.execute(self.get_default_rows_sql(month))
+            has_default_rows = cursor.fetchone()[0]
+            for statement in self.get_move_default_sql(month) if has_default_rows else [self.get_create_sql(month)]:
+                cursor.execute(statement)
+
+    def maintain(self, today: date, months_ahead: int, retention_months: int = 0,
+                 action: str = PartitionRetentionAction.Archive, dry_run: bool = False) -> Tuple[List[str], List[str]]:
+        """
+        Creates the partitions of the coming months and applies the retention to the old ones\n
+        Returns (created partitions, expired partitions)
+        """
+        partitions = self.get_partitions()
+        missing_months = self.get_missing_months(today, months_ahead, partitions)
+        expired_months = self.get_expired_months(today, retention_months, partitions)
+        if not dry_run:
+            for month in missing_months:
+                self.create_partition(month)
+            for month in expired_months:
+                self.execute(self.get_retention_sql(month, action))
+        return ([self.get_partition_name(month) for month in missing_months],
+                [self.get_partition_name(month) for month in expired_months])
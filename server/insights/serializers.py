@@ -2,8 +2,9 @@ from typing import Dict, List, Tuple, Union
 from rest_framework.serializers import ModelSerializer
 from django.db.models import QuerySet
 from accounts.models import SocialMediaHandle
-from linktree.models import LinkClickCounterModel, LinkwallViewCounterModel
-from utils import time_to_string
+from linktree.models import LinkwallDailyCounter
+from utils import date_to_string
+from utils.hyperloglog import HyperLogLog
 
 
 class SocialMediaHandleSerializer(ModelSerializer):
@@ -19,57 +20,41 @@ class LinkwallInsightsSerializer:
     
     Return
      insights: Struct{
-         columns: (day, views, clicks)
-         rows: List[day_str, views, clicks]
-         totals: {}
+         columns: (day, views, clicks, unique_viewers, unique_visitors)
+         rows: List[day_str, views, clicks, unique_viewers, unique_visitors]
+         totals: {views, clicks, unique_visitors}
      },
      link_insights: Struct{
          columns: (link, clicks)
-         rows: List[link_name, clicks]
-         totals: {}
+         rows: List[link_url, clicks]
+         totals: {clicks}
      }
     
     """
 
-    def __init__(self, views: QuerySet[LinkwallViewCounterModel], clicks: QuerySet[LinkClickCounterModel]) -> None:
-        self.views = views
-        self.clicks = clicks
+    def __init__(self, counters: QuerySet[LinkwallDailyCounter], unique_visitors: int) -> None:
+        self.counters = counters
+        # Unique visitors of the range don't add up from the days, see LinkwallDailyCounterManager.count_unique_visitors
+        self.unique_visitors = unique_visitors
     
     @property
     def data(self) -> Dict[str, Dict[str, Union[str, List, Tuple]]]:
         return self._serialize()
     
     def _serialize(self):
-        insight_record: Dict[str, int] = {}
         insights_rows: List[List[Union[str, int]]] = []
-        link_insight_record: Dict[str, int] = {}
-        link_insight_rows: List[List[Union[str, int]]] = []
+        link_clicks: Dict[str, int] = {}
 
-        for view_counter in self.views:
-            date_str = time_to_string(view_counter.created_on)
-            if date_str not in insight_record:
-                insights_rows.append([date_str, 0, 0])
-                insight_record[date_str] = len(insights_rows) - 1
-            index = insight_record[date_str]
-            insights_rows[index][1] += 1
-
-        
-        for click_counter in self.clicks:
-            date_str = time_to_string(click_counter.created_on)
-            if date_str not in insight_record:
-                insights_rows.append([date_str, 0, 0])
-                insight_record[date_str] = len(insights_rows) - 1
-            index = insight_record[date_str]
-            insights_rows[index][2] += 1
-
-            if click_counter.link not in link_insight_record:
-                link_insight_rows.append([click_counter.link, 0])
-                link_insight_record[date_str] = len(link_insight_rows)  - 1
-            index = link_insight_record[click_counter.link]
-            link_insight_rows[index][1] += 1
+        for counter in self.counters:
+            insights_rows.append([date_to_string(counter.day), counter.views, counter.clicks, counter.unique_viewers,
+                                  HyperLogLog.from_bytes(counter.visitors_sketch).count()])
+            for link, clicks in counter.link_clicks.items():
+                link_clicks[link] = link_clicks.get(link, 0) + clicks
 
         return {
-            "insights": {"columns": ("day", "views", "clicks"), "totals": {}, "rows": insights_rows },
-            "link_insights": {"columns": ("link", "clicks"), "totals": {}, "rows": link_insight_rows}
+            "insights": {"columns": ("day", "views", "clicks", "unique_viewers", "unique_visitors"), "rows": insights_rows,
+                         "totals": {"views": sum(row[1] for row in insights_rows), "clicks": sum(row[2] for row in insights_rows),
+                                    "unique_visitors": self.unique_visitors}},
+            "link_insights": {"columns": ("link", "clicks"), "rows": [[link, clicks] for link, clicks in link_clicks.items()],
+                              "totals": {"clicks": sum(link_clicks.values())}}
         }
-
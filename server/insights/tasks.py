@@ -2,12 +2,19 @@
 All Celery task are defined here
 """
 
-from celery import shared_task
-from django.db.models import QuerySet
+from typing import Dict, Iterator, List, Union
+from asgiref.sync import async_to_sync
+from celery import chord, shared_task
+from django.conf import settings
+from accord.celery import app as celery_app, check_chord_backend
 from accounts.models import SocialMediaHandle
 from digger.base.digger import Digger
+from digger.base.scheduler import BoundedScheduler, ScheduledResult
 from digger.instagram.digger import InstagramDigger
 from digger.youtube.digger import YoutubeDigger
+from insights.models import InstagramHandleMetricModel, YoutubeHandleMetricModel
+from insights.partitions import MonthlyPartitions
+from utils import get_current_time
 from utils.types import Platform
 from log_engine.log import logger
 
@@ -19,18 +26,143 @@ def update_handle_analytics(digger: Digger, social_media_handle: SocialMediaHand
     digger.update_handle_insights(social_media_handle)
 
 
+async def update_handle_analytics_async(digger: Digger, social_media_handle: SocialMediaHandle) -> None:
+    await digger.update_handle_data_async(social_media_handle)
+    await digger.update_handle_insights_async(social_media_handle)
+
+
+async def update_handles_analytics_async(social_media_handles: List[SocialMediaHandle], concurrency: int = None) -> List[ScheduledResult]:
+    """
+    Syncs every handle with at most `concurrency` handles in flight, failures are logged per handle\n
+    Async sessions are closed afterwards, as they are bound to the event loop of this run
+    """
+    diggers: Dict[str, Digger] = {Platform.Instagram: InstagramDigger(), Platform.Youtube: YoutubeDigger()}
+    scheduler = BoundedScheduler(concurrency or settings.DIGGER_CONCURRENCY)
+
+    async def worker(social_media_handle: SocialMediaHandle) -> None:
+        await update_handle_analytics_async(diggers[social_media_handle.platform], social_media_handle)
+
+    try:
+        results = await scheduler.run(social_media_handles, worker)
+    finally:
+        for digger in diggers.values():
+            await digger.async_request_manager.close()
+    log_failed_results(results)
+    return results
+
+
+def update_instagram_handles_analytics(social_media_handles: List[SocialMediaHandle]) -> List[ScheduledResult]:
+    """
+    Instagram handles are synced through Graph API batch requests instead of a round-trip per request
+    """
+    results = InstagramDigger().update_handles_analytics_batch(social_media_handles)
+    log_failed_results(results)
+    return results
+
+
+def log_failed_results(results: List[ScheduledResult]) -> None:
+    for scheduled in results:
+        if scheduled.error is not None:
+            logger.error(f"SocialMediaHandle[platform={scheduled.item.platform}, username={scheduled.item.username}] failed to sync: {scheduled.error}")
+
+
+def get_analytics_queue(platform: str) -> str:
+    return f"analytics.{platform}"
+
+
+def iter_handle_id_chunks(platform: str, chunk_size: int) -> Iterator[List[int]]:
+    """
+    Pages enabled handle ids of the platform in chunks, using the last seen id as cursor\n
+    Keeps every page an index range scan, instead of an OFFSET over the whole table
+    """
+    last_id = 0
+    while True:
+        handle_ids = list(SocialMediaHandle.objects.filter(platform=platform, is_disabled=False, id__gt=last_id)
+                          .order_by('id').values_list('id', flat=True)[:chunk_size])
+        if len(handle_ids) == 0:
+            return
+        yield handle_ids
+        last_id = handle_ids[-1]
+
+
 @shared_task
-def update_analytics() -> None:
-    instagram_digger = InstagramDigger()
-    youtube_digger = YoutubeDigger()
-    social_media_handle_queryset: QuerySet[SocialMediaHandle] = SocialMediaHandle.objects.filter(is_disabled=False)
+def update_analytics_chunk(platform: str, handle_ids: List[int]) -> Dict[str, Union[str, int]]:
+    """
+    Syncs a chunk of handles of a single platform\n
+    Returns the number of handles that succeeded and failed, a chunk which raises counts all its handles as failed,
+    so that the chord still runs summarize_analytics
+    """
     try:
-        for social_media_handle in social_media_handle_queryset:
-            if social_media_handle.platform == Platform.Instagram:
-                update_handle_analytics(instagram_digger, social_media_handle)
-            elif social_media_handle.platform == Platform.Youtube:
-                update_handle_analytics(youtube_digger, social_media_handle)
-    except Exception as exc:
-        logger.error(exc)
+        social_media_handles = list(SocialMediaHandle.objects.filter(id__in=handle_ids, platform=platform, is_disabled=False))
+        if platform == Platform.Instagram:
+            results = update_instagram_handles_analytics(social_media_handles)
+        else:
+            results = async_to_sync(update_handles_analytics_async)(social_media_handles)
+    except Exception as e:
+        logger.error(f"Analytics sync of a {platform} chunk of {len(handle_ids)} handles failed: {e}")
+        return {"platform": platform, "succeeded": 0, "failed": len(handle_ids)}
+    failed = len([scheduled for scheduled in results if scheduled.error is not None])
+    return {"platform": platform, "succeeded": len(results) - failed, "failed": failed}
+
+
+@shared_task
+def summarize_analytics(chunk_reports: List[Dict[str, Union[str, int]]]) -> Dict[str, Dict[str, int]]:
+    summary: Dict[str, Dict[str, int]] = {}
+    for report in chunk_reports:
+        platform_summary = summary.setdefault(report["platform"], {"succeeded": 0, "failed": 0, "chunks": 0})
+        platform_summary["succeeded"] += report["succeeded"]
+        platform_summary["failed"] += report["failed"]
+        platform_summary["chunks"] += 1
+    for platform, platform_summary in summary.items():
+        if platform_summary["failed"] > 0:
+            logger.error(f"Analytics sync of {platform} failed for {platform_summary['failed']} handles, "
+                         f"{platform_summary['succeeded']} succeeded")
+    return summary
 
 
+def build_analytics_chord(chunk_size: int) -> Union[chord, None]:
+    """
+    One update_analytics_chunk subtask per chunk of handle ids, routed to the analytics.<platform> queue,\n
+    with summarize_analytics as callback. Returns None if there is no handle to sync
+    """
+    subtasks = []
+    for platform in [Platform.Instagram, Platform.Youtube]:
+        for handle_ids in iter_handle_id_chunks(platform, chunk_size):
+            subtasks.append(update_analytics_chunk.si(platform, handle_ids).set(queue=get_analytics_queue(platform)))
+    if len(subtasks) == 0:
+        return None
+    return chord(subtasks, summarize_analytics.s())
+
+
+@shared_task
+def update_analytics(chunk_size: int = None) -> Union[str, None]:
+    """
+    Coordinator of the nightly sync, dispatches the analytics chord and returns its id
+    """
+    check_chord_backend(celery_app)
+    analytics_chord = build_analytics_chord(chunk_size or settings.ANALYTICS_CHUNK_SIZE)
+    if analytics_chord is None:
+        return None
+    return analytics_chord.apply_async().id
+
+
+@shared_task
+def maintain_metric_partitions(months_ahead: int = None, retention_months: int = None, action: str = None,
+                               dry_run: bool = False) -> Union[Dict[str, Dict[str, List[str]]], None]:
+    """
+    Creates the coming monthly partitions of the weekly metric tables and applies the retention policy\n
+    Arguments default to the HANDLE_METRICS_* settings, returns {table: {"created", "expired"}} or None when not on Postgres
+    """
+    months_ahead = settings.HANDLE_METRICS_PARTITIONS_AHEAD if months_ahead is None else months_ahead
+    retention_months = settings.HANDLE_METRICS_RETENTION_MONTHS if retention_months is None else retention_months
+    action = action or settings.HANDLE_METRICS_RETENTION_ACTION
+    report = {}
+    for model in [InstagramHandleMetricModel, YoutubeHandleMetricModel]:
+        partitions = MonthlyPartitions(model)
+        if not partitions.is_supported:
+            return None
+        created, expired = partitions.maintain(get_current_time().date(), months_ahead, retention_months, action, dry_run)
+        report[partitions.table] = {"created": created, "expired": expired}
+        if len(expired) > 0 and not dry_run:
+            logger.info(f"{partitions.table}: {action} {', '.join(expired)}")
+    return report
@@ -1,11 +1,34 @@
+from io import StringIO
+import json
+import os
 from typing import Dict, List
+from datetime import date, datetime, timedelta, timezone
+from unittest import skipIf, skipUnless
+from unittest.mock import patch
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from django.db.models import JSONField, Q, Value
+from django.test import TestCase
 from django.test.client import Client
 from django.urls import reverse
 from rest_framework.test import APITestCase
 from rest_framework import status
 
+from asgiref.sync import async_to_sync
+from accord.celery import app as celery_app
 from accounts.models import Account, SocialMediaHandle
-from utils.types import Platform
+from digger.base.scheduler import ScheduledResult
+from digger.youtube.types import YTMetrics
+from insights.managers import METRICS_WEEK
+from insights.partitions import MonthlyPartitions, add_months
+from insights.views import get_digger
+from insights.models import HandleMetricFact, HandleMetricMonthlyTotal, InstagramHandleMetricModel, MetricDimension, PlatformMetricRollup, YoutubeHandleMetricModel
+from insights.tasks import build_analytics_chord, iter_handle_id_chunks, update_analytics
+from utils import date_to_string, datetime_to_unix_timestamp_string, get_current_time
+from utils.types import EntityType, PartitionRetentionAction, Platform, RollupGranularity
 # Create your tests here.
 
 class TestSocialMediaHandleViews(APITestCase):
@@ -62,3 +85,616 @@ class TestSocialMediaHandleViews(APITestCase):
 
 
 
+
+
+
+class TestInsightsViews(APITestCase):
+
+    def setUp(self) -> None:
+        self.account, self.token_obj = Account.get_test_account()
+        self.client = Client(HTTP_AUTHORIZATION=f"Token {self.token_obj.key}")
+        self.handle = SocialMediaHandle.get_test_handle(Platform.Instagram, self.account)
+        handle_metric: InstagramHandleMetricModel = InstagramHandleMetricModel.objects.create(handle=self.handle, platform=Platform.Instagram)
+        # The default filters cover yesterday and today
+        self.yesterday, self.today = date_to_string(get_current_time() - timedelta(days=1)), date_to_string(get_current_time())
+        handle_metric.impressions = {self.yesterday: {"TOTAL": 312}, self.today: {"TOTAL": 280}}
+        handle_metric.reach = {self.yesterday: {"TOTAL": 201}}
+        handle_metric.save()
+        # Out of the default filters
+        handle_metric.follower_count = {"15-01-2022": {"TOTAL": 90}}
+        handle_metric.save()
+
+    def test_handle_insights_layouts(self) -> None:
+        url = reverse('handle-insights', kwargs={"handle": self.handle.handle_uid})
+        res = self.client.get(url)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        data = res.json()["data"]
+        self.assertEqual(data["rows"][0][data["columns"].index("IMPRESSIONS_TOTAL")], 312)
+        self.assertEqual(data["totals"]["IMPRESSIONS_TOTAL"], 592)
+        self.assertNotIn("FOLLOWER_COUNT_TOTAL", data["totals"])
+
+        res = self.client.get(url, data={"layout": "columnar"})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        data = res.json()["data"]
+        self.assertEqual(data["data"]["day"], [self.yesterday, self.today])
+        self.assertEqual(data["data"]["REACH_TOTAL"], [201, 0])
+
+        res = self.client.get(url, data={"layout": "csv"})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_metrics_selection(self) -> None:
+        url = reverse('handle-insights', kwargs={"handle": self.handle.handle_uid})
+        res = self.client.get(url, data={"metrics": "reach"})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.json()["data"]["columns"], ["day", "REACH_TOTAL"])
+        res = self.client.get(url, data={"metrics": "reach,views"})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_private_metrics_are_not_queried_for_other_accounts(self) -> None:
+        self.account.platform_specific_private_metric = {Platform.Instagram: ["impressions"]}
+        self.account.save()
+        viewer: Account = Account.objects.create(email="viewer@accord.dev", first_name="View", last_name="Er", username="viewer",
+                                                 entity_type=EntityType.Creator, password="helloword103", description="none")
+        client = Client(HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=viewer.user).key}")
+        url = reverse('handle-insights', kwargs={"handle": self.handle.handle_uid})
+        with CaptureQueriesContext(connection) as queries:
+            res = client.get(url, data={"metrics": "impressions,reach"})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.json()["data"]["columns"], ["day", "REACH_TOTAL"])
+        fact_queries = [query["sql"] for query in queries.captured_queries if HandleMetricFact._meta.db_table in query["sql"]]
+        # The days of the table and the totals before them
+        self.assertEqual(len(fact_queries), 2)
+        self.assertTrue(all("impressions" not in fact_query for fact_query in fact_queries))
+
+
+class TestHandleMetricFact(TestCase):
+
+    def setUp(self) -> None:
+        self.account, _ = Account.get_test_account()
+        self.handle = SocialMediaHandle.get_test_handle(Platform.Instagram, self.account)
+        self.handle_metric: InstagramHandleMetricModel = InstagramHandleMetricModel.objects.create(handle=self.handle)
+        self.handle_metric.impressions = {"15-01-2022": {"TOTAL": 312}, "16-01-2022": {"TOTAL": 280}}
+        self.handle_metric.audience_city = {"16-01-2022": {"Mumbai, Maharashtra": 40, "Pune, Maharashtra": 12}}
+        self.handle_metric.save()
+
+    def get_facts(self) -> Dict:
+        return {(fact.day, fact.metric, fact.dimension): fact.value for fact in HandleMetricFact.objects.filter(handle=self.handle)}
+
+    def test_save_writes_facts(self) -> None:
+        self.assertEqual(self.get_facts(), {
+            (date(2022, 1, 15), "impressions", "TOTAL"): 312,
+            (date(2022, 1, 16), "impressions", "TOTAL"): 280,
+            (date(2022, 1, 16), "audience_city", "Mumbai, Maharashtra"): 40,
+            (date(2022, 1, 16), "audience_city", "Pune, Maharashtra"): 12,
+        })
+
+    def test_save_replaces_facts_of_the_week(self) -> None:
+        self.handle_metric.impressions["16-01-2022"] = {"TOTAL": 300}
+        self.handle_metric.audience_city = {"16-01-2022": {"Mumbai, Maharashtra": 41}}
+        self.handle_metric.save()
+        facts = self.get_facts()
+        self.assertEqual(len(facts), 3)
+        self.assertEqual(facts[(date(2022, 1, 16), "impressions", "TOTAL")], 300)
+        self.assertNotIn((date(2022, 1, 16), "audience_city", "Pune, Maharashtra"), facts)
+
+    def test_save_rewrites_only_the_merged_days(self) -> None:
+        # Facts of the days which are not merged again keep their value
+        HandleMetricFact.objects.filter(handle=self.handle, day=date(2022, 1, 15)).update(value=1)
+        HandleMetricFact.objects.filter(handle=self.handle, metric="audience_city").update(value=2)
+        self.handle_metric.merge_days("impressions", {"16-01-2022": {"TOTAL": 300}})
+        self.handle_metric.save()
+        facts = self.get_facts()
+        self.assertEqual(facts[(date(2022, 1, 16), "impressions", "TOTAL")], 300)
+        self.assertEqual(facts[(date(2022, 1, 15), "impressions", "TOTAL")], 1)
+        self.assertEqual(facts[(date(2022, 1, 16), "audience_city", "Mumbai, Maharashtra")], 2)
+        self.assertEqual(PlatformMetricRollup.objects.get(account=self.account, granularity=RollupGranularity.Day,
+                                                          period_start=date(2022, 1, 16), metric="impressions").value, 300)
+
+    def test_save_of_update_fields_writes_only_their_facts(self) -> None:
+        self.handle_metric.merge_days("impressions", {"16-01-2022": {"TOTAL": 300}})
+        with CaptureQueriesContext(connection) as queries:
+            self.handle_metric.save(update_fields=["meta_data"])
+        self.assertFalse(any(f'"{HandleMetricFact._meta.db_table}"' in query["sql"] for query in queries.captured_queries))
+        self.assertEqual(self.get_facts()[(date(2022, 1, 16), "impressions", "TOTAL")], 280)
+
+    def test_platform_metric_is_summed_per_day(self) -> None:
+        other_handle = SocialMediaHandle.get_test_handle(Platform.Instagram, self.account)
+        other_metric: InstagramHandleMetricModel = InstagramHandleMetricModel.objects.create(handle=other_handle)
+        other_metric.impressions = {"16-01-2022": {"TOTAL": 20}, "17-01-2022": {"TOTAL": 7}}
+        other_metric.save()
+        digger = get_digger(Platform.Instagram)
+        metric_table = digger.calculate_platform_metric(self.account, datetime(2022, 1, 16, tzinfo=timezone.utc), datetime(2022, 1, 17, tzinfo=timezone.utc))
+        _json = metric_table.json()
+        self.assertEqual([row[0] for row in _json["rows"]], ["16-01-2022", "17-01-2022"])
+        self.assertEqual(_json["totals"]["IMPRESSIONS_TOTAL"], 307)
+        self.assertEqual(_json["totals"]["AUDIENCE_CITY_Mumbai, Maharashtra"], 40)
+        self.assertIsInstance(_json["totals"]["IMPRESSIONS_TOTAL"], int)
+
+    def test_handle_insights_carry_the_totals_before_start_date(self) -> None:
+        digger = get_digger(Platform.Instagram)
+        _json = digger.get_handle_insights(self.handle, datetime(2022, 1, 16, tzinfo=timezone.utc), metric_names=["impressions"]).json()
+        self.assertEqual([row[0] for row in _json["rows"]], ["16-01-2022"])
+        self.assertEqual(_json["prev_totals"], {"IMPRESSIONS_TOTAL": 312})
+        _json = digger.get_handle_insights(self.handle, metric_names=["impressions"]).json()
+        self.assertNotIn("prev_totals", _json)
+
+    def test_insights_without_end_date_are_not_bounded_at_import_time(self) -> None:
+        # A default end_date evaluated at import would leave out the days synced after the process started
+        tomorrow = get_current_time() + timedelta(days=1)
+        self.handle_metric.impressions[date_to_string(tomorrow)] = {"TOTAL": 9}
+        self.handle_metric.save()
+        for metric_table in (get_digger(Platform.Instagram).get_handle_insights(self.handle, metric_names=["impressions"]),
+                             get_digger(Platform.Instagram).calculate_platform_metric(self.account, metric_names=["impressions"])):
+            self.assertEqual(metric_table.json()["rows"][-1], [date_to_string(tomorrow), 9])
+
+    def test_totals_of_earlier_months_are_read_from_the_monthly_totals(self) -> None:
+        self.handle_metric.impressions["30-12-2021"] = {"TOTAL": 100}
+        self.handle_metric.save()
+        self.assertEqual(HandleMetricMonthlyTotal.objects.get(handle=self.handle, month=date(2021, 12, 1), metric="impressions").value, 100)
+        self.assertEqual(HandleMetricMonthlyTotal.objects.get(handle=self.handle, month=date(2022, 1, 1), metric="impressions").value, 592)
+        # The facts of the earlier months are not read any more
+        HandleMetricFact.objects.filter(handle=self.handle, day__lt=date(2022, 1, 1)).delete()
+        totals = HandleMetricFact.objects.get_totals(Q(handle=self.handle) & Q(metric__in=["impressions"]), date(2022, 1, 16))
+        self.assertEqual(totals, {"IMPRESSIONS_TOTAL": 412})
+
+    def test_weekly_rows_load_only_the_selected_metrics(self) -> None:
+        digger = get_digger(Platform.Instagram)
+        metric_table = digger.get_metric_table_from_queryset(InstagramHandleMetricModel.objects.filter(handle=self.handle), ["impressions"])
+        self.assertEqual(metric_table.columns, ["impressions"])
+        self.assertEqual(list(metric_table.df.columns), ["IMPRESSIONS_TOTAL"])
+
+    def test_backfill_command(self) -> None:
+        youtube_handle = SocialMediaHandle.get_test_handle(Platform.Youtube, self.account)
+        youtube_metric: YoutubeHandleMetricModel = YoutubeHandleMetricModel.objects.create(handle=youtube_handle)
+        YoutubeHandleMetricModel.objects.filter(id=youtube_metric.id).update(views={"15-01-2022": {"TOTAL": 5, "SUBSCRIBED": 2}})
+        HandleMetricFact.objects.all().delete()
+        PlatformMetricRollup.objects.all().delete()
+        call_command("backfill_metric_facts", stdout=StringIO())
+        self.assertEqual(len(self.get_facts()), 4)
+        self.assertEqual(PlatformMetricRollup.objects.get(platform=Platform.Youtube, granularity=RollupGranularity.Month, dimension="SUBSCRIBED").value, 2)
+        self.assertEqual(HandleMetricFact.objects.filter(handle=youtube_handle, platform=Platform.Youtube).count(), 2)
+
+
+class TestMetricDimension(TestCase):
+
+    def setUp(self) -> None:
+        self.account, _ = Account.get_test_account()
+        self.audience_city = {"15-01-2022": {"Mumbai, Maharashtra": 40, "Pune, Maharashtra": 12}, "16-01-2022": {"Mumbai, Maharashtra": 3}}
+        self.handle_metrics: List[InstagramHandleMetricModel] = []
+        for _ in range(2):
+            handle = SocialMediaHandle.get_test_handle(Platform.Instagram, self.account)
+            handle_metric: InstagramHandleMetricModel = InstagramHandleMetricModel.objects.create(handle=handle)
+            handle_metric.audience_city = self.audience_city
+            handle_metric.save()
+            self.handle_metrics.append(handle_metric)
+
+    def get_stored_value(self, handle_metric: InstagramHandleMetricModel) -> Dict:
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT audience_city FROM {InstagramHandleMetricModel._meta.db_table} WHERE id = %s", [handle_metric.id])
+            return json.loads(cursor.fetchone()[0])
+
+    def test_labels_are_stored_once_as_ids(self) -> None:
+        self.assertEqual(MetricDimension.objects.filter(label__in=["Mumbai, Maharashtra", "Pune, Maharashtra"]).count(), 2)
+        mumbai = MetricDimension.objects.get(label="Mumbai, Maharashtra").id
+        stored = self.get_stored_value(self.handle_metrics[1])
+        self.assertEqual(stored["16-01-2022"], [[mumbai], [3]])
+        handle_metric = InstagramHandleMetricModel.objects.get(id=self.handle_metrics[1].id)
+        self.assertEqual(handle_metric.audience_city, self.audience_city)
+        self.assertEqual(handle_metric.get_metric_rows()["15-01-2022"]["AUDIENCE_CITY_Pune, Maharashtra"], 12)
+
+    def test_lookups_do_not_intern_labels(self) -> None:
+        labels = MetricDimension.objects.count()
+        self.assertFalse(InstagramHandleMetricModel.objects.filter(audience_city={"15-01-2022": {"Nashik, Maharashtra": 1}}).exists())
+        self.assertEqual(MetricDimension.objects.count(), labels)
+        self.assertFalse(MetricDimension.objects.filter(label="Nashik, Maharashtra").exists())
+        matches = InstagramHandleMetricModel.objects.filter(audience_city=self.audience_city)
+        self.assertEqual(set(matches.values_list("id", flat=True)), {handle_metric.id for handle_metric in self.handle_metrics})
+        InstagramHandleMetricModel.objects.filter(id=self.handle_metrics[0].id).update(audience_city={"17-01-2022": {"Nashik, Maharashtra": 1}})
+        self.assertTrue(MetricDimension.objects.filter(label="Nashik, Maharashtra").exists())
+
+    def test_rows_stored_before_interning_are_read(self) -> None:
+        legacy = {"15-01-2022": {"Nagpur, Maharashtra": 5}}
+        InstagramHandleMetricModel.objects.filter(id=self.handle_metrics[0].id).update(
+            audience_city=Value(legacy, output_field=JSONField()))
+        self.assertEqual(InstagramHandleMetricModel.objects.get(id=self.handle_metrics[0].id).audience_city, legacy)
+
+
+class TestPlatformMetricRollup(APITestCase):
+
+    def setUp(self) -> None:
+        self.account, self.token_obj = Account.get_test_account()
+        self.client = Client(HTTP_AUTHORIZATION=f"Token {self.token_obj.key}")
+        self.handle_metrics: List[InstagramHandleMetricModel] = []
+        for impressions in ({"15-01-2022": {"TOTAL": 312}, "16-01-2022": {"TOTAL": 280}},
+                            {"16-01-2022": {"TOTAL": 20}, "17-01-2022": {"TOTAL": 7}, "01-02-2022": {"TOTAL": 1}}):
+            handle = SocialMediaHandle.get_test_handle(Platform.Instagram, self.account)
+            handle_metric: InstagramHandleMetricModel = InstagramHandleMetricModel.objects.create(handle=handle)
+            handle_metric.impressions = impressions
+            handle_metric.save()
+            self.handle_metrics.append(handle_metric)
+
+    def get_rollups(self, granularity: str) -> Dict:
+        queryset = PlatformMetricRollup.objects.filter(account=self.account, granularity=granularity, metric="impressions")
+        return {rollup.period_start: rollup.value for rollup in queryset}
+
+    def test_tiers_are_summed_across_handles(self) -> None:
+        self.assertEqual(self.get_rollups(RollupGranularity.Day), {
+            date(2022, 1, 15): 312, date(2022, 1, 16): 300, date(2022, 1, 17): 7, date(2022, 2, 1): 1})
+        self.assertEqual(self.get_rollups(RollupGranularity.Week), {
+            date(2022, 1, 10): 612, date(2022, 1, 17): 7, date(2022, 1, 31): 1})
+        self.assertEqual(self.get_rollups(RollupGranularity.Month), {date(2022, 1, 1): 619, date(2022, 2, 1): 1})
+
+    def test_save_refreshes_the_periods_of_its_days(self) -> None:
+        handle_metric = self.handle_metrics[1]
+        handle_metric.impressions["17-01-2022"] = {"TOTAL": 10}
+        handle_metric.save()
+        self.assertEqual(self.get_rollups(RollupGranularity.Day)[date(2022, 1, 17)], 10)
+        self.assertEqual(self.get_rollups(RollupGranularity.Week), {
+            date(2022, 1, 10): 612, date(2022, 1, 17): 10, date(2022, 1, 31): 1})
+        self.assertEqual(self.get_rollups(RollupGranularity.Month)[date(2022, 1, 1)], 622)
+
+    def test_refresh_reads_only_the_days_of_the_refreshed_periods(self) -> None:
+        # A day of another week and month, it would be summed in if the refresh read it
+        PlatformMetricRollup.objects.create(account=self.account, platform=Platform.Instagram, granularity=RollupGranularity.Day,
+                                            period_start=date(2021, 6, 1), metric="impressions", value=1000)
+        handle_metric = self.handle_metrics[1]
+        handle_metric.impressions["17-01-2022"] = {"TOTAL": 10}
+        with CaptureQueriesContext(connection) as queries:
+            handle_metric.save()
+        period_queries = [query["sql"] for query in queries.captured_queries
+                          if query["sql"].startswith("SELECT") and "SUM" in query["sql"] and f'"{PlatformMetricRollup._meta.db_table}"' in query["sql"]]
+        self.assertEqual(len(period_queries), 2)
+        for sql in period_queries:
+            self.assertIn('"period_start" >=', sql)
+            self.assertIn('"period_start" <', sql)
+        self.assertEqual(self.get_rollups(RollupGranularity.Week)[date(2022, 1, 17)], 10)
+        self.assertEqual(self.get_rollups(RollupGranularity.Month)[date(2022, 1, 1)], 622)
+        self.assertNotIn(date(2021, 6, 1), self.get_rollups(RollupGranularity.Month))
+
+    def test_refresh_locks_the_account_before_writing(self) -> None:
+        handle_metric = self.handle_metrics[0]
+        handle_metric.impressions["16-01-2022"] = {"TOTAL": 281}
+        with patch.object(Account.objects, "select_for_update", wraps=Account.objects.select_for_update) as select_for_update, \
+                CaptureQueriesContext(connection) as queries:
+            handle_metric.save()
+        select_for_update.assert_called_once_with()
+        tables = [Account._meta.db_table, PlatformMetricRollup._meta.db_table]
+        touched = [table for query in queries.captured_queries for table in tables if f'"{table}"' in query["sql"]]
+        self.assertEqual(touched[0], Account._meta.db_table)
+        self.assertEqual(self.get_rollups(RollupGranularity.Day)[date(2022, 1, 16)], 301)
+
+    def test_non_additive_metrics_are_averaged_over_the_period(self) -> None:
+        handle = SocialMediaHandle.get_test_handle(Platform.Youtube, self.account)
+        handle_metric: YoutubeHandleMetricModel = YoutubeHandleMetricModel.objects.create(handle=handle)
+        handle_metric.views = {"17-01-2022": {"TOTAL": 10}, "18-01-2022": {"TOTAL": 30}}
+        handle_metric.card_click_rate = {"17-01-2022": {"TOTAL": 0.2}, "18-01-2022": {"TOTAL": 0.4}}
+        handle_metric.save()
+        for granularity, period_start in ((RollupGranularity.Week, date(2022, 1, 17)), (RollupGranularity.Month, date(2022, 1, 1))):
+            rollups = {rollup.metric: rollup.value for rollup in PlatformMetricRollup.objects.filter(
+                account=self.account, platform=Platform.Youtube, granularity=granularity, period_start=period_start)}
+            self.assertEqual(rollups["views"], 40)
+            self.assertAlmostEqual(rollups["card_click_rate"], 0.3)
+        digger = get_digger(Platform.Youtube)
+        _json = digger.calculate_platform_metric(self.account, datetime(2022, 1, 18, tzinfo=timezone.utc), datetime(2022, 1, 31, tzinfo=timezone.utc),
+                                                 metric_names=["views", "card_click_rate"]).json()
+        self.assertEqual(_json["prev_totals"], {"VIEWS_TOTAL": 10})
+
+    def test_platform_insights_granularity(self) -> None:
+        url = reverse('platform-insights', kwargs={"platform": Platform.Instagram})
+        start_date = datetime_to_unix_timestamp_string(datetime(2022, 1, 16, tzinfo=timezone.utc))
+        end_date = datetime_to_unix_timestamp_string(datetime(2022, 2, 28, tzinfo=timezone.utc))
+        res = self.client.get(url, data={"start_date": start_date, "end_date": end_date})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        data = res.json()["data"]
+        self.assertEqual([row[0] for row in data["rows"]], ["16-01-2022", "17-01-2022", "01-02-2022"])
+        self.assertEqual(data["prev_totals"], {"IMPRESSIONS_TOTAL": 312})
+
+        res = self.client.get(url, data={"start_date": start_date, "end_date": end_date, "granularity": RollupGranularity.Week})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        data = res.json()["data"]
+        self.assertEqual(data["columns"][0], "week")
+        self.assertEqual(data["rows"], [["10-01-2022", 612], ["17-01-2022", 7], ["31-01-2022", 1]])
+        self.assertEqual(data["prev_totals"], {})
+
+        res = self.client.get(url, data={"granularity": "year"})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TestIncrementalTotals(TestCase):
+
+    def setUp(self) -> None:
+        self.account, _ = Account.get_test_account()
+        handle = SocialMediaHandle.get_test_handle(Platform.Youtube, self.account)
+        self.handle_metric: YoutubeHandleMetricModel = YoutubeHandleMetricModel.objects.create(handle=handle)
+        self.metrics = YTMetrics(
+            likes={"15-01-2022": {"SUBSCRIBED": 4, "UNSUBSCRIBED": 6}, "16-01-2022": {"SUBSCRIBED": 1}},
+            comments={"15-01-2022": {"TOTAL": 2}},
+            shares={"15-01-2022": {"WHATS_APP": 3, "TWITTER": 1}},
+            dislikes={"16-01-2022": {"UNSUBSCRIBED": 1}},
+        )
+
+    def test_resync_of_the_same_days_keeps_the_totals(self) -> None:
+        self.handle_metric.set_metrics(self.metrics)
+        totals = dict(self.handle_metric.meta_data["totals"])
+        self.assertEqual(totals["likes"], {"SUBSCRIBED": 5, "UNSUBSCRIBED": 6})
+        self.assertEqual(totals["shares"], 4)
+        self.assertEqual(totals["positive_engagement"], {"TOTAL": 17})
+        self.handle_metric.set_metrics(self.metrics)
+        self.assertEqual(self.handle_metric.meta_data["totals"], totals)
+
+    def test_totals_move_by_the_delta_of_the_day(self) -> None:
+        self.handle_metric.set_metrics(self.metrics)
+        self.handle_metric.set_metrics(YTMetrics(likes={"16-01-2022": {"SUBSCRIBED": 3}}, shares={"16-01-2022": {"TWITTER": 2}}))
+        totals = self.handle_metric.meta_data["totals"]
+        self.assertEqual(totals["likes"], {"SUBSCRIBED": 7, "UNSUBSCRIBED": 6})
+        self.assertEqual(totals["shares"], 6)
+        for metric_name in ("likes", "shares", "engagement"):
+            self.assertEqual(totals[metric_name], self.handle_metric.calculate_total(metric_name))
+
+    def test_inflated_totals_are_recomputed(self) -> None:
+        self.handle_metric.set_metrics(self.metrics)
+        self.handle_metric.save()
+        meta_data = self.handle_metric.meta_data
+        # Totals of rows synced while every call added the whole week again
+        meta_data["totals"]["shares"] = 12
+        meta_data["totals"]["viewer_percentage"] = 30
+        YoutubeHandleMetricModel.objects.filter(id=self.handle_metric.id).update(meta_data=meta_data)
+        out = StringIO()
+        call_command("recompute_metric_totals", "--dry-run", stdout=out)
+        self.assertIn("1 of 1 weekly rows would be corrected", out.getvalue())
+        self.assertEqual(YoutubeHandleMetricModel.objects.get(id=self.handle_metric.id).meta_data["totals"]["shares"], 12)
+        call_command("recompute_metric_totals", stdout=StringIO())
+        handle_metric = YoutubeHandleMetricModel.objects.get(id=self.handle_metric.id)
+        self.assertEqual(handle_metric.meta_data["totals"]["shares"], 4)
+        self.assertEqual(handle_metric.meta_data["totals"]["viewer_percentage"], {})
+        self.assertEqual(list(handle_metric.positive_engagement.values()), [{"TOTAL": 17}])
+        out = StringIO()
+        call_command("recompute_metric_totals", stdout=out)
+        self.assertIn("0 of 1 weekly rows corrected", out.getvalue())
+
+
+class TestMonthlyPartitions(TestCase):
+
+    def setUp(self) -> None:
+        self.partitions = MonthlyPartitions(InstagramHandleMetricModel)
+        self.table = InstagramHandleMetricModel._meta.db_table
+        self.existing = [(date(2021, 11, 1), f"{self.table}_p2021_11"), (date(2021, 12, 1), f"{self.table}_p2021_12"),
+                         (date(2022, 1, 1), f"{self.table}_p2022_01")]
+
+    def test_add_months(self) -> None:
+        self.assertEqual(add_months(date(2021, 11, 17), 2), date(2022, 1, 1))
+        self.assertEqual(add_months(date(2022, 1, 31), -1), date(2021, 12, 1))
+
+    def test_coming_months_without_partition(self) -> None:
+        missing = self.partitions.get_missing_months(date(2022, 1, 20), 2, self.existing)
+        self.assertEqual(missing, [date(2022, 2, 1), date(2022, 3, 1)])
+        self.assertEqual(self.partitions.get_create_sql(missing[0]),
+                         f'CREATE TABLE IF NOT EXISTS "{self.table}_p2022_02" PARTITION OF "{self.table}" '
+                         "FOR VALUES FROM ('2022-02-01') TO ('2022-03-01')")
+
+    def test_default_rows_are_moved_into_the_partition_of_their_month(self) -> None:
+        self.assertEqual(self.partitions.get_move_default_sql(date(2022, 2, 14)), [
+            f'CREATE TABLE "{self.table}_p2022_02" (LIKE "{self.table}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)',
+            f'WITH moved AS (DELETE FROM "{self.table}_default" '
+            "WHERE created_on >= '2022-02-01' AND created_on < '2022-03-01' RETURNING *) "
+            f'INSERT INTO "{self.table}_p2022_02" SELECT * FROM moved',
+            f'ALTER TABLE "{self.table}" ATTACH PARTITION "{self.table}_p2022_02" '
+            "FOR VALUES FROM ('2022-02-01') TO ('2022-03-01')",
+        ])
+
+    @skipUnless(connection.vendor == "postgresql", "Partitioning is only supported on PostgreSQL")
+    def test_maintain_moves_the_default_rows(self) -> None:
+        account, _ = Account.get_test_account()
+        handle = SocialMediaHandle.get_test_handle(Platform.Instagram, account)
+        handle_metric = InstagramHandleMetricModel.objects.create(handle=handle)
+        today = get_current_time().date()
+        months_ahead = 12
+        month = add_months(today, months_ahead)
+        partition_name = self.partitions.get_partition_name(month)
+        self.assertNotIn(partition_name, [name for _, name in self.partitions.get_partitions()])
+        InstagramHandleMetricModel.objects.filter(id=handle_metric.id).update(created_on=datetime.combine(month, datetime.min.time(), timezone.utc))
+        created, _ = self.partitions.maintain(today, months_ahead)
+        self.assertIn(partition_name, created)
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT id FROM "{partition_name}"')
+            self.assertEqual(cursor.fetchall(), [(handle_metric.id,)])
+            cursor.execute(self.partitions.get_default_rows_sql(month))
+            self.assertFalse(cursor.fetchone()[0])
+
+    def test_retention(self) -> None:
+        self.assertEqual(self.partitions.get_expired_months(date(2022, 1, 20), 0, self.existing), [])
+        self.assertEqual(self.partitions.get_expired_months(date(2022, 1, 20), 1, self.existing), [date(2021, 11, 1)])
+        self.assertEqual(self.partitions.get_retention_sql(date(2021, 11, 1), PartitionRetentionAction.Archive), [
+            f'ALTER TABLE "{self.table}" DETACH PARTITION "{self.table}_p2021_11"',
+            f'ALTER TABLE "{self.table}_p2021_11" RENAME TO "{self.table}_archive_2021_11"',
+        ])
+
+    @skipIf(connection.vendor == "postgresql", "The command maintains the partitions on PostgreSQL")
+    def test_command_is_a_noop_without_postgres(self) -> None:
+        stdout = StringIO()
+        call_command("maintain_metric_partitions", stdout=stdout)
+        self.assertIn("only supported on PostgreSQL", stdout.getvalue())
+
+    @skipUnless(connection.vendor == "postgresql", "Partitioning is only supported on PostgreSQL")
+    def test_command_reports_the_partitions(self) -> None:
+        month = add_months(get_current_time().date(), 12)
+        stdout = StringIO()
+        call_command("maintain_metric_partitions", "--months-ahead", "12", "--dry-run", stdout=stdout)
+        for model in (InstagramHandleMetricModel, YoutubeHandleMetricModel):
+            partitions = MonthlyPartitions(model)
+            self.assertIn(f"{partitions.table}: created ", stdout.getvalue())
+            self.assertIn(partitions.get_partition_name(month), stdout.getvalue())
+            self.assertNotIn(partitions.get_partition_name(month), [name for _, name in partitions.get_partitions()])
+
+    def test_latest_metrics_of_the_week(self) -> None:
+        account, _ = Account.get_test_account()
+        handle = SocialMediaHandle.get_test_handle(Platform.Instagram, account)
+        handle_metric = InstagramHandleMetricModel.objects.create(handle=handle)
+        self.assertEqual(handle_metric.expired_on - handle_metric.created_on, timedelta(days=7))
+        self.assertEqual(InstagramHandleMetricModel.objects.get_latest_metrics(handle).id, handle_metric.id)
+
+
+class TestUpdateAnalyticsFanOut(TestCase):
+
+    def setUp(self) -> None:
+        self.account, _ = Account.get_test_account()
+        self.instagram_handles = [SocialMediaHandle.get_test_handle(Platform.Instagram, self.account) for _ in range(5)]
+        self.youtube_handle = SocialMediaHandle.get_test_handle(Platform.Youtube, self.account)
+        disabled_handle = SocialMediaHandle.get_test_handle(Platform.Youtube, self.account)
+        disabled_handle.is_disabled = True
+        disabled_handle.save()
+        eager_conf = {"task_always_eager": True, "broker_url": "memory://"}
+        self.previous_conf = {key: celery_app.conf[key] for key in eager_conf}
+        celery_app.conf.update(eager_conf)
+        # The environment takes precedence over the namespaced CELERY_RESULT_BACKEND of celeryconfig
+        self.result_backend = patch.dict(os.environ, {"CELERY_RESULT_BACKEND": "cache+memory://"})
+        self.result_backend.start()
+
+    def tearDown(self) -> None:
+        self.result_backend.stop()
+        celery_app.conf.update(self.previous_conf)
+
+    def test_handle_ids_are_paged_in_chunks(self) -> None:
+        chunks = list(iter_handle_id_chunks(Platform.Instagram, 2))
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 1])
+        self.assertEqual(sum(chunks, []), [handle.id for handle in self.instagram_handles])
+        self.assertEqual(list(iter_handle_id_chunks(Platform.Youtube, 2)), [[self.youtube_handle.id]])
+
+    def test_chunks_are_routed_by_platform_and_summarized(self) -> None:
+        failing_handle_id = self.instagram_handles[0].id
+
+        async def update_handles(social_media_handles: List[SocialMediaHandle]) -> List[ScheduledResult]:
+            return [ScheduledResult(handle, error=ValueError() if handle.id == failing_handle_id else None)
+                    for handle in social_media_handles]
+
+        analytics_chord = build_analytics_chord(2)
+        queues = [subtask.options["queue"] for subtask in analytics_chord.tasks]
+        self.assertEqual(queues, ["analytics.instagram"] * 3 + ["analytics.youtube"])
+        with patch("insights.tasks.update_handles_analytics_async", update_handles), \
+                patch("insights.tasks.update_instagram_handles_analytics", async_to_sync(update_handles)):
+            summary = analytics_chord.apply().get()
+            self.assertIsNotNone(update_analytics(chunk_size=2))
+        self.assertEqual(summary[Platform.Instagram], {"succeeded": 4, "failed": 1, "chunks": 3})
+        self.assertEqual(summary[Platform.Youtube], {"succeeded": 1, "failed": 0, "chunks": 1})
+
+    def test_failing_chunk_is_summarized(self) -> None:
+        async def update_handles(social_media_handles: List[SocialMediaHandle]) -> List[ScheduledResult]:
+            return [ScheduledResult(handle) for handle in social_media_handles]
+
+        def update_instagram_handles(social_media_handles: List[SocialMediaHandle]) -> List[ScheduledResult]:
+            raise ConnectionError()
+
+        with patch("insights.tasks.update_handles_analytics_async", update_handles), \
+                patch("insights.tasks.update_instagram_handles_analytics", update_instagram_handles):
+            summary = build_analytics_chord(2).apply().get()
+        self.assertEqual(summary[Platform.Instagram], {"succeeded": 0, "failed": 5, "chunks": 3})
+        self.assertEqual(summary[Platform.Youtube], {"succeeded": 1, "failed": 0, "chunks": 1})
+
+    def test_backend_without_chords_is_refused(self) -> None:
+        with patch.dict(os.environ, {"CELERY_RESULT_BACKEND": "rpc://"}), self.assertRaises(ImproperlyConfigured):
+            update_analytics(chunk_size=2)
+
+
+class TestQueryPlans(TestCase):
+    """
+    Fails when a hot lookup stops using its index, the plans of seeded and analyzed tables are read with EXPLAIN
+    """
+    # Enough rows that a sequential scan of the seeded tables costs more than the index
+    handles_count = 1000
+    metric_handles_count = 40
+    weeks_count = 8
+    days_count = 60
+    metrics = ["impressions", "reach", "profile_views"]
+
+    def setUp(self) -> None:
+        self.account, _ = Account.get_test_account()
+        self.today = get_current_time().date()
+        now = get_current_time()
+        # Seeded platform by platform, the heap follows (platform, id) and the planner reads a page of the keyset paging
+        # from active_handle_platform_idx rather than filtering the pkey, as it does on interleaved rows
+        SocialMediaHandle.objects.bulk_create([
+            SocialMediaHandle(platform=platform, account=self.account, handle_url="some-test-url",
+                              handle_uid=f"{platform}-{index}", is_disabled=index % 4 == 0)
+            for platform in (Platform.Instagram, Platform.Youtube) for index in range(self.handles_count)
+        ], batch_size=1000)
+        enabled_handles = SocialMediaHandle.objects.filter(is_disabled=False).order_by("id")
+        metric_handles = [handle for platform in (Platform.Instagram, Platform.Youtube)
+                          for handle in enabled_handles.filter(platform=platform)[:self.metric_handles_count // 2]]
+        self.instagram_handle = next(handle for handle in metric_handles if handle.platform == Platform.Instagram)
+        self.youtube_handle = next(handle for handle in metric_handles if handle.platform == Platform.Youtube)
+        # Every enabled handle has a row per week, the latest one is still active
+        # The monthly partitions of the seeded weeks are created first, the rows would all land in the default partition otherwise
+        oldest = (now - timedelta(weeks=self.weeks_count, days=1)).date()
+        for metric_model, platform in ((InstagramHandleMetricModel, Platform.Instagram), (YoutubeHandleMetricModel, Platform.Youtube)):
+            partitions = MonthlyPartitions(metric_model)
+            if partitions.is_supported:
+                months = (self.today.year - oldest.year) * 12 + self.today.month - oldest.month
+                for month in partitions.get_missing_months(oldest, months, partitions.get_partitions()):
+                    partitions.create_partition(month)
+            metric_model.objects.bulk_create([
+                metric_model(handle_id=handle_id, created_on=now - timedelta(weeks=week, days=1),
+                             expired_on=now - timedelta(weeks=week, days=1) + METRICS_WEEK)
+                for handle_id in enabled_handles.filter(platform=platform).values_list("id", flat=True) for week in range(self.weeks_count)
+            ], batch_size=1000)
+        HandleMetricFact.objects.bulk_create([
+            HandleMetricFact(handle=handle, platform=handle.platform, day=self.today - timedelta(days=day), metric=metric, value=day)
+            for handle in metric_handles for day in range(self.days_count) for metric in self.metrics
+        ], batch_size=1000)
+        PlatformMetricRollup.objects.bulk_create([
+            PlatformMetricRollup(account=self.account, platform=platform, granularity=granularity,
+                                 period_start=self.today - timedelta(days=day), metric=metric, value=day)
+            for platform in (Platform.Instagram, Platform.Youtube)
+            for granularity, step in ((RollupGranularity.Day, 1), (RollupGranularity.Week, 7), (RollupGranularity.Month, 30))
+            for day in range(0, 2 * 365, step) for metric in self.metrics
+        ], batch_size=1000)
+        # The planners pick their indexes from the statistics of the seeded tables
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def get_index_names(self, model, index_name: str) -> List[str]:
+        """
+        Names under which the index shows up in the plans\n
+        On Postgres the partitions of a partitioned table are scanned through their own copy of the index,
+        SQLite names the index of a unique table constraint itself
+        """
+        if connection.vendor == "sqlite" and index_name in {constraint.name for constraint in model._meta.constraints}:
+            return [f"sqlite_autoindex_{model._meta.db_table}_1"]
+        if connection.vendor != "postgresql":
+            return [index_name]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT child.relname FROM pg_inherits "
+                "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+                "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+                "WHERE parent.relname = %s", [index_name])
+            return [index_name] + [row[0] for row in cursor.fetchall()]
+
+    def assertUsesIndex(self, queryset, index_name: str) -> None:
+        plan: str = queryset.explain()
+        index_names = self.get_index_names(queryset.model, index_name)
+        self.assertTrue(any(name in plan for name in index_names), f"{index_name} is not used by\n{plan}")
+
+    def test_latest_metrics(self) -> None:
+        now = get_current_time()
+        for metric_model, handle, index_name in ((InstagramHandleMetricModel, self.instagram_handle, "ig_metric_handle_expired_idx"),
+                                                 (YoutubeHandleMetricModel, self.youtube_handle, "yt_metric_handle_expired_idx")):
+            with self.subTest(metric_model=metric_model.__name__):
+                self.assertUsesIndex(metric_model.objects.filter(handle=handle, expired_on__gte=now, created_on__gte=now - timedelta(days=7)),
+                                     index_name)
+                self.assertUsesIndex(metric_model.objects.filter(handle=handle, expired_on__lte=now).order_by("-expired_on"), index_name)
+
+    def test_facts_of_handle_by_day(self) -> None:
+        lookup = Q(handle=self.instagram_handle) & Q(day__gte=self.today - timedelta(days=7)) & Q(day__lte=self.today) & Q(metric__in=["impressions"])
+        self.assertUsesIndex(HandleMetricFact.objects.get_daily_totals(lookup), "unique_handle_metric_fact")
+
+    def test_rollups_of_account_by_period(self) -> None:
+        lookup = Q(account=self.account) & Q(platform=Platform.Instagram) & Q(metric__in=["impressions"])
+        self.assertUsesIndex(PlatformMetricRollup.objects.get_period_totals(lookup, RollupGranularity.Week,
+                                                                            self.today - timedelta(days=30), self.today),
+                             "unique_platform_metric_rollup")
+
+    def test_active_handles(self) -> None:
+        self.assertUsesIndex(SocialMediaHandle.objects.filter(Q(handle_uid=self.instagram_handle.handle_uid) & Q(is_disabled=False)),
+                             "active_handle_uid_idx")
+        self.assertUsesIndex(SocialMediaHandle.objects.filter(platform=Platform.Instagram, is_disabled=False, id__gt=0)
+                             .order_by("id").values_list("id", flat=True)[:100], "active_handle_platform_idx")
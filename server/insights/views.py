@@ -1,14 +1,15 @@
 from datetime import datetime, timedelta
 import json
 
-from typing import Dict, Tuple, Union
+from typing import Dict, List, Tuple, Union
 from django.core.exceptions import BadRequest
 from django.db.models.query_utils import Q
 from django.http.request import QueryDict
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.request import Request
-from rest_framework.authentication import TokenAuthentication
+from accounts.authentication import CachedTokenAuthentication
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from django.db.models import QuerySet
 
@@ -18,11 +19,12 @@ from digger.base.digger import Digger
 from digger.instagram.digger import InstagramDigger
 from digger.youtube.digger import YoutubeDigger
 from insights.serializers import LinkwallInsightsSerializer, SocialMediaHandleSerializer
-from linktree.models import LinkClickCounterModel, LinkWall, LinkwallViewCounterModel
+from linktree.models import LinkWall, LinkwallDailyCounter
 from log_engine.log import logger
 from utils import datetime_to_unix_timestamp_string, get_current_time, unix_string_to_datetime
 from utils.errors import AccountAuthenticationFailed, AccountDoesNotExists, NoSocialMediaHandleExists, OAuthPlatformAuthorizationFailure
-from utils.types import Platform
+from utils.renderers import ORJSONRenderer
+from utils.types import MetricTableLayout, Platform, RollupGranularity
 from rest_framework.decorators import api_view, permission_classes
 
 
@@ -46,7 +48,7 @@ class CreateSocialMediaHandlesView(APIView):
     Creates social media accounts using `create_or_update_handles_from_data` api
     provided by each digger.
     """
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
     digger = None
     serializer = SocialMediaHandleSerializer
@@ -140,14 +142,41 @@ class RetrieveInsightsView(APIView):
     [filters]:
     start_date -- Start of the date time [Unix]
     end_date -- End of the date time [Unix]
+    layout -- rows (default) or columnar, see MetricTable.json
 
     The default end_date is today and start_date is a day before
     
     """
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated, AllowAny]
+    renderer_classes = [ORJSONRenderer, BrowsableAPIRenderer]
     digger: Digger = None
 
+    def get_layout(self, data: Dict) -> str:
+        # Not `format`, rest_framework reserves it for picking the renderer
+        layout = data.get("layout", MetricTableLayout.Rows)
+        if layout not in (MetricTableLayout.Rows, MetricTableLayout.Columnar):
+            raise BadRequest(f"layout must be {MetricTableLayout.Rows} or {MetricTableLayout.Columnar}")
+        return layout
+
+    def get_metric_names(self, data: Dict, private_metrics: List[str] = []) -> List[str]:
+        """
+        Metrics of the comma separated `metrics` filter, every metric of the platform by default, without the private metrics
+        """
+        metric_names = self.digger.get_metric_columns()
+        if (selection := data.get("metrics")):
+            requested = [metric_name.strip() for metric_name in selection.split(",") if metric_name.strip()]
+            if len(unknown := [metric_name for metric_name in requested if metric_name not in metric_names]) > 0:
+                raise BadRequest(f"Unknown metrics: {', '.join(unknown)}")
+            metric_names = requested
+        return [metric_name for metric_name in metric_names if metric_name not in private_metrics]
+
+    def get_granularity(self, data: Dict) -> str:
+        granularity = data.get("granularity", RollupGranularity.Day)
+        if granularity not in (RollupGranularity.Day, RollupGranularity.Week, RollupGranularity.Month):
+            raise BadRequest(f"granularity must be {RollupGranularity.Day}, {RollupGranularity.Week} or {RollupGranularity.Month}")
+        return granularity
+
     def get_date_filters(self,data, delta_days=1) -> Tuple[datetime, datetime]:
         default_end_date = datetime_to_unix_timestamp_string(get_current_time())
         default_start_date = datetime_to_unix_timestamp_string(get_current_time() - timedelta(days=delta_days))
@@ -155,7 +184,7 @@ class RetrieveInsightsView(APIView):
         start_date: datetime = unix_string_to_datetime(data.get("start_date",  default_start_date))
         return start_date, end_date
 
-    def setup(self, **kwargs) -> Tuple[datetime, datetime]:
+    def setup_filters(self, **kwargs) -> Tuple[datetime, datetime]:
         assert "platform" in kwargs and len(kwargs["platform"]) > 0, "Platform must be provided"
         platform = kwargs["platform"]
         self.digger = get_digger(platform)
@@ -176,8 +205,12 @@ class RetrievePlatformInsightsView(RetrieveInsightsView):
     [filters]:
     start_date -- Start of the date time
     end_date -- End of the date time
+    layout -- rows (default) or columnar
+    granularity -- day (default), week or month, rows of week and month start on the first day of the period
+    metrics -- Comma separated metric names e.g impressions,reach, every metric by default
 
     The default end_date is today and start_date is a day before
+    Rows are read from PlatformMetricRollup, prev_totals holds the totals of the days before start_date
     
     """
 
@@ -188,7 +221,9 @@ class RetrievePlatformInsightsView(RetrieveInsightsView):
         username = kwargs.get("username", None)
         try:
             platform = kwargs["platform"]
-            start_date, end_date = self.setup(data=data,**kwargs)
+            start_date, end_date = self.setup_filters(data=data,**kwargs)
+            layout = self.get_layout(data)
+            granularity = self.get_granularity(data)
             account: Account = request.account
             is_owner = False
             if (account is not None and username is not None and account.username == username) or (account is not None and username is None):
@@ -198,11 +233,13 @@ class RetrievePlatformInsightsView(RetrieveInsightsView):
                 if not account_queryset.exists():
                     raise AccountDoesNotExists(username)
                 account = account_queryset.first()
-            metric_table = self.digger.calculate_platform_metric(account, start_date, end_date)
             metric_filters = []
             if not is_owner:
-                metric_filters = account.platform_specific_private_metric[platform]
-            response["data"] = metric_table.json(*metric_filters)
+                metric_filters = account.platform_specific_private_metric.get(platform, [])
+            # Private metrics are left out of the query, not only out of the response
+            metric_names = self.get_metric_names(data, metric_filters)
+            metric_table = self.digger.calculate_platform_metric(account, start_date, end_date, granularity, metric_names)
+            response["data"] = metric_table.json(*metric_filters, layout=layout)
             _status = status.HTTP_200_OK
         except Exception as err:
             _status = status.HTTP_400_BAD_REQUEST
@@ -223,6 +260,8 @@ class RetrieveHandleInsightsView(RetrieveInsightsView):
     [filters]:
     start_date -- Start of the date
     end_date -- End of the date
+    layout -- rows (default) or columnar
+    metrics -- Comma separated metric names e.g impressions,reach, every metric by default
     """
 
     def get(self, request: Request, handle: str) -> Response:
@@ -234,17 +273,19 @@ class RetrieveHandleInsightsView(RetrieveInsightsView):
             if not handles.exists():
                 raise NoSocialMediaHandleExists("")
             handle: SocialMediaHandle = handles.first()
-            start_date, end_date = self.setup(data=data, platform=handle.platform)
+            start_date, end_date = self.setup_filters(data=data, platform=handle.platform)
+            layout = self.get_layout(data)
             is_owner = False
             if request.account is not None and handle.account == request.account:
                 is_owner = True
             account: Account = handle.account
             
-            metric_table = self.digger.get_handle_insights(handle, start_date, end_date)
             metric_filters = []
             if not is_owner:
-                metric_filters = account.platform_specific_private_metric[handle.platform]
-            response["data"] = metric_table.json(*metric_filters)
+                metric_filters = account.platform_specific_private_metric.get(handle.platform, [])
+            metric_names = self.get_metric_names(data, metric_filters)
+            metric_table = self.digger.get_handle_insights(handle, start_date, end_date, metric_names)
+            response["data"] = metric_table.json(*metric_filters, layout=layout)
             _status = status.HTTP_200_OK
         except Exception as err:
             _status = status.HTTP_400_BAD_REQUEST
@@ -259,7 +300,7 @@ class RetrieveHandleInsightsView(RetrieveInsightsView):
 
 
 class RetrieveLinkwallInsights(RetrieveInsightsView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
     serializer_class = LinkwallInsightsSerializer
 
@@ -278,10 +319,9 @@ class RetrieveLinkwallInsights(RetrieveInsightsView):
                 _status = status.HTTP_200_OK
                 response["data"] = "No linkwall found"
             linkwall: LinkWall = linkwall_queryset.first()
-            query = Q(linkwall = linkwall) & Q(created_on__gte=start_date) & Q(created_on__lte=end_date)
-            views_queryset: QuerySet[LinkwallViewCounterModel] = LinkwallViewCounterModel.objects.filter(query)
-            click_queryset: QuerySet[LinkClickCounterModel] = LinkClickCounterModel.objects.filter(query)
-            serialized = self.serializer_class(views_queryset, click_queryset)
+            counters: QuerySet[LinkwallDailyCounter] = LinkwallDailyCounter.objects.get_range(linkwall, start_date.date(), end_date.date())
+            unique_visitors = LinkwallDailyCounter.objects.count_unique_visitors(linkwall, start_date.date(), end_date.date())
+            serialized = self.serializer_class(counters, unique_visitors)
             response["data"] = serialized.data
             _status = status.HTTP_200_OK
         except Exception as err:
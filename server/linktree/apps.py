@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class LinktreeConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'linktree'
+
+    def ready(self) -> None:
+        # Registers the receivers invalidating the link wall snapshots
+        from linktree import signals
@@ -0,0 +1,518 @@
+from collections import deque
+from datetime import date, datetime, timedelta
+from hashlib import sha256
+from socket import gethostname
+from threading import Event, Lock, Thread
+from typing import Callable, Deque, Dict, List, NamedTuple, Set, Tuple, Union
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.http import HttpRequest
+from django.utils import timezone
+import atexit
+import orjson
+import os
+
+from linktree.managers import get_day_bounds, get_user_visitor
+from linktree.models import LinkClickCounterModel, LinkwallDailyCounter, LinkwallViewCounterModel
+from log_engine.log import logger
+from utils import get_current_time
+from utils.hyperloglog import HyperLogLog
+from utils.types import LinkwallEventActions
+
+
+# Cookie holding a random id of the anonymous visitors, set on their first view
+VISITOR_COOKIE = "LINKWALL_VISITOR"
+
+# Repeated views of a wall, or clicks of a link, by the same user within the window are counted once
+DEDUP_WINDOW = timedelta(hours=1)
+
+
+def to_naive_utc(time: datetime) -> datetime:
+    # get_current_time is naive UTC, the database hands back aware datetimes
+    return timezone.make_naive(time, timezone.utc) if timezone.is_aware(time) else time
+
+
+def get_request_visitor(request: HttpRequest) -> str:
+    """
+    Visitor fingerprint of a request, the user or else the visitor cookie, or else the ip and user agent\n
+    Anonymous sources are hashed with the SECRET_KEY, no cookie or ip ends up in the sketches
+    """
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated:
+        return get_user_visitor(user.id)
+    if (visitor_id := request.COOKIES.get(VISITOR_COOKIE)):
+        source = f"cookie:{visitor_id}"
+    else:
+        ip = request.META.get("HTTP_X_FORWARDED_FOR", "").split(",")[0].strip() or request.META.get("REMOTE_ADDR", "")
+        source = f"ip:{ip}|{request.META.get('HTTP_USER_AGENT', '')}"
+    return "anonymous:" + sha256(f"{settings.SECRET_KEY}|{source}".encode()).hexdigest()[:32]
+
+
+class LinkwallEvent(NamedTuple):
+    """
+    user_id is None for anonymous visitors, visitor is the fingerprint counted in the unique visitors
+    """
+    action: str
+    linkwall_id: int
+    user_id: Union[int, None]
+    created_on: datetime
+    link: str = ""
+    visitor: str = ""
+
+    def get_key(self) -> Tuple[str, int, int, str]:
+        return (self.action, self.linkwall_id, self.user_id, self.link)
+
+    def dumps(self) -> bytes:
+        return orjson.dumps(self._asdict())
+
+    @classmethod
+    def loads(cls, value: bytes) -> 'LinkwallEvent':
+        event = orjson.loads(value)
+        event["created_on"] = datetime.fromisoformat(event["created_on"])
+        return cls(**event)
+
+
+class EventBuffer:
+    """
+    Bounded queue of the events waiting to be written, `push` refuses events once `max_size` are queued\n
+    A popped batch is either acknowledged once written or requeued in front of the queue when the write fails\n
+    The back-pressure counters are kept with the queue, where every process pushing and flushing it can read them
+    """
+    max_size: int
+    counter_names = ("enqueued", "dropped", "duplicates", "written", "requeued")
+
+    def push(self, event: LinkwallEvent) -> bool:
+        """
+        Counts the event as enqueued, or dropped when the buffer is full
+        """
+        ...
+
+    def pop(self, count: int) -> List[LinkwallEvent]: ...
+
+    def ack(self, events: List[LinkwallEvent]) -> None: ...
+
+    def requeue(self, events: List[LinkwallEvent]) -> None: ...
+
+    def recover(self) -> int:
+        """
+        Requeues the batches left unacknowledged by flushing processes which died, returns the number of events
+        """
+        return 0
+
+    def incr(self, name: str, count: int = 1) -> None: ...
+
+    def get_counters(self, reset: bool = False) -> Dict[str, int]:
+        """
+        Returns the counters, reset to 0 at once when `reset`
+        """
+        ...
+
+    def __len__(self) -> int: ...
+
+
+class InMemoryEventBuffer(EventBuffer):
+    """
+    Per process buffer, flushed by the LinkwallEventFlusher thread of the process
+    """
+
+    def __init__(self, max_size: int = 10000) -> None:
+        self.max_size = max_size
+        self.events: Deque[LinkwallEvent] = deque()
+        self.counters: Dict[str, int] = dict.fromkeys(self.counter_names, 0)
+        self.lock = Lock()
+
+    def push(self, event: LinkwallEvent) -> bool:
+        with self.lock:
+            if len(self.events) >= self.max_size:
+                self.counters["dropped"] += 1
+                return False
+            self.events.append(event)
+            self.counters["enqueued"] += 1
+            return True
+
+    def pop(self, count: int) -> List[LinkwallEvent]:
+        with self.lock:
+            return [self.events.popleft() for _ in range(min(count, len(self.events)))]
+
+    def ack(self, events: List[LinkwallEvent]) -> None:
+        pass
+
+    def requeue(self, events: List[LinkwallEvent]) -> None:
+        """
+        Puts the batch back in front, past max_size if need be, the events were accepted already
+        """
+        with self.lock:
+            self.events.extendleft(reversed(events))
+
+    def incr(self, name: str, count: int = 1) -> None:
+        with self.lock:
+            self.counters[name] += count
+
+    def get_counters(self, reset: bool = False) -> Dict[str, int]:
+        with self.lock:
+            counters = dict(self.counters)
+            if reset:
+                self.counters = dict.fromkeys(self.counter_names, 0)
+        return counters
+
+    def __len__(self) -> int:
+        return len(self.events)
+
+
+class RedisEventBuffer(EventBuffer):
+    """
+    Redis list shared by every web process, flushed by the flush_linkwall_events task\n
+    A popped batch is moved to the processing list of the flushing process until it is acknowledged,
+    the batch of a process which died while writing is requeued by the next flush once its heartbeat expired\n
+    Needs the optional `redis` package, the size bound is checked before the push and may be overshot by concurrent pushes
+
+    Keyword Arguments:\n
+    url -- Redis connection url, e.g redis://localhost:6379/0\n
+    max_size -- Maximum number of queued events [default=10000]\n
+    processing_timeout -- Seconds a popped batch may take to be written before it is requeued [default=300]\n
+    """
+
+    def __init__(self, url: str, max_size: int = 10000, key: str = "linkwall:events", processing_timeout: int = 300) -> None:
+        try:
+            import redis
+        except ImportError as exc:
+            raise ImportError("RedisEventBuffer requires the redis package, install it with `pip install redis`") from exc
+        self.client = redis.Redis.from_url(url)
+        self.max_size = max_size
+        self.key = key
+        self.processing_timeout = processing_timeout
+
+    def get_counter_key(self, name: str) -> str:
+        return f"{self.key}:stats:{name}"
+
+    def push(self, event: LinkwallEvent) -> bool:
+        if self.client.llen(self.key) >= self.max_size:
+            self.incr("dropped")
+            return False
+        pipeline = self.client.pipeline(transaction=False)
+        pipeline.rpush(self.key, event.dumps())
+        pipeline.incr(self.get_counter_key("enqueued"))
+        pipeline.execute()
+        return True
+
+    # Moves the head of the list to the processing list and sets the heartbeat of the batch, atomically
+    pop_script = """
+    local values = redis.call('LRANGE', KEYS[1], 0, ARGV[1] - 1)
+    if #values > 0 then
+        redis.call('LTRIM', KEYS[1], #values, -1)
+        redis.call('RPUSH', KEYS[2], unpack(values))
+        redis.call('SET', KEYS[3], 1, 'EX', ARGV[2])
+    end
+    return values
+    """
+    # Puts the processing list back in front of the list, unless ARGV[1] is set and the heartbeat is alive
+    requeue_script = """
+    if ARGV[1] == '1' and redis.call('EXISTS', KEYS[3]) == 1 then
+        return 0
+    end
+    local values = redis.call('LRANGE', KEYS[2], 0, -1)
+    for index = #values, 1, -1 do
+        redis.call('LPUSH', KEYS[1], values[index])
+    end
+    redis.call('DEL', KEYS[2], KEYS[3])
+    return #values
+    """
+
+    @property
+    def processing_key(self) -> str:
+        # One processing list per process, the ingestor writes a single batch at a time
+        return f"{self.key}:processing:{gethostname()}:{os.getpid()}"
+
+    def get_heartbeat_key(self, processing_key: str) -> str:
+        return f"{self.key}:heartbeat:{processing_key[len(self.key) + len(':processing:'):]}"
+
+    def pop(self, count: int) -> List[LinkwallEvent]:
+        processing_key = self.processing_key
+        values = self.client.eval(self.pop_script, 3, self.key, processing_key, self.get_heartbeat_key(processing_key),
+                                  count, self.processing_timeout)
+        return [LinkwallEvent.loads(value) for value in values]
+
+    def ack(self, events: List[LinkwallEvent]) -> None:
+        processing_key = self.processing_key
+        self.client.delete(processing_key, self.get_heartbeat_key(processing_key))
+
+    def requeue(self, events: List[LinkwallEvent]) -> None:
+        processing_key = self.processing_key
+        self.client.eval(self.requeue_script, 3, self.key, processing_key, self.get_heartbeat_key(processing_key), 0)
+
+    def recover(self) -> int:
+        """
+        Requeues the processing lists whose heartbeat expired, e.g of a recycled worker process
+        """
+        recovered = 0
+        for processing_key in self.client.scan_iter(match=f"{self.key}:processing:*"):
+            processing_key = processing_key.decode() if isinstance(processing_key, bytes) else processing_key
+            recovered += self.client.eval(self.requeue_script, 3, self.key, processing_key, self.get_heartbeat_key(processing_key), 1)
+        return recovered
+
+    def incr(self, name: str, count: int = 1) -> None:
+        self.client.incrby(self.get_counter_key(name), count)
+
+    def get_counters(self, reset: bool = False) -> Dict[str, int]:
+        pipeline = self.client.pipeline(transaction=True)
+        for name in self.counter_names:
+            if reset:
+                pipeline.getset(self.get_counter_key(name), 0)
+            else:
+                pipeline.get(self.get_counter_key(name))
+        return {name: int(value or 0) for name, value in zip(self.counter_names, pipeline.execute())}
+
+    def __len__(self) -> int:
+        return self.client.llen(self.key)
+
+
+def get_default_buffer() -> EventBuffer:
+    """
+    Buffer named by LINKWALL_EVENT_BUFFER in the settings: "memory" (default) or a redis:// url
+    """
+    backend = getattr(settings, "LINKWALL_EVENT_BUFFER", "memory")
+    max_size = getattr(settings, "LINKWALL_EVENT_BUFFER_SIZE", 10000)
+    if backend.startswith("redis://") or backend.startswith("rediss://"):
+        return RedisEventBuffer(backend, max_size, processing_timeout=getattr(settings, "LINKWALL_EVENT_PROCESSING_TIMEOUT", 300))
+    return InMemoryEventBuffer(max_size)
+
+
+class LinkwallEventIngestor:
+    """
+    Queues linkwall views and clicks, and writes them in batches\n
+    Events repeated within DEDUP_WINDOW, in the batch or already written, are dropped on flush,
+    the others are inserted and added to the LinkwallDailyCounter of their day
+
+    Keyword Arguments:\n
+    buffer -- Queue of the events [default=get_default_buffer()]\n
+    clock -- Returns the time of an event [default=get_current_time]\n
+    batch_size -- Events popped and bulk inserted at once [default=settings.LINKWALL_EVENT_BATCH_SIZE]\n
+    flush_interval -- Seconds between flushes of the background thread, 0 leaves flushing to the caller
+                      [default=settings.LINKWALL_EVENT_FLUSH_INTERVAL]\n
+    """
+    counter_models = {LinkwallEventActions.View: LinkwallViewCounterModel, LinkwallEventActions.Click: LinkClickCounterModel}
+
+    def __init__(self, buffer: EventBuffer = None, clock: Callable[[], datetime] = get_current_time,
+                 batch_size: int = None, flush_interval: float = None) -> None:
+        self._buffer = buffer
+        self.clock = clock
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self.flusher: Union['LinkwallEventFlusher', None] = None
+        self.flush_lock = Lock()
+
+    @property
+    def buffer(self) -> EventBuffer:
+        # Resolved lazily, the ingestor is instantiated at import time, before the settings may be read
+        if self._buffer is None:
+            self._buffer = get_default_buffer()
+        return self._buffer
+
+    @property
+    def batch_size(self) -> int:
+        return self._batch_size or settings.LINKWALL_EVENT_BATCH_SIZE
+
+    @property
+    def flush_interval(self) -> float:
+        return settings.LINKWALL_EVENT_FLUSH_INTERVAL if self._flush_interval is None else self._flush_interval
+
+    def get_stats(self, reset: bool = False) -> Dict[str, int]:
+        """
+        Back-pressure metrics, `dropped` counts the events refused by a full buffer, `requeued` the events of failed writes\n
+        The counters are those of every process sharing the buffer, since they were last reset
+        """
+        return self.buffer.get_counters(reset) | {"depth": len(self.buffer), "capacity": self.buffer.max_size}
+
+    def report_stats(self) -> Dict[str, int]:
+        """
+        Returns the metrics since the last report and resets them, a warning is logged when events were dropped
+        """
+        stats = self.get_stats(reset=True)
+        if stats["dropped"] > 0:
+            logger.warning(f"Linkwall event buffer full, {stats['dropped']} events dropped, {stats['depth']}/{stats['capacity']} queued")
+        return stats
+
+    def enqueue(self, action: str, linkwall_id: int, user_id: Union[int, None], link: str = "", visitor: str = "") -> bool:
+        """
+        Returns False when the buffer is full and the event is dropped\n
+        The visitor of a user defaults to get_user_visitor(user_id)
+        """
+        if self.flusher is None and self.flush_interval > 0 and isinstance(self.buffer, InMemoryEventBuffer):
+            self.start_flusher()
+        if not visitor and user_id is not None:
+            visitor = get_user_visitor(user_id)
+        return self.buffer.push(LinkwallEvent(action, linkwall_id, user_id, self.clock(), link, visitor))
+
+    def start_flusher(self) -> None:
+        with self.flush_lock:
+            if self.flusher is None:
+                self.flusher = LinkwallEventFlusher(self, self.flush_interval)
+                self.flusher.start()
+                # The events still queued in memory would be lost with the process
+                atexit.register(self.shutdown)
+
+    def shutdown(self) -> None:
+        """
+        Stops the flusher thread and writes the queued events
+        """
+        if self.flusher is not None:
+            self.flusher.stop()
+        try:
+            self.flush()
+        except Exception as err:
+            logger.error(err)
+
+    def flush(self) -> int:
+        """
+        Writes every queued event in batches, returns the number of rows inserted\n
+        A batch which fails to be written is requeued and the error raised, the next flush retries it\n
+        The batches of dead flushing processes are requeued first
+        """
+        written = 0
+        with self.flush_lock:
+            if (recovered := self.buffer.recover()) > 0:
+                logger.warning(f"Requeued {recovered} linkwall events of a dead flushing process")
+                self.buffer.incr("requeued", recovered)
+            while len(events := self.buffer.pop(self.batch_size)) > 0:
+                try:
+                    written += self.write_batch(events)
+                except Exception:
+                    self.buffer.requeue(events)
+                    self.buffer.incr("requeued", len(events))
+                    raise
+                self.buffer.ack(events)
+        return written
+
+    def get_last_written(self, action: str, events: List[LinkwallEvent]) -> Dict[Tuple[str, int, int, str], datetime]:
+        """
+        Returns the time of the latest row written within the window of the events, by event key
+        """
+        fields = ["linkwall_id", "user_id", "created_on"] + (["link"] if action == LinkwallEventActions.Click else [])
+        rows = (self.counter_models[action].objects
+                .filter(linkwall_id__in={event.linkwall_id for event in events}, user_id__in={event.user_id for event in events},
+                        created_on__gt=min(event.created_on for event in events) - DEDUP_WINDOW,
+                        created_on__lte=max(event.created_on for event in events))
+                .values_list(*fields))
+        last_written: Dict[Tuple[str, int, int, str], datetime] = {}
+        for linkwall_id, user_id, created_on, *link in rows:
+            created_on = to_naive_utc(created_on)
+            key = (action, linkwall_id, user_id, link[0] if link else "")
+            if key not in last_written or last_written[key] < created_on:
+                last_written[key] = created_on
+        return last_written
+
+    def get_new_events(self, action: str, events: List[LinkwallEvent]) -> Tuple[List[LinkwallEvent], int]:
+        """
+        Returns (events, duplicates), the events of users for the action which are not repeated within DEDUP_WINDOW ordered by time,
+        and the number of repeated ones
+        """
+        action_events = sorted((event for event in events if event.action == action and event.user_id is not None),
+                               key=lambda event: event.created_on)
+        if len(action_events) == 0:
+            return action_events, 0
+        last_written = self.get_last_written(action, action_events)
+        new_events: List[LinkwallEvent] = []
+        for event in action_events:
+            key = event.get_key()
+            if key in last_written and event.created_on - last_written[key] < DEDUP_WINDOW:
+                continue
+            last_written[key] = event.created_on
+            new_events.append(event)
+        return new_events, len(action_events) - len(new_events)
+
+    def get_daily_viewers(self, views: List[LinkwallEvent]) -> Set[Tuple[int, int, date]]:
+        """
+        Returns (linkwall_id, user_id, day) of the views already written on the days of the views
+        """
+        if len(views) == 0:
+            return set()
+        start, end = get_day_bounds(views[0].created_on.date(), views[-1].created_on.date())
+        rows = (LinkwallViewCounterModel.objects
+                .filter(linkwall_id__in={event.linkwall_id for event in views}, user_id__in={event.user_id for event in views},
+                        created_on__gte=start, created_on__lt=end)
+                .values_list("linkwall_id", "user_id", "created_on"))
+        return {(linkwall_id, user_id, to_naive_utc(created_on).date()) for linkwall_id, user_id, created_on in rows}
+
+    def add_to_daily_counters(self, views: List[LinkwallEvent], clicks: List[LinkwallEvent], viewers: Set[Tuple[int, int, date]],
+                              visits: List[LinkwallEvent]) -> None:
+        """
+        Keyword Arguments:\n
+        views -- New views of users\n
+        clicks -- New clicks of users\n
+        viewers -- get_daily_viewers of the views\n
+        visits -- Every view of the batch, anonymous and repeated ones included, added to the visitors sketches\n
+        """
+        increments: Dict[Tuple[int, date], Dict] = {}
+        for event in views + clicks + visits:
+            increments.setdefault((event.linkwall_id, event.created_on.date()),
+                                  {"views": 0, "unique_viewers": 0, "clicks": 0, "link_clicks": {}, "visitors": HyperLogLog()})
+        for event in visits:
+            if event.visitor:
+                increments[(event.linkwall_id, event.created_on.date())]["visitors"].add(event.visitor)
+        for event in views:
+            increment = increments[(event.linkwall_id, event.created_on.date())]
+            increment["views"] += 1
+            if (viewer := (event.linkwall_id, event.user_id, event.created_on.date())) not in viewers:
+                viewers.add(viewer)
+                increment["unique_viewers"] += 1
+        for event in clicks:
+            increment = increments[(event.linkwall_id, event.created_on.date())]
+            increment["clicks"] += 1
+            increment["link_clicks"][event.link] = increment["link_clicks"].get(event.link, 0) + 1
+        for (linkwall_id, day), increment in increments.items():
+            LinkwallDailyCounter.objects.add(linkwall_id, day, **increment)
+
+    def write_batch(self, events: List[LinkwallEvent]) -> int:
+        """
+        Inserts the new events of the batch and adds them to the daily counters
+        """
+        events = [event._replace(created_on=to_naive_utc(event.created_on)) for event in events]
+        new_events: Dict[str, List[LinkwallEvent]] = {}
+        duplicates = 0
+        for action in self.counter_models:
+            new_events[action], action_duplicates = self.get_new_events(action, events)
+            duplicates += action_duplicates
+        viewers = self.get_daily_viewers(new_events[LinkwallEventActions.View])
+        written = 0
+        with transaction.atomic():
+            for action, counter_model in self.counter_models.items():
+                counter_model.objects.bulk_create([counter_model(linkwall_id=event.linkwall_id, user_id=event.user_id, created_on=event.created_on,
+                                                                 **({"link": event.link} if action == LinkwallEventActions.Click else {}))
+                                                   for event in new_events[action]], batch_size=self.batch_size)
+                written += len(new_events[action])
+            self.add_to_daily_counters(new_events[LinkwallEventActions.View], new_events[LinkwallEventActions.Click], viewers,
+                                       [event for event in events if event.action == LinkwallEventActions.View])
+        # Counted once committed, a failed batch is requeued and deduplicated again on retry
+        if duplicates > 0:
+            self.buffer.incr("duplicates", duplicates)
+        self.buffer.incr("written", written)
+        return written
+
+
+class LinkwallEventFlusher(Thread):
+    """
+    Daemon thread flushing the in-memory buffer of the process every `interval` seconds
+    """
+
+    def __init__(self, ingestor: LinkwallEventIngestor, interval: float) -> None:
+        super().__init__(name="linkwall-event-flusher", daemon=True)
+        self.ingestor = ingestor
+        self.interval = interval
+        self.stopped = Event()
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            try:
+                self.ingestor.flush()
+                # Only this process sees its in-memory buffer, the flush_linkwall_events task reports the redis one
+                self.ingestor.report_stats()
+            except Exception as err:
+                logger.error(err)
+            finally:
+                close_old_connections()
+
+    def stop(self) -> None:
+        self.stopped.set()
+
+
+linkwall_ingestor = LinkwallEventIngestor()
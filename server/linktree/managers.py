@@ -0,0 +1,131 @@
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Set, Tuple
+from django.db import models, transaction
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.db.models.query import QuerySet
+from django.utils import timezone
+
+from utils.hyperloglog import HyperLogLog
+
+
+def get_day_bounds(start_day: date, end_day: date) -> Tuple[datetime, datetime]:
+    """
+    Returns [start, end) of the UTC days, naive like get_current_time
+    """
+    return datetime.combine(start_day, time.min), datetime.combine(end_day + timedelta(days=1), time.min)
+
+
+def get_user_visitor(user_id: int) -> str:
+    """
+    Visitor fingerprint of an authenticated user, the raw rows can be replayed into the same sketch
+    """
+    return f"user:{user_id}"
+
+
+def build_daily_counters(counter_model: models.Model, view_model: models.Model, click_model: models.Model,
+                         start_day: date = None, end_day: date = None) -> List[models.Model]:
+    """
+    Aggregates the raw view and click rows into daily counters, GROUP BY linkwall, UTC day\n
+    The visitors sketch only holds the users of the raw rows, anonymous visitors are not stored raw\n
+    Models are passed in so that migrations can run it with the historical models
+
+    Keyword Arguments:\n
+    counter_model -- LinkwallDailyCounter\n
+    view_model -- LinkwallViewCounterModel\n
+    click_model -- LinkClickCounterModel\n
+    start_day -- First day aggregated, every day when None\n
+    end_day -- Last day aggregated, every day when None\n
+    """
+    lookup = {}
+    if start_day is not None and end_day is not None:
+        lookup["created_on__gte"], lookup["created_on__lt"] = get_day_bounds(start_day, end_day)
+    day = TruncDate("created_on", tzinfo=timezone.utc)
+    counters: Dict[Tuple[int, date], models.Model] = {}
+
+    def get_counter(linkwall_id: int, day: date) -> models.Model:
+        if (linkwall_id, day) not in counters:
+            counters[(linkwall_id, day)] = counter_model(linkwall_id=linkwall_id, day=day, link_clicks={})
+        return counters[(linkwall_id, day)]
+
+    views = (view_model.objects.filter(**lookup).annotate(day=day).values("linkwall_id", "day")
+             .annotate(views=Count("id"), unique_viewers=Count("user_id", distinct=True)).order_by())
+    for row in views:
+        counter = get_counter(row["linkwall_id"], row["day"])
+        counter.views, counter.unique_viewers = row["views"], row["unique_viewers"]
+    sketches: Dict[Tuple[int, date], HyperLogLog] = {}
+    viewers = view_model.objects.filter(**lookup).annotate(day=day).values_list("linkwall_id", "day", "user_id").distinct().order_by()
+    for linkwall_id, viewed_on, user_id in viewers.iterator(chunk_size=2000):
+        sketches.setdefault((linkwall_id, viewed_on), HyperLogLog()).add(get_user_visitor(user_id))
+    for key, sketch in sketches.items():
+        counters[key].visitors_sketch = sketch.to_bytes()
+    clicks = (click_model.objects.filter(**lookup).annotate(day=day).values("linkwall_id", "day", "link")
+              .annotate(clicks=Count("id")).order_by())
+    for row in clicks:
+        counter = get_counter(row["linkwall_id"], row["day"])
+        counter.clicks += row["clicks"]
+        counter.link_clicks[row["link"]] = row["clicks"]
+    return list(counters.values())
+
+
+class LinkwallDailyCounterManager(models.Manager):
+
+    def add(self, linkwall_id: int, day: date, views: int = 0, unique_viewers: int = 0, clicks: int = 0,
+            link_clicks: Dict[str, int] = None, visitors: HyperLogLog = None) -> models.Model:
+        """
+        Adds the events of a flushed batch to the counter of the day
+        """
+        with transaction.atomic():
+            counter, _ = self.select_for_update().get_or_create(linkwall_id=linkwall_id, day=day)
+            counter.views += views
+            counter.unique_viewers += unique_viewers
+            counter.clicks += clicks
+            for link, link_clicks_count in (link_clicks or {}).items():
+                counter.link_clicks[link] = counter.link_clicks.get(link, 0) + link_clicks_count
+            if visitors is not None:
+                counter.visitors_sketch = HyperLogLog.from_bytes(counter.visitors_sketch).merge(visitors).to_bytes()
+            counter.save()
+        return counter
+
+    def rebuild(self, start_day: date, end_day: date) -> int:
+        """
+        Recomputes the counters of the days from the raw rows, which must not be pruned yet\n
+        The stored counters are locked before the raw rows are read and updated in place, a batch flushed meanwhile
+        waits on them and adds its events on top of the rebuilt counts\n
+        The stored visitors sketches are merged in, they hold the anonymous visitors\n
+        Returns the number of counters written
+        """
+        from linktree.models import LinkClickCounterModel, LinkwallViewCounterModel
+        with transaction.atomic():
+            stored = {(counter.linkwall_id, counter.day): counter
+                      for counter in self.select_for_update().filter(day__gte=start_day, day__lte=end_day)}
+            created: List[models.Model] = []
+            rebuilt: Set[int] = set()
+            for counter in build_daily_counters(self.model, LinkwallViewCounterModel, LinkClickCounterModel, start_day, end_day):
+                stored_counter = stored.get((counter.linkwall_id, counter.day))
+                if stored_counter is None:
+                    created.append(counter)
+                    continue
+                stored_counter.views, stored_counter.unique_viewers = counter.views, counter.unique_viewers
+                stored_counter.clicks, stored_counter.link_clicks = counter.clicks, counter.link_clicks
+                stored_counter.visitors_sketch = (HyperLogLog.from_bytes(stored_counter.visitors_sketch)
+                                                  .merge(HyperLogLog.from_bytes(counter.visitors_sketch)).to_bytes())
+                rebuilt.add(stored_counter.pk)
+            for stored_counter in stored.values():
+                # Days without raw rows left keep only the anonymous visitors of their sketches
+                if stored_counter.pk not in rebuilt:
+                    stored_counter.views = stored_counter.unique_viewers = stored_counter.clicks = 0
+                    stored_counter.link_clicks = {}
+            updated = list(stored.values())
+            self.bulk_update(updated, ["views", "unique_viewers", "clicks", "link_clicks", "visitors_sketch"], batch_size=1000)
+            self.bulk_create(created, batch_size=1000)
+        return len(updated) + len(created)
+
+    def get_range(self, linkwall: models.Model, start_day: date, end_day: date) -> QuerySet:
+        return self.filter(linkwall=linkwall, day__gte=start_day, day__lte=end_day).order_by("day")
+
+    def count_unique_visitors(self, linkwall: models.Model, start_day: date, end_day: date) -> int:
+        """
+        Estimates the distinct visitors of the range by merging the daily sketches
+        """
+        return HyperLogLog.merge_all(self.get_range(linkwall, start_day, end_day).values_list("visitors_sketch", flat=True)).count()
@@ -0,0 +1,39 @@
+# Generated by Django 4.0 on 2026-10-18 14:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+from linktree.managers import build_daily_counters
+
+
+def backfill_daily_counters(apps, schema_editor) -> None:
+    counter_model = apps.get_model("linktree", "LinkwallDailyCounter")
+    counters = build_daily_counters(counter_model, apps.get_model("linktree", "LinkwallViewCounterModel"),
+                                    apps.get_model("linktree", "LinkClickCounterModel"))
+    counter_model.objects.bulk_create(counters, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('linktree', '0004_auto_20220202_1630'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LinkwallDailyCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('views', models.PositiveIntegerField(default=0)),
+                ('unique_viewers', models.PositiveIntegerField(default=0)),
+                ('clicks', models.PositiveIntegerField(default=0)),
+                ('link_clicks', models.JSONField(default=dict)),
+                ('linkwall', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='daily_counters', to='linktree.linkwall')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='linkwalldailycounter',
+            constraint=models.UniqueConstraint(fields=('linkwall', 'day'), name='unique_linkwall_daily_counter'),
+        ),
+        migrations.RunPython(backfill_daily_counters, migrations.RunPython.noop),
+    ]
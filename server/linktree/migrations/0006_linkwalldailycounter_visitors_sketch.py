@@ -0,0 +1,32 @@
+# Generated by Django 4.0 on 2026-10-18 14:06
+
+from django.db import migrations, models
+from linktree.managers import build_daily_counters
+
+
+def backfill_visitors_sketches(apps, schema_editor) -> None:
+    counter_model = apps.get_model("linktree", "LinkwallDailyCounter")
+    built = {(counter.linkwall_id, counter.day): counter for counter in build_daily_counters(
+        counter_model, apps.get_model("linktree", "LinkwallViewCounterModel"), apps.get_model("linktree", "LinkClickCounterModel"))}
+    counters = []
+    for counter in counter_model.objects.only("id", "linkwall_id", "day").iterator(chunk_size=1000):
+        if (counter.linkwall_id, counter.day) in built:
+            counter.visitors_sketch = built[(counter.linkwall_id, counter.day)].visitors_sketch
+            counters.append(counter)
+    counter_model.objects.bulk_update(counters, ["visitors_sketch"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('linktree', '0005_linkwalldailycounter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='linkwalldailycounter',
+            name='visitors_sketch',
+            field=models.BinaryField(default=bytes),
+        ),
+        migrations.RunPython(backfill_visitors_sketches, migrations.RunPython.noop),
+    ]
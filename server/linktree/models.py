@@ -6,8 +6,9 @@ from django.db import models
 from django.db.models.query import QuerySet
 from django.db.models.query_utils import Q
 from accounts.models import Account, SocialMediaHandle
+from linktree.managers import LinkwallDailyCounterManager
 from utils import get_current_time, get_modified_time
-from utils.types import LinkwallLinkTypes
+from utils.types import LinkwallEventActions, LinkwallLinkTypes
 # Create your models here.
 
 
@@ -95,39 +96,23 @@ class LinkWall(models.Model):
             )
         return linkwall_queryset.first()
     
-    @staticmethod
-    def get_bound_time(self) -> datetime:
-        return get_modified_time(hours=1)
-
     def sync_media_handles(self) -> None:
         self.set_media_handles(self.media_handles)
-    
-    def get_time_bound_query(self) -> Q:
-        current_time = get_current_time()
-        min_time_bound = self.get_bound_time()
-        return Q(created_on__lte = current_time) & Q(created_on__gte=min_time_bound)
-
-    def add_view(self, user: User) -> None:
-        time_bound_query = self.get_time_bound_query()
-        query = Q(user=user) & Q(linkwall=self) & time_bound_query
-        counter_queryset: QuerySet[LinkwallViewCounterModel] = LinkwallViewCounterModel.objects.filter(query)
-        if not counter_queryset.exists():
-            counter = LinkwallViewCounterModel(
-                 user=user, linkwall=self, created_on=get_current_time())
-            counter.save()
-            self.clicks.add(counter)
-
-    def add_click(self, user: User, link: str) -> None:
-        time_bound_query = self.get_time_bound_query()
-        query = Q(user=user) & Q(linkwall=self) & Q(link=link) & time_bound_query
-        counter_queryset: QuerySet[LinkClickCounterModel]  = LinkClickCounterModel.objects.filter(query)
-        if not counter_queryset.exists():
-            counter = LinkClickCounterModel(user=user,
-                                            linkwall=self, link=link,
-                                            created_on=get_current_time()
-                                            )
-            counter.save()
-            self.clicks.add(counter)
+
+    def add_view(self, user: User = None, visitor: str = "") -> bool:
+        """
+        Queues a view of the wall, returns False when the event buffer is full\n
+        Views of anonymous visitors (user None) only count towards the unique visitors
+        """
+        from linktree.ingestion import linkwall_ingestor
+        return linkwall_ingestor.enqueue(LinkwallEventActions.View, self.id, None if user is None else user.id, visitor=visitor)
+
+    def add_click(self, user: User, link: str) -> bool:
+        """
+        Queues a click of a link of the wall, returns False when the event buffer is full
+        """
+        from linktree.ingestion import linkwall_ingestor
+        return linkwall_ingestor.enqueue(LinkwallEventActions.Click, self.id, user.id, link)
 
 class LinkwallViewCounterModel(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -140,3 +125,32 @@ class LinkClickCounterModel(models.Model):
     linkwall = models.ForeignKey(LinkWall, on_delete=models.CASCADE)
     link = models.TextField(default="")
     created_on = models.DateTimeField(default=get_current_time)
+
+
+class LinkwallDailyCounter(models.Model):
+    """
+    Views and clicks of a link wall in a UTC day, written on ingest and recomputed by compact_linkwall_counters
+
+    linkwall -- LinkWall counted
+    day -- UTC day
+    views -- Number of views, repeated views within an hour are counted once
+    unique_viewers -- Number of distinct users who viewed the wall in the day
+    clicks -- Number of clicks on every link
+    link_clicks -- Clicks by link url, {url: clicks}
+    visitors_sketch -- HyperLogLog bytes of the visitor fingerprints, anonymous visitors included
+    """
+    linkwall = models.ForeignKey(LinkWall, on_delete=models.CASCADE, related_name="daily_counters", db_index=False)
+    day = models.DateField()
+    views = models.PositiveIntegerField(default=0)
+    unique_viewers = models.PositiveIntegerField(default=0)
+    clicks = models.PositiveIntegerField(default=0)
+    link_clicks = models.JSONField(default=dict)
+    visitors_sketch = models.BinaryField(default=bytes)
+
+    objects = LinkwallDailyCounterManager()
+
+    class Meta:
+        # Leads with linkwall, it serves the range reads of the insights and the foreign key
+        constraints = [
+            models.UniqueConstraint(fields=["linkwall", "day"], name="unique_linkwall_daily_counter"),
+        ]
@@ -0,0 +1,47 @@
+from django.db.models import QuerySet
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from accounts.models import Account
+from linktree.models import LinkWall, LinkWallLink, LinkwallMediaHandles
+from linktree.snapshot import linkwall_snapshots
+
+
+def invalidate_walls(linkwalls: QuerySet[LinkWall]) -> None:
+    linkwall_snapshots.invalidate(linkwalls.values_list("account__username", flat=True))
+
+
+@receiver(post_save, sender=LinkWall)
+@receiver(post_delete, sender=LinkWall)
+def invalidate_linkwall_snapshot(sender, instance: LinkWall, **kwargs) -> None:
+    # The account may be deleted along with the wall, its own receiver drops the snapshot then
+    linkwall_snapshots.invalidate(Account.objects.filter(id=instance.account_id).values_list("username", flat=True))
+
+
+@receiver(m2m_changed, sender=LinkWall.links.through)
+@receiver(m2m_changed, sender=LinkWall.media_handles.through)
+def invalidate_linkwall_relations_snapshot(sender, instance, action: str, reverse: bool, pk_set, **kwargs) -> None:
+    if not action.startswith("post_"):
+        return
+    if reverse:
+        # Walls holding the link or media handle
+        invalidate_walls(instance.links.all())
+    else:
+        linkwall_snapshots.invalidate([instance.account.username])
+
+
+@receiver(post_save, sender=LinkWallLink)
+@receiver(pre_delete, sender=LinkWallLink)
+@receiver(post_save, sender=LinkwallMediaHandles)
+@receiver(pre_delete, sender=LinkwallMediaHandles)
+def invalidate_item_snapshot(sender, instance, **kwargs) -> None:
+    """
+    Links and media handles are shared through many to many fields, the walls are read before the rows are deleted
+    """
+    invalidate_walls(instance.links.all())
+
+
+@receiver(post_save, sender=Account)
+@receiver(post_delete, sender=Account)
+def invalidate_account_snapshot(sender, instance: Account, **kwargs) -> None:
+    linkwall_snapshots.invalidate([instance.username])
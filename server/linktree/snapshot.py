@@ -0,0 +1,94 @@
+from hashlib import sha256
+from typing import Iterable, NamedTuple, Union
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+import orjson
+
+from linktree.models import LinkWall
+from linktree.serializer import LinkWallSerializer, LinkWallSerialzedType
+from utils import get_cache_timeout
+
+
+class LinkWallSnapshot(NamedTuple):
+    """
+    Serialized public link wall, without the per viewer `is_owner` flag
+
+    data -- LinkWallSerializer output of the wall\n
+    digest -- sha256 of the data, the ETag of the snapshot
+    """
+    data: LinkWallSerialzedType
+    digest: str
+
+    def get_etag(self, is_owner: bool) -> str:
+        return f'"{self.digest}-{int(is_owner)}"'
+
+    def get_data(self, is_owner: bool) -> LinkWallSerialzedType:
+        return self.data | {"is_owner": is_owner}
+
+
+class LinkWallSnapshotCache:
+    """
+    Keeps the serialized public link walls by username in one of the CACHES of the django settings\n
+    Snapshots are rebuilt after every ManageLinkwallAPIView action and dropped on any other change of a wall,
+    a per-process cache keeps them a few seconds as the other workers never see these changes
+
+    Keyword Arguments:\n
+    alias -- Alias of the cache in CACHES [default=settings.LINKWALL_SNAPSHOT_CACHE]\n
+    timeout -- Seconds a snapshot is kept [default=settings.LINKWALL_SNAPSHOT_TTL]\n
+    """
+    key_prefix = "linkwall:snapshot:"
+    serializer = LinkWallSerializer()
+
+    def __init__(self, alias: str = None, timeout: int = None) -> None:
+        self.alias = alias or settings.LINKWALL_SNAPSHOT_CACHE
+        self.timeout = settings.LINKWALL_SNAPSHOT_TTL if timeout is None else timeout
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def set(self, username: str, snapshot: LinkWallSnapshot) -> None:
+        self.cache.set(self.get_key(username), snapshot, get_cache_timeout(self.cache, self.timeout))
+
+    def get_key(self, username: str) -> str:
+        return f"{self.key_prefix}{username}"
+
+    def build(self, username: str) -> Union[LinkWallSnapshot, None]:
+        """
+        Serializes the wall of the username, None when there is no wall
+        """
+        linkwall: LinkWall = (LinkWall.objects.select_related("account").prefetch_related("media_handles")
+                              .filter(account__username=username).first())
+        if linkwall is None:
+            return None
+        data: LinkWallSerialzedType = self.serializer(linkwall)
+        if "error" in data:
+            return None
+        data.pop("is_owner", None)
+        return LinkWallSnapshot(data, sha256(orjson.dumps(data, option=orjson.OPT_SORT_KEYS)).hexdigest())
+
+    def get(self, username: str) -> Union[LinkWallSnapshot, None]:
+        snapshot: Union[LinkWallSnapshot, None] = self.cache.get(self.get_key(username))
+        if snapshot is None and (snapshot := self.build(username)) is not None:
+            self.set(username, snapshot)
+        return snapshot
+
+    def refresh(self, username: str) -> Union[LinkWallSnapshot, None]:
+        snapshot = self.build(username)
+        if snapshot is None:
+            self.cache.delete(self.get_key(username))
+        else:
+            self.set(username, snapshot)
+        return snapshot
+
+    def invalidate(self, usernames: Iterable[str]) -> None:
+        """
+        Drops the snapshots once the current transaction commits
+        """
+        keys = [self.get_key(username) for username in usernames]
+        if len(keys) > 0:
+            transaction.on_commit(lambda: self.cache.delete_many(keys))
+
+
+linkwall_snapshots = LinkWallSnapshotCache()
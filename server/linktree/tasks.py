@@ -7,3 +7,43 @@
 # def update_views(user_id: str) -> None:
 #     user = User.objects.filter(id=user_id)
 
+
+
+from celery import shared_task
+from datetime import timedelta
+from typing import Dict, Union
+from django.conf import settings
+from linktree.ingestion import RedisEventBuffer, linkwall_ingestor
+from linktree.managers import get_day_bounds
+from linktree.models import LinkClickCounterModel, LinkwallDailyCounter, LinkwallViewCounterModel
+from utils import get_current_time
+
+
+@shared_task
+def flush_linkwall_events() -> Union[Dict[str, int], None]:
+    """
+    Writes the linkwall events of the shared redis buffer and reports its back-pressure metrics since the last run\n
+    The in-memory buffers are flushed and reported by the flusher thread of their own process, None is returned
+    """
+    if not isinstance(linkwall_ingestor.buffer, RedisEventBuffer):
+        return None
+    linkwall_ingestor.flush()
+    return linkwall_ingestor.report_stats()
+
+
+@shared_task
+def compact_linkwall_counters() -> Dict[str, int]:
+    """
+    Recomputes the daily counters of yesterday from the raw rows,
+    then prunes the raw rows older than LINKWALL_EVENT_RETENTION_DAYS\n
+    Today and yesterday are always kept, ingestion reads them to count unique viewers
+    """
+    today = get_current_time().date()
+    yesterday = today - timedelta(days=1)
+    compacted = LinkwallDailyCounter.objects.rebuild(yesterday, yesterday)
+    pruned = 0
+    if settings.LINKWALL_EVENT_RETENTION_DAYS > 0:
+        before, _ = get_day_bounds(today - timedelta(days=max(settings.LINKWALL_EVENT_RETENTION_DAYS, 1)), today)
+        for counter_model in (LinkwallViewCounterModel, LinkClickCounterModel):
+            pruned += counter_model.objects.filter(created_on__lt=before).delete()[0]
+    return {"compacted": compacted, "pruned": pruned}
@@ -0,0 +1,258 @@
+from datetime import datetime, timedelta
+from typing import List
+from unittest.mock import patch
+from django.db import connection
+from django.test import TestCase
+from django.test.client import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+
+from accounts.models import Account
+from linktree.ingestion import VISITOR_COOKIE, InMemoryEventBuffer, LinkwallEvent, LinkwallEventIngestor
+from linktree.models import LinkClickCounterModel, LinkWall, LinkwallDailyCounter, LinkwallViewCounterModel
+from linktree.tasks import compact_linkwall_counters, flush_linkwall_events
+from utils import date_to_string, datetime_to_unix_timestamp_string, get_current_time
+from utils.types import EntityType, LinkwallEventActions
+
+
+class FakeClock:
+
+    def __init__(self, now: datetime) -> None:
+        self.now = now
+
+    def __call__(self) -> datetime:
+        return self.now
+
+    def advance(self, **kwargs) -> None:
+        self.now += timedelta(**kwargs)
+
+
+class StaleBatchEventBuffer(InMemoryEventBuffer):
+    """
+    Holds the batch of a flushing process which died, until recover() requeues it
+    """
+
+    def __init__(self, stale: List[LinkwallEvent], max_size: int = 10000) -> None:
+        super().__init__(max_size)
+        self.stale = stale
+
+    def recover(self) -> int:
+        recovered, self.stale = self.stale, []
+        self.requeue(recovered)
+        return len(recovered)
+
+
+class TestLinkwallEventIngestor(TestCase):
+
+    def setUp(self) -> None:
+        self.owner = Account.objects.create(email="bytatigrisdev2022@gmail.com", first_name="Byta", last_name="Tigris",
+                                            username="bitatigris", entity_type=EntityType.Creator, password="helloword103")
+        self.visitor = Account.objects.create(email="visitor2022@gmail.com", first_name="Visi", last_name="Tor",
+                                              username="visitor", entity_type=EntityType.Creator, password="helloword103")
+        self.linkwall = LinkWall.get_or_create(self.owner)
+        self.clock = FakeClock(datetime(2022, 1, 20, 10))
+        self.ingestor = LinkwallEventIngestor(InMemoryEventBuffer(max_size=4), clock=self.clock, batch_size=2, flush_interval=0)
+
+    def test_events_are_written_in_batches_and_deduped(self) -> None:
+        user_id = self.visitor.user.id
+        self.ingestor.enqueue(LinkwallEventActions.View, self.linkwall.id, user_id)
+        self.clock.advance(minutes=30)
+        self.ingestor.enqueue(LinkwallEventActions.View, self.linkwall.id, user_id)
+        self.ingestor.enqueue(LinkwallEventActions.Click, self.linkwall.id, user_id, "https://example.com")
+        self.ingestor.enqueue(LinkwallEventActions.Click, self.linkwall.id, user_id, "https://example.com/other")
+        self.assertEqual(self.ingestor.flush(), 3)
+        self.assertEqual(LinkwallViewCounterModel.objects.filter(linkwall=self.linkwall).count(), 1)
+        self.assertEqual(LinkClickCounterModel.objects.filter(linkwall=self.linkwall).count(), 2)
+
+        # Within the window of the written view, then past it
+        self.clock.advance(minutes=20)
+        self.ingestor.enqueue(LinkwallEventActions.View, self.linkwall.id, user_id)
+        self.clock.advance(minutes=20)
+        self.ingestor.enqueue(LinkwallEventActions.View, self.linkwall.id, user_id)
+        self.assertEqual(self.ingestor.flush(), 1)
+        self.assertEqual(LinkwallViewCounterModel.objects.filter(linkwall=self.linkwall).count(), 2)
+        self.assertEqual(self.ingestor.get_stats(), {"enqueued": 6, "dropped": 0, "duplicates": 2, "written": 4,
+                                                     "requeued": 0, "depth": 0, "capacity": 4})
+
+    def test_full_buffer_refuses_events(self) -> None:
+        for _ in range(4):
+            self.assertTrue(self.ingestor.enqueue(LinkwallEventActions.View, self.linkwall.id, self.visitor.user.id))
+        self.assertFalse(self.ingestor.enqueue(LinkwallEventActions.View, self.linkwall.id, self.visitor.user.id))
+        stats = self.ingestor.get_stats()
+        self.assertEqual((stats["dropped"], stats["depth"]), (1, 4))
+
+    def test_stats_are_reported_since_the_last_report(self) -> None:
+        for _ in range(5):
+            self.ingestor.enqueue(LinkwallEventActions.View, self.linkwall.id, self.visitor.user.id)
+        with patch("linktree.ingestion.logger.warning") as warning:
+            stats = self.ingestor.report_stats()
+        self.assertEqual((stats["enqueued"], stats["dropped"], stats["depth"]), (4, 1, 4))
+        self.assertIn("1 events dropped", warning.call_args.args[0])
+        with patch("linktree.ingestion.logger.warning") as warning:
+            stats = self.ingestor.report_stats()
+        self.assertEqual((stats["enqueued"], stats["dropped"], stats["depth"]), (0, 0, 4))
+        warning.assert_not_called()
+
+    def test_flush_task_leaves_in_memory_buffers_to_their_process(self) -> None:
+        self.assertIsNone(flush_linkwall_events())
+
+    def test_failed_batch_is_requeued(self) -> None:
+        for minutes in range(3):
+            self.clock.advance(minutes=minutes)
+            self.ingestor.enqueue(LinkwallEventActions.View, self.linkwall.id, self.visitor.user.id)
+        queued = list(self.ingestor.buffer.events)
+        with patch.object(LinkwallDailyCounter.objects, "add", side_effect=RuntimeError("database is gone")):
+            with self.assertRaises(RuntimeError):
+                self.ingestor.flush()
+        self.assertEqual(list(self.ingestor.buffer.events), queued)
+        self.assertEqual(LinkwallViewCounterModel.objects.filter(linkwall=self.linkwall).count(), 0)
+        self.assertEqual(self.ingestor.get_stats()["requeued"], 2)
+        self.assertEqual(self.ingestor.get_stats()["duplicates"], 0)
+        self.assertEqual(self.ingestor.flush(), 1)
+        self.assertEqual(len(self.ingestor.buffer), 0)
+        # The duplicates of the failed batch are only counted once written
+        self.assertEqual(self.ingestor.get_stats()["duplicates"], 2)
+
+    def test_batches_of_dead_processes_are_recovered(self) -> None:
+        stale = [LinkwallEvent(LinkwallEventActions.View, self.linkwall.id, self.visitor.user.id, self.clock())]
+        ingestor = LinkwallEventIngestor(StaleBatchEventBuffer(stale), clock=self.clock, batch_size=2, flush_interval=0)
+        self.assertEqual(ingestor.flush(), 1)
+        self.assertEqual(LinkwallViewCounterModel.objects.filter(linkwall=self.linkwall).count(), 1)
+        self.assertEqual(ingestor.get_stats()["requeued"], 1)
+
+    def test_queued_events_are_flushed_at_exit(self) -> None:
+        ingestor = LinkwallEventIngestor(InMemoryEventBuffer(), clock=self.clock, batch_size=2, flush_interval=60)
+        with patch("linktree.ingestion.atexit.register") as register:
+            ingestor.enqueue(LinkwallEventActions.View, self.linkwall.id, self.visitor.user.id)
+        register.assert_called_once_with(ingestor.shutdown)
+        ingestor.shutdown()
+        self.assertTrue(ingestor.flusher.stopped.is_set())
+        self.assertEqual(LinkwallViewCounterModel.objects.filter(linkwall=self.linkwall).count(), 1)
+
+    def test_event_serialization(self) -> None:
+        event = LinkwallEvent(LinkwallEventActions.Click, 1, 2, self.clock(), "https://example.com")
+        self.assertEqual(LinkwallEvent.loads(event.dumps()), event)
+
+    def test_view_enqueues_events(self) -> None:
+        token = Token.objects.create(user=self.visitor.user)
+        client = Client(HTTP_AUTHORIZATION=f"Token {token.key}")
+        url = reverse("linkwall-action", args=[self.owner.username])
+        with patch("linktree.ingestion.linkwall_ingestor", self.ingestor):
+            self.assertEqual(client.get(url, {"action": LinkwallEventActions.View}).status_code, 200)
+            self.assertEqual(client.get(url, {"action": LinkwallEventActions.Click, "link": "https://example.com"}).status_code, 200)
+            self.assertEqual(LinkwallViewCounterModel.objects.count(), 0)
+            self.assertEqual(len(self.ingestor.buffer), 2)
+            for _ in range(2):
+                client.get(url, {"action": LinkwallEventActions.View})
+            self.assertEqual(client.get(url, {"action": LinkwallEventActions.View}).status_code, 503)
+        self.assertEqual(self.ingestor.flush(), 2)
+
+
+class TestLinkwallDailyCounter(TestCase):
+
+    def setUp(self) -> None:
+        self.owner = Account.objects.create(email="bytatigrisdev2022@gmail.com", first_name="Byta", last_name="Tigris",
+                                            username="bitatigris", entity_type=EntityType.Creator, password="helloword103")
+        self.visitors = [Account.objects.create(email=f"visitor{index}@gmail.com", first_name="Visi", last_name="Tor",
+                                                username=f"visitor{index}", entity_type=EntityType.Creator, password="helloword103")
+                         for index in range(2)]
+        self.linkwall = LinkWall.get_or_create(self.owner)
+        self.clock = FakeClock(get_current_time().replace(hour=10, minute=0, second=0, microsecond=0) - timedelta(days=1))
+        self.ingestor = LinkwallEventIngestor(InMemoryEventBuffer(), clock=self.clock, batch_size=3, flush_interval=0)
+
+    def ingest_day(self) -> None:
+        for visitor in self.visitors:
+            self.ingestor.enqueue(LinkwallEventActions.View, self.linkwall.id, visitor.user.id)
+            self.ingestor.enqueue(LinkwallEventActions.Click, self.linkwall.id, visitor.user.id, "https://example.com")
+        self.clock.advance(hours=2)
+        self.ingestor.enqueue(LinkwallEventActions.View, self.linkwall.id, self.visitors[0].user.id)
+        self.ingestor.enqueue(LinkwallEventActions.Click, self.linkwall.id, self.visitors[0].user.id, "https://example.com/other")
+        self.ingestor.flush()
+
+    def test_counters_are_kept_on_ingest(self) -> None:
+        self.ingest_day()
+        counter = LinkwallDailyCounter.objects.get(linkwall=self.linkwall)
+        self.assertEqual((counter.day, counter.views, counter.unique_viewers, counter.clicks),
+                         (self.clock().date(), 3, 2, 3))
+        self.assertEqual(counter.link_clicks, {"https://example.com": 2, "https://example.com/other": 1})
+
+    def test_compaction_rebuilds_and_prunes(self) -> None:
+        self.ingest_day()
+        expected = LinkwallDailyCounter.objects.values("day", "views", "unique_viewers", "clicks", "link_clicks").get()
+        LinkwallDailyCounter.objects.all().delete()
+        with self.settings(LINKWALL_EVENT_RETENTION_DAYS=0):
+            self.assertEqual(compact_linkwall_counters(), {"compacted": 1, "pruned": 0})
+        self.assertEqual(LinkwallDailyCounter.objects.values("day", "views", "unique_viewers", "clicks", "link_clicks").get(), expected)
+
+        LinkwallViewCounterModel.objects.update(created_on=self.clock() - timedelta(days=5))
+        with self.settings(LINKWALL_EVENT_RETENTION_DAYS=3):
+            self.assertEqual(compact_linkwall_counters()["pruned"], 3)
+        self.assertEqual(LinkClickCounterModel.objects.count(), 3)
+
+    def test_rebuild_locks_the_counters_before_reading_the_raw_rows(self) -> None:
+        self.ingest_day()
+        counter = LinkwallDailyCounter.objects.get(linkwall=self.linkwall)
+        LinkwallDailyCounter.objects.filter(id=counter.id).update(views=0)
+        with patch.object(LinkwallDailyCounter.objects, "select_for_update", wraps=LinkwallDailyCounter.objects.select_for_update) as select_for_update, \
+                CaptureQueriesContext(connection) as queries:
+            LinkwallDailyCounter.objects.rebuild(self.clock().date(), self.clock().date())
+        select_for_update.assert_called_once_with()
+        tables = [LinkwallDailyCounter._meta.db_table, LinkwallViewCounterModel._meta.db_table]
+        touched = [table for query in queries.captured_queries for table in tables if f'FROM "{table}"' in query["sql"]]
+        self.assertEqual(touched[0], LinkwallDailyCounter._meta.db_table)
+        # Updated in place, a flush waiting on the row adds on top of it
+        rebuilt = LinkwallDailyCounter.objects.get(linkwall=self.linkwall)
+        self.assertEqual((rebuilt.id, rebuilt.views), (counter.id, 3))
+
+    def test_insights_read_the_counters(self) -> None:
+        self.ingest_day()
+        token = Token.objects.create(user=self.owner.user)
+        client = Client(HTTP_AUTHORIZATION=f"Token {token.key}")
+        res = client.get(reverse("linkwall-insights"), {"start_date": datetime_to_unix_timestamp_string(self.clock() - timedelta(days=1)),
+                                                        "end_date": datetime_to_unix_timestamp_string(self.clock())})
+        self.assertEqual(res.status_code, 200)
+        data = res.json()["data"]
+        self.assertEqual(data["insights"]["rows"], [[date_to_string(self.clock()), 3, 3, 2, 2]])
+        self.assertEqual(data["link_insights"]["rows"], [["https://example.com", 2], ["https://example.com/other", 1]])
+        self.assertEqual(data["insights"]["totals"], {"views": 3, "clicks": 3, "unique_visitors": 2})
+
+    def test_unique_visitors_across_days(self) -> None:
+        self.ingest_day()
+        first_day = self.clock().date()
+        self.clock.advance(days=1)
+        self.ingestor.enqueue(LinkwallEventActions.View, self.linkwall.id, self.visitors[0].user.id)
+        for visitor in ("anonymous:a", "anonymous:b", "anonymous:a"):
+            self.ingestor.enqueue(LinkwallEventActions.View, self.linkwall.id, None, visitor=visitor)
+        self.ingestor.flush()
+        counter = LinkwallDailyCounter.objects.get(linkwall=self.linkwall, day=self.clock().date())
+        # Anonymous visitors are only counted in the sketch
+        self.assertEqual((counter.views, counter.unique_viewers), (1, 1))
+        self.assertEqual(LinkwallDailyCounter.objects.count_unique_visitors(self.linkwall, self.clock().date(), self.clock().date()), 3)
+        self.assertEqual(LinkwallDailyCounter.objects.count_unique_visitors(self.linkwall, first_day, self.clock().date()), 4)
+        token = Token.objects.create(user=self.owner.user)
+        client = Client(HTTP_AUTHORIZATION=f"Token {token.key}")
+        res = client.get(reverse("linkwall-insights"), {"start_date": datetime_to_unix_timestamp_string(self.clock() - timedelta(days=1)),
+                                                        "end_date": datetime_to_unix_timestamp_string(self.clock())})
+        insights = res.json()["data"]["insights"]
+        # The range total is the merged estimate, not the sum of the days
+        self.assertEqual([row[4] for row in insights["rows"]], [2, 3])
+        self.assertEqual(insights["totals"]["unique_visitors"], 4)
+
+        # Compaction keeps the anonymous visitors of the stored sketch
+        LinkwallDailyCounter.objects.rebuild(first_day, self.clock().date())
+        self.assertEqual(LinkwallDailyCounter.objects.count_unique_visitors(self.linkwall, first_day, self.clock().date()), 4)
+
+    def test_anonymous_views(self) -> None:
+        client = Client(REMOTE_ADDR="10.0.0.1")
+        url = reverse("linkwall-action", args=[self.owner.username])
+        with patch("linktree.ingestion.linkwall_ingestor", self.ingestor):
+            res = client.get(url, {"action": LinkwallEventActions.View})
+            self.assertEqual(res.status_code, 200)
+            self.assertIn(VISITOR_COOKIE, res.cookies)
+            # The client sends the cookie back, the same visitor
+            client.get(url, {"action": LinkwallEventActions.View})
+            Client(REMOTE_ADDR="10.0.0.2").get(url, {"action": LinkwallEventActions.View})
+        self.ingestor.flush()
+        self.assertEqual(LinkwallViewCounterModel.objects.count(), 0)
+        self.assertEqual(LinkwallDailyCounter.objects.count_unique_visitors(self.linkwall, self.clock().date(), self.clock().date()), 2)
@@ -0,0 +1,90 @@
+from unittest.mock import patch
+from django.db import connection
+from django.test import TestCase
+from django.test.client import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+
+from accounts.models import Account
+from linktree.models import LinkWall
+from linktree.snapshot import linkwall_snapshots
+from utils.types import EntityType, LinkwallManageActions
+
+
+class TestLinkWallSnapshot(TestCase):
+
+    def setUp(self) -> None:
+        linkwall_snapshots.cache.clear()
+        self.account: Account = Account.objects.create(
+            email="bytatigrisdev2022@gmail.com",
+            first_name="Byta",
+            last_name="Tigris",
+            username="bitatigris",
+            entity_type=EntityType.Creator,
+            password="helloword103",
+            description="none cord",
+        )
+        self.content_type = "application/json"
+        self.token_obj: Token = Token.objects.create(user=self.account.user)
+        self.autheticated_client = Client(
+            HTTP_AUTHORIZATION=f"Token {self.token_obj.key}", HTTP_CONTENT_TYPE=self.content_type)
+        self.client = Client(HTTP_CONTENT_TYPE=self.content_type)
+        self.url = reverse("linktree-username-wall-fetch", args=[self.account.username])
+
+    def add_link(self, name: str, url: str) -> None:
+        res = self.autheticated_client.post(reverse("manage-linkwall", args=[LinkwallManageActions.AddLink]),
+                                            data={"links": [{"name": name, "url": url}]}, content_type=self.content_type)
+        self.assertEqual(res.status_code, 202)
+
+    def test_wall_is_served_from_the_snapshot(self) -> None:
+        self.add_link("Maritime", "https://iconscout.com/unicons/explore/line")
+        with CaptureQueriesContext(connection) as context:
+            res = self.client.get(self.url)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(context.captured_queries), 0)
+        data = res.json()["data"]
+        self.assertEqual(data["links"][0]["name"], "Maritime")
+        self.assertFalse(data["is_owner"])
+
+        owner_res = self.autheticated_client.get(self.url)
+        self.assertTrue(owner_res.json()["data"]["is_owner"])
+        self.assertNotEqual(owner_res["ETag"], res["ETag"])
+
+    def test_unchanged_wall_is_not_modified(self) -> None:
+        self.add_link("Maritime", "https://iconscout.com/unicons/explore/line")
+        etag = self.client.get(self.url)["ETag"]
+        res = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res["ETag"], etag)
+
+        self.add_link("Required", "https://iconscout.com/unicons/explore/line/required")
+        res = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(res.json()["data"]["links"]), 2)
+
+    def test_changes_outside_of_the_views_invalidate(self) -> None:
+        self.add_link("Maritime", "https://iconscout.com/unicons/explore/line")
+        self.client.get(self.url)
+        link = LinkWall.objects.get(account=self.account).links.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            link.is_visible = False
+            link.save()
+        self.assertIsNone(linkwall_snapshots.cache.get(linkwall_snapshots.get_key(self.account.username)))
+        self.assertEqual(self.client.get(self.url).json()["data"]["links"], [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            LinkWall.objects.get(account=self.account).delete()
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_per_process_cache_keeps_snapshots_briefly(self) -> None:
+        self.add_link("Maritime", "https://iconscout.com/unicons/explore/line")
+        linkwall_snapshots.cache.clear()
+        with patch.object(linkwall_snapshots.cache, "set", wraps=linkwall_snapshots.cache.set) as cache_set, \
+                self.settings(LOCAL_CACHE_MAX_TTL=5):
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.assertGreater(linkwall_snapshots.timeout, 5)
+        self.assertEqual(cache_set.call_args.args[2], 5)
+
+    def test_missing_wall(self) -> None:
+        self.assertEqual(self.client.get(reverse("linktree-username-wall-fetch", args=["nobody"])).status_code, 404)
@@ -1,30 +1,33 @@
 
 import json
-from typing import Dict, Tuple
+from uuid import uuid4
+from typing import Dict, Tuple, Union
 from django.http import QueryDict
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.request import Request
-from rest_framework.authentication import TokenAuthentication
+from accounts.authentication import CachedTokenAuthentication
 from rest_framework.permissions import IsAuthenticated, AllowAny
 
 from rest_framework import status
 from accounts.models import Account
 from linktree.models import LinkWall, LinkWallLink, LinkwallMediaHandles
 from linktree.serializer import LinkWallSerializer
+from linktree.ingestion import VISITOR_COOKIE, get_request_visitor
+from linktree.snapshot import LinkWallSnapshot, linkwall_snapshots
 from django.contrib.auth.models import User
 from django.db.models import QuerySet
 from utils.errors import AccountAuthenticationFailed, AccountDoesNotExists, NoLinkExists, NoLinkwallExists
 from log_engine.log import logger
 from rest_framework.decorators import api_view, permission_classes, authentication_classes
 
-from utils.types import LinkwallManageActions
+from utils.types import LinkwallEventActions, LinkwallManageActions
 
 
 
 
 class RetrieveMyLinkWall(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
     linkwall_serializer  = LinkWallSerializer()
 
@@ -290,7 +293,7 @@ def remove_style(request: Request) -> Response:
 
 
 class ManageLinkwallAPIView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def post(self, request: Request, action: str) -> Response:
@@ -307,51 +310,70 @@ class ManageLinkwallAPIView(APIView):
         if action not in calback_map:
             return Response({"error": f"Invalid action {action}"}, status=status.HTTP_400_BAD_REQUEST)
         callback = calback_map[action]
-        return callback(request)
+        response: Response = callback(request)
+        if response.status_code == status.HTTP_202_ACCEPTED:
+            linkwall_snapshots.refresh(request.account.username)
+        return response
 
 
 
 class RetrieveLinkWall(APIView):
+    """
+    Public link wall, served from the snapshot cache\n
+    The ETag covers the viewer's `is_owner` flag, a matching If-None-Match returns 304
+    """
     permission_classes = [AllowAny]
-    linkwall_serializer = LinkWallSerializer()
 
     def get(self, request: Request, username: str) -> Response:
-        linkwall_queryset = LinkWall.objects.filter(account__username=username)
-        current_username = None
-        if request.account is not None:
-            current_username = request.account.username
-        if not linkwall_queryset.exists():
+        snapshot: Union[LinkWallSnapshot, None] = linkwall_snapshots.get(username)
+        if snapshot is None:
             return Response({"error": "No link wall related to such username"}, status=status.HTTP_404_NOT_FOUND)
-        linkwall: LinkWall = linkwall_queryset.first()
-        return Response({"data" :self.linkwall_serializer(linkwall, current_username=current_username)}, status=status.HTTP_200_OK)
+        is_owner = request.account is not None and request.account.username == username
+        etag = snapshot.get_etag(is_owner)
+        if etag in request.headers.get("If-None-Match", ""):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        return Response({"data": snapshot.get_data(is_owner)}, status=status.HTTP_200_OK, headers={"ETag": etag})
 
 
 
 
 
 class LinkwallActionAPIView(APIView):
-    authentication_classes = [TokenAuthentication]
-    permission_classes = [AllowAny, IsAuthenticated]
+    """
+    Records a view or a click of a wall\n
+    Anonymous visitors are counted in the unique visitors only, a visitor cookie is set on their first view
+    """
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [AllowAny]
 
     def get(self, request: Request, username: str) -> Response:
         _status = status.HTTP_200_OK
         response = {}
         params: QueryDict = request.GET
+        visitor_id = None
         try:
-            linkwall_queryset: QuerySet[LinkWall] = LinkWall.objects.filter(account__username=username)
-            if not linkwall_queryset.exists():
+            linkwall: LinkWall = LinkWall.objects.select_related("account").filter(account__username=username).first()
+            if linkwall is None:
                 raise NoLinkwallExists()
-            linkwall: LinkWall = linkwall_queryset.first()
-            user: User = request.user
+            user: Union[User, None] = request.user if request.user.is_authenticated else None
             
             assert "action" in params, "Incomplete request, missing action"
-            if linkwall.account.user != user:
-                if params.get("action") == "view":
-                    linkwall.add_view(user)
-                elif params.get("action") == "click":
+            accepted = True
+            if user is None and VISITOR_COOKIE not in request.COOKIES:
+                visitor_id = uuid4().hex
+                request.COOKIES[VISITOR_COOKIE] = visitor_id
+            if user is None or linkwall.account.user_id != user.id:
+                if params.get("action") == LinkwallEventActions.View:
+                    accepted = linkwall.add_view(user, get_request_visitor(request))
+                elif params.get("action") == LinkwallEventActions.Click:
                     assert "link" in params, "Incomplete request, missing link"
-                    linkwall.add_click(user, params.get("link"))
+                    if user is not None:
+                        accepted = linkwall.add_click(user, params.get("link"))
             response["data"] = ""
+            if not accepted:
+                # The event buffer is full, clients retry later
+                response["error"] = "Too many events, try again later"
+                _status = status.HTTP_503_SERVICE_UNAVAILABLE
 
         except Exception as exc:
             _status = status.HTTP_400_BAD_REQUEST
@@ -359,11 +381,7 @@ class LinkwallActionAPIView(APIView):
                 response["error"] = str(exc)
             else:
                 logger.error(exc)
-        return Response(response, status=_status)
-            
-
-
-
-
-
-
+        http_response = Response(response, status=_status)
+        if visitor_id is not None:
+            http_response.set_cookie(VISITOR_COOKIE, visitor_id, max_age=60*60*24*365, httponly=True, samesite="Lax")
+        return http_response
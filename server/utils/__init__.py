@@ -1,6 +1,9 @@
 from hashlib import sha256
 from datetime import date, datetime, timedelta
 from typing import Any, Callable, Dict, Tuple, Union
+from django.conf import settings
+from django.core.cache.backends.base import BaseCache
+from django.core.cache.backends.locmem import LocMemCache
 from django.http.request import QueryDict
 from utils.errors import PasswordValidationError
 import os
@@ -65,8 +68,8 @@ def get_modified_time_wrapper(
                                  hours=hours, days=days, time=time)
     return inner
 
-def get_handle_metrics_expire_time(time: datetime = get_current_time()) -> datetime:
-    return get_modified_time(days=7, time=time)
+def get_handle_metrics_expire_time(time: datetime = None) -> datetime:
+    return get_modified_time(days=7, time=time if time is not None else get_current_time())
 
 def get_datetime_from_facebook_response(time_str: str) -> datetime:
     return datetime.strptime(time_str, FACEBOOK_RESPONSE_DATE_TIME_FORMAT)
@@ -131,6 +134,20 @@ def get_secret(name: str) -> str:
     return os.getenv(name)
 
 
+def is_local_cache(cache: BaseCache) -> bool:
+    return isinstance(cache, LocMemCache)
+
+
+def get_cache_timeout(cache: BaseCache, timeout: Union[int, None]) -> Union[int, None]:
+    """
+    Entries of a per-process cache are kept at most LOCAL_CACHE_MAX_TTL seconds,
+    the invalidations made by one worker don't reach the caches of the others
+    """
+    if not is_local_cache(cache):
+        return timeout
+    return settings.LOCAL_CACHE_MAX_TTL if timeout is None else min(timeout, settings.LOCAL_CACHE_MAX_TTL)
+
+
 def reformat_age_gender(data: Dict[str, int]) -> Dict[str, int]:
         gender_group = {"M": 0, "F": 0, "U": 0}
         age_group = {"age13-17": 0, "age18-24":0, "age25-34": 0, "age35-44": 0, "age45-54": 0, "age55-64": 0, "age65-": 0}
@@ -161,6 +178,34 @@ def subtract_merge(*metrics_array: Dict[str, Union[int, float]]) -> Dict[str, Un
                         data[key] -= value
     return data
 
+def metric_delta(old: Union[Dict[str, Union[int, float]], int, float], new: Union[Dict[str, Union[int, float]], int, float]) -> Union[Dict[str, Union[int, float]], int, float]:
+    """
+    Returns new - old, per key for dict metrics\n
+    Keys only in old are kept when their value is not 0, so applying the delta removes them from a total
+    """
+    if not isinstance(new, dict) and not isinstance(old, dict):
+        return new - old
+    old = old if isinstance(old, dict) else {}
+    new = new if isinstance(new, dict) else {}
+    data = {key: value - old.get(key, 0) for key, value in new.items()}
+    for key, value in old.items():
+        if key not in new and value != 0:
+            data[key] = -value
+    return data
+
+def apply_metric_delta(total: Union[Dict[str, Union[int, float]], int, float, None], delta: Union[Dict[str, Union[int, float]], int, float]) -> Union[Dict[str, Union[int, float]], int, float]:
+    if isinstance(delta, dict):
+        return merge_metric(total if isinstance(total, dict) else {}, delta)
+    return (total if isinstance(total, (int, float)) else 0) + delta
+
+def metric_total_value(total: Union[Dict[str, Union[int, float]], int, float]) -> Union[int, float]:
+    """
+    Single value of a total, TOTAL of a dict metric or the sum of its dimensions
+    """
+    if isinstance(total, dict):
+        return total.get("TOTAL", sum(total.values()))
+    return total
+
 def is_in_debug_mode() -> bool:
     return os.getenv('DEBUG', False) == 'True'
 
@@ -1,96 +1,163 @@
-from datetime import timedelta
-from typing import Dict, List, Union
-from pandas import DataFrame, Timestamp
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Tuple, Union
+from pandas import DataFrame, DatetimeIndex
+import numpy as np
 
 # from insights.models import SocialMediaHandleMetrics
-from utils import date_to_string, string_to_date
+from utils import DATE_FORMAT, date_to_string, string_to_date
+from utils.types import MetricTableLayout
 
 Number = Union[int, float]
-MetricTableJson = Dict[str, Union[List[str], List[Union[str, Number]], Dict[str, Number]]]
+MetricTableJson = Dict[str, Union[List[str], List[Union[str, Number]], Dict[str, Union[Number, List, np.ndarray]]]]
 
 
 class MetricTable:
     """
-    Columns are Date and all other metrics explicity
+    Rows are indexed by date, columns are the flattened metric keys e.g IMPRESSIONS_TOTAL, AUDIENCE_CITY_Mumbai
     Each Metric must implement get_metric_rows which returns dict with date as key and dict as value containign metric_name as key and data as value.
     Each Metric Class must have a get_columns staticmenthod, which will return all column names
     If earliest metric contains prev_totals in metrics
-        than prev_totals will be formed into row with date one day prior to the earliest 
+        than prev_totals will be formed into row with date one day prior to the earliest
         then metrics get_prev_totals_row will be used
+
+    Rows of every metric are gathered into columnar arrays first, the frame is built once,
+    rows sharing a date (e.g the same day of two handles) are summed
     """
     def __init__(self,columns = None, index: str = "day", *metrics: 'SocialMediaHandleMetrics', **kwargs) -> None:
         self.metrics = metrics
         self.columns = columns
         self.index = index
-        self._df = DataFrame(columns=columns)
+        # Totals of the days before the table, set by from_daily_totals
+        self.prev_totals: Union[Dict[str, Number], None] = None
 
         if columns is None and len(metrics) > 0:
             self.columns = metrics[0].get_columns()
-        for metric in metrics:
-            self.add(metric)
-    
+        self._df = self.build_frame(metrics)
+
     @property
     def df(self) -> DataFrame:
         return self._df
-    
-
-    def transform_row_dict(self, data: Dict[str, Dict[str, Union[int, float]]]) -> List[Dict[str, Union[int, float]]]:
-        transformed = []
-        for key, value in data.items():
-            value[self.index] = string_to_date(key)
-            transformed.append(value.copy())
-        return transformed
-
-    def reset_prev_totals(self, metric: 'SocialMediaHandleMetrics') -> None:
-        oldest_date = self._df[self.index].min()
-        if oldest_date and isinstance(oldest_date, Timestamp):
-            oldest_date = oldest_date.to_pydatetime()
-        elif oldest_date and isinstance(oldest_date, str):
-            oldest_date = string_to_date(oldest_date)
-        if metric.expired_on <= oldest_date and "prev_totals" in metric.meta_data:
-            metric_data: Dict[str, Union[int, float]] = metric.get_prev_totals_row()
-            new_earliest_date = metric.created_on - timedelta(days=1)
-            rows = self.transform_row_dict({date_to_string(new_earliest_date): metric_data})
-            self.add_rows(rows)
-
-
-    def add_rows(self, rows: List[List[Union[str, Number]]]) -> None:
-        model_row = {key: 0  for key in self.columns if key != self.index}
-        for row in rows:
-            self._df.append(model_row | row, ignore_index=True)
-                    
-    
+
+    def get_prev_totals_row(self, metrics: Iterable['SocialMediaHandleMetrics']) -> Union[Tuple[str, Dict[str, Number]], None]:
+        """
+        Returns (date_str, row) of the prev_totals of the earliest metric, a day before it was created
+        """
+        earliest = min(metrics, key=lambda metric: metric.created_on, default=None)
+        if earliest is None or "prev_totals" not in earliest.meta_data:
+            return None
+        row = earliest.get_prev_totals_row()
+        if not row:
+            return None
+        return date_to_string(earliest.created_on - timedelta(days=1)), row
+
+    def iter_rows(self, metrics: Iterable['SocialMediaHandleMetrics']) -> Iterable[Tuple[str, Dict[str, Number]]]:
+        for metric in metrics:
+            yield from metric.get_metric_rows().items()
+        if (prev_totals_row := self.get_prev_totals_row(metrics)) is not None:
+            yield prev_totals_row
+
+    @classmethod
+    def from_daily_totals(cls, columns: List[str], daily_totals: Iterable[Dict], index: str = "day",
+                          prev_totals: Dict[str, Number] = None) -> 'MetricTable':
+        """
+        Builds the table from values already summed per day, e.g by HandleMetricFact.objects.get_daily_totals\n
+        Every row is {"day": date, "metric": metric_name, "dimension": key, "total": value}\n
+        The table holds no metrics, `add` is not supported on it\n
+
+        Keyword Arguments:\n
+        index -- Name of the index, e.g week when every day is the first day of a week\n
+        prev_totals -- Totals of the days before the table, serialized as prev_totals [Optional]\n
+        """
+        table = cls(columns, index)
+        table.prev_totals = prev_totals
+        table._df = table.frame_from_rows(
+            (row["day"], {f"{row['metric'].upper()}_{row['dimension']}": cls.to_number(row["total"])}) for row in daily_totals
+        )
+        return table
+
+    @staticmethod
+    def to_number(value: Number) -> Number:
+        # Sums come back as floats, whole values are kept as ints like the JSON metrics
+        if isinstance(value, float) and value.is_integer():
+            return int(value)
+        return value
+
+    def build_frame(self, metrics: Iterable['SocialMediaHandleMetrics']) -> DataFrame:
+        return self.frame_from_rows(self.iter_rows(metrics))
+
+    def frame_from_rows(self, rows: Iterable[Tuple[Union[str, date], Dict[str, Number]]]) -> DataFrame:
+        dates: List[Union[str, date]] = []
+        positions: Dict[str, List[int]] = {}
+        values: Dict[str, List[Number]] = {}
+        for day, row in rows:
+            position = len(dates)
+            dates.append(day)
+            for key, value in row.items():
+                if value is None:
+                    continue
+                positions.setdefault(key, []).append(position)
+                values.setdefault(key, []).append(value)
+
+        data: Dict[str, np.ndarray] = {}
+        for key, key_values in values.items():
+            dtype = np.int64 if all(isinstance(value, int) for value in key_values) else np.float64
+            column = np.zeros(len(dates), dtype=dtype)
+            column[positions[key]] = key_values
+            data[key] = column
+        index = DatetimeIndex([string_to_date(day) if isinstance(day, str) else day for day in dates], name=self.index)
+        df = DataFrame(data, index=index)
+        return df.groupby(level=0).sum().sort_index()
+
     def add(self, metric: 'SocialMediaHandleMetrics') -> None:
-        metric_data: Dict[str, Dict[str, Union[int, float]]] = metric.get_metric_rows()
-        rows = self.transform_row_dict(metric_data)
-        self.add_rows(rows)
-        self.reset_prev_totals(metric)
-    
-    def get_totals(self) -> Dict[str, Number]:
-        totals = {}
-        for col in self.columns:
-            if col == self.index:
-                continue
-            totals[col] = self._df[col].sum()
-        return totals
-    
-    def json(self, *filter_metrics) -> MetricTableJson:
-        columns = self.columns
-        removed_cols_index = []
-        totals = self.get_totals()
-        for index,metric_name in enumerate(columns):
-            if metric_name in filter_metrics:
-                removed_cols_index.append(index)
-                columns.remove(metric_name)
-                if metric_name in totals:
-                    del totals[metric_name]
-        
-        _json: MetricTableJson = {"columns": self.columns, "rows": [], "totals": self.get_totals()}
-        for row in self._df.values:
-            _json["rows"].append([data for index, data in enumerate(row) if index not in removed_cols_index])
-        return _json
+        """
+        Rebuilds the frame with the metric, pass every metric to the constructor instead when they are known upfront
+        """
+        self.metrics += (metric,)
+        if self.columns is None:
+            self.columns = metric.get_columns()
+        self._df = self.build_frame(self.metrics)
 
+    def get_column_metrics(self, columns: Iterable[str] = None) -> Dict[str, Union[str, None]]:
+        """
+        Maps every column of the frame (or the given columns) to the metric it belongs to, by the longest matching metric prefix
+        i.e CARD_CLICK_RATE_TOTAL belongs to card_click_rate, not to card_clicks
+        """
+        prefixes = sorted(((f"{metric_name.upper()}_", metric_name) for metric_name in (self.columns or [])),
+                          key=lambda prefix: len(prefix[0]), reverse=True)
+        column_metrics = {}
+        for column in (self._df.columns if columns is None else columns):
+            column_metrics[column] = next((metric_name for prefix, metric_name in prefixes if column.startswith(prefix)), None)
+        return column_metrics
 
-    
+    @staticmethod
+    def sum_columns(df: DataFrame) -> Dict[str, Number]:
+        # Summed per column, df.sum() upcasts every column to float64 as soon as one of them is float
+        return {column: df[column].sum().item() for column in df.columns}
 
-    
\ No newline at end of file
+    def get_totals(self) -> Dict[str, Number]:
+        return self.sum_columns(self._df)
+
+    def json(self, *filter_metrics, layout: str = MetricTableLayout.Rows) -> MetricTableJson:
+        """
+        Serializes the table without the columns of filter_metrics (private metrics)
+
+        Keyword Arguments:\n
+        layout -- MetricTableLayout.Rows: {"columns", "rows": [[day, *values]], "totals"}\n
+                  MetricTableLayout.Columnar: {"columns", "data": {column: values}, "totals"}, values are numpy arrays\n
+        prev_totals is added when the table holds them\n
+        """
+        removed_columns = [column for column, metric_name in self.get_column_metrics().items() if metric_name in filter_metrics]
+        df = self._df.drop(columns=removed_columns)
+        days = df.index.strftime(DATE_FORMAT).tolist()
+        _json: MetricTableJson = {"columns": [self.index] + list(df.columns), "totals": self.sum_columns(df)}
+        if layout == MetricTableLayout.Columnar:
+            # Arrays are kept as they are, the ORJSONRenderer serializes them without going through python objects
+            _json["data"] = {self.index: days} | {column: df[column].to_numpy() for column in df.columns}
+        else:
+            # Read per column, df.to_numpy() would turn the int columns into floats next to a float one
+            column_values = [df[column].tolist() for column in df.columns]
+            _json["rows"] = [[day] + [values[position] for values in column_values] for position, day in enumerate(days)]
+        if self.prev_totals is not None:
+            column_metrics = self.get_column_metrics(self.prev_totals.keys())
+            _json["prev_totals"] = {column: value for column, value in self.prev_totals.items() if column_metrics[column] not in filter_metrics}
+        return _json
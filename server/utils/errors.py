@@ -66,3 +66,8 @@ class NoLinkwallExists(ServerException):
 class NoLinkExists(ServerException):
     def __init__(self) -> None:
         super().__init__(f"No link exists")
+
+class RateLimitExceeded(ServerException):
+    def __init__(self, key: str, wait: float) -> None:
+        self.wait = wait
+        super().__init__(f"Rate limit of {key} exceeded, retry after {wait:.1f} seconds")
@@ -0,0 +1,102 @@
+from hashlib import blake2b
+from math import log
+from typing import Iterable, Union
+import numpy as np
+
+# 2^12 one byte registers, 4 KiB per sketch with a standard error of about 1.6%
+DEFAULT_PRECISION = 12
+
+
+class HyperLogLog:
+    """
+    HyperLogLog sketch counting distinct values in constant memory\n
+    Sketches of the same precision merge by taking the maximum of every register,
+    the merge of daily sketches counts the distinct values of the whole range
+
+    Keyword Arguments:\n
+    precision -- Number of index bits, the sketch has 2^precision registers [default=12]\n
+    registers -- Registers of a stored sketch [Optional]\n
+    """
+
+    def __init__(self, precision: int = DEFAULT_PRECISION, registers: bytes = None) -> None:
+        if not 4 <= precision <= 16:
+            raise ValueError(f"HyperLogLog precision must be within [4, 16], got {precision}")
+        self.precision = precision
+        self.size = 1 << precision
+        if registers is None:
+            self.registers = np.zeros(self.size, dtype=np.uint8)
+        else:
+            if len(registers) != self.size:
+                raise ValueError(f"Expected {self.size} registers for precision {precision}, got {len(registers)}")
+            self.registers = np.frombuffer(registers, dtype=np.uint8).copy()
+
+    @staticmethod
+    def hash(value: Union[str, bytes]) -> int:
+        if isinstance(value, str):
+            value = value.encode()
+        return int.from_bytes(blake2b(value, digest_size=8).digest(), "big")
+
+    def add(self, value: Union[str, bytes]) -> None:
+        hashed = self.hash(value)
+        index = hashed >> (64 - self.precision)
+        # Position of the leftmost 1 in the bits left after the index
+        remaining = hashed & ((1 << (64 - self.precision)) - 1)
+        rank = 64 - self.precision - remaining.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def update(self, values: Iterable[Union[str, bytes]]) -> 'HyperLogLog':
+        for value in values:
+            self.add(value)
+        return self
+
+    def merge(self, other: 'HyperLogLog') -> 'HyperLogLog':
+        if other.precision != self.precision:
+            raise ValueError(f"Can't merge HyperLogLog of precision {other.precision} into {self.precision}")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self) -> int:
+        if self.size == 16:
+            alpha = 0.673
+        elif self.size == 32:
+            alpha = 0.697
+        elif self.size == 64:
+            alpha = 0.709
+        else:
+            alpha = 0.7213 / (1 + 1.079 / self.size)
+        estimate = alpha * self.size * self.size / np.sum(np.ldexp(1.0, -self.registers.astype(np.int32)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        # Linear counting is more accurate for small cardinalities
+        if estimate <= 2.5 * self.size and zeros > 0:
+            estimate = self.size * log(self.size / zeros)
+        return int(round(estimate))
+
+    def __len__(self) -> int:
+        return self.count()
+
+    def to_bytes(self) -> bytes:
+        """
+        Returns the precision byte followed by the registers
+        """
+        return bytes([self.precision]) + self.registers.tobytes()
+
+    @classmethod
+    def from_bytes(cls, value: Union[bytes, memoryview, None]) -> 'HyperLogLog':
+        """
+        Reads a sketch written by to_bytes, an empty value is an empty sketch
+        """
+        if not value:
+            return cls()
+        value = bytes(value)
+        return cls(value[0], value[1:])
+
+    @classmethod
+    def merge_all(cls, values: Iterable[Union[bytes, memoryview, None]]) -> 'HyperLogLog':
+        """
+        Merges the stored sketches, e.g the daily sketches of a range
+        """
+        merged = cls()
+        for value in values:
+            merged.merge(cls.from_bytes(value))
+        return merged
@@ -0,0 +1,26 @@
+from typing import Any, Mapping
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+import orjson
+
+
+
+class ORJSONRenderer(BaseRenderer):
+    """
+    Drop-in replacement of rest_framework's JSONRenderer backed by orjson\n
+    numpy arrays and scalars (e.g MetricTable data) are serialized natively,
+    types orjson doesn't know are handed to rest_framework's JSONEncoder
+    """
+    media_type = "application/json"
+    format = "json"
+    charset = None
+    options = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    @staticmethod
+    def default(obj: Any) -> Any:
+        return JSONEncoder().default(obj)
+
+    def render(self, data: Any, accepted_media_type: str = None, renderer_context: Mapping[str, Any] = None) -> bytes:
+        if data is None:
+            return b""
+        return orjson.dumps(data, default=self.default, option=self.options)
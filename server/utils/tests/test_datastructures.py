@@ -0,0 +1,96 @@
+from datetime import datetime
+from typing import Dict, List, Union
+import pytest
+import orjson
+from utils.datastructures import MetricTable
+from utils.renderers import ORJSONRenderer
+from utils.types import MetricTableLayout
+
+
+class WeekMetric:
+    """
+    Stands in for a SocialMediaHandleMetrics row, get_metric_rows returns the flattened rows of the week
+    """
+
+    def __init__(self, created_on: datetime, rows: Dict[str, Dict[str, Union[int, float]]],
+                 prev_totals: Dict[str, Union[int, float]] = None) -> None:
+        self.created_on = created_on
+        self.rows = rows
+        self.meta_data = {} if prev_totals is None else {"prev_totals": prev_totals}
+
+    def get_metric_rows(self) -> Dict[str, Dict[str, Union[int, float]]]:
+        return self.rows
+
+    def get_columns(self) -> List[str]:
+        return ["card_clicks", "card_click_rate", "views"]
+
+    def get_prev_totals_row(self) -> Dict[str, Union[int, float]]:
+        return self.meta_data["prev_totals"]
+
+
+@pytest.fixture
+def metrics() -> List[WeekMetric]:
+    return [
+        WeekMetric(datetime(2021, 11, 15), {
+            "15-11-2021": {"VIEWS_TOTAL": 10, "CARD_CLICKS_TOTAL": 1},
+            "16-11-2021": {"VIEWS_TOTAL": 12, "CARD_CLICK_RATE_TOTAL": 0.5},
+        }, prev_totals={"VIEWS_TOTAL": 100}),
+        # Second handle, overlapping the first week
+        WeekMetric(datetime(2021, 11, 16), {
+            "16-11-2021": {"VIEWS_TOTAL": 3, "VIEWS_SUBSCRIBED": 2},
+            "17-11-2021": {"VIEWS_TOTAL": 4},
+        }),
+    ]
+
+
+def test_rows_are_summed_per_day(metrics):
+    table = MetricTable(None, "day", *metrics)
+    assert table.df.index.name == "day"
+    assert [day.strftime("%d-%m-%Y") for day in table.df.index] == ["14-11-2021", "15-11-2021", "16-11-2021", "17-11-2021"]
+    assert table.df["VIEWS_TOTAL"].tolist() == [100, 10, 15, 4]
+    assert table.df["VIEWS_SUBSCRIBED"].tolist() == [0, 0, 2, 0]
+    assert table.get_totals() == {"VIEWS_TOTAL": 129, "CARD_CLICKS_TOTAL": 1, "CARD_CLICK_RATE_TOTAL": 0.5, "VIEWS_SUBSCRIBED": 2}
+
+
+def test_add_matches_constructor(metrics):
+    table = MetricTable()
+    for metric in metrics:
+        table.add(metric)
+    assert table.df.equals(MetricTable(None, "day", *metrics).df)
+
+
+def test_columns_map_to_longest_metric_prefix(metrics):
+    column_metrics = MetricTable(None, "day", *metrics).get_column_metrics()
+    assert column_metrics["CARD_CLICK_RATE_TOTAL"] == "card_click_rate"
+    assert column_metrics["CARD_CLICKS_TOTAL"] == "card_clicks"
+
+
+def test_json_drops_filtered_metrics(metrics):
+    _json = MetricTable(None, "day", *metrics).json("card_clicks", "card_click_rate")
+    assert _json["columns"] == ["day", "VIEWS_TOTAL", "VIEWS_SUBSCRIBED"]
+    assert _json["rows"][2] == ["16-11-2021", 15, 2]
+    assert _json["totals"] == {"VIEWS_TOTAL": 129, "VIEWS_SUBSCRIBED": 2}
+
+
+def test_json_keeps_int_columns_next_to_float_columns(metrics):
+    _json = MetricTable(None, "day", *metrics).json()
+    assert _json["columns"] == ["day", "VIEWS_TOTAL", "CARD_CLICKS_TOTAL", "CARD_CLICK_RATE_TOTAL", "VIEWS_SUBSCRIBED"]
+    row = _json["rows"][2]
+    assert row == ["16-11-2021", 15, 0, 0.5, 2]
+    assert [type(value) for value in row[1:]] == [int, int, float, int]
+    assert _json["totals"] == {"VIEWS_TOTAL": 129, "CARD_CLICKS_TOTAL": 1, "CARD_CLICK_RATE_TOTAL": 0.5, "VIEWS_SUBSCRIBED": 2}
+    assert [type(value) for value in _json["totals"].values()] == [int, int, float, int]
+
+
+def test_empty_table():
+    assert MetricTable().json() == {"columns": ["day"], "rows": [], "totals": {}}
+
+
+def test_columnar_layout(metrics):
+    _json = MetricTable(None, "day", *metrics).json("card_clicks", layout=MetricTableLayout.Columnar)
+    assert "rows" not in _json
+    assert _json["columns"] == ["day", "VIEWS_TOTAL", "CARD_CLICK_RATE_TOTAL", "VIEWS_SUBSCRIBED"]
+    rendered = orjson.loads(ORJSONRenderer().render({"data": _json}))["data"]
+    assert rendered["data"]["day"] == ["14-11-2021", "15-11-2021", "16-11-2021", "17-11-2021"]
+    assert rendered["data"]["VIEWS_TOTAL"] == [100, 10, 15, 4]
+    assert rendered["data"]["CARD_CLICK_RATE_TOTAL"] == [0, 0, 0.5, 0]
@@ -0,0 +1,37 @@
+import pytest
+from utils.hyperloglog import HyperLogLog
+
+
+def test_count_is_within_the_error_bound() -> None:
+    for cardinality in (0, 10, 1000, 50000):
+        sketch = HyperLogLog().update(f"user:{index}" for index in range(cardinality))
+        # Repeated values are counted once
+        sketch.update(f"user:{index}" for index in range(cardinality // 2))
+        assert abs(sketch.count() - cardinality) <= max(1, cardinality * 0.05)
+
+
+def test_merge_counts_the_union() -> None:
+    first = HyperLogLog().update(f"user:{index}" for index in range(0, 3000))
+    second = HyperLogLog().update(f"user:{index}" for index in range(2000, 5000))
+    merged = HyperLogLog.merge_all([first.to_bytes(), second.to_bytes(), None])
+    assert abs(merged.count() - 5000) <= 250
+    assert first.count() < merged.count()
+
+
+def test_bytes_round_trip() -> None:
+    sketch = HyperLogLog(precision=10).update(["cookie:a", "cookie:b"])
+    value = sketch.to_bytes()
+    assert len(value) == 1 + 2 ** 10
+    restored = HyperLogLog.from_bytes(memoryview(value))
+    assert restored.precision == 10
+    assert restored.count() == 2
+    assert HyperLogLog.from_bytes(b"").count() == 0
+
+
+def test_invalid_sketches() -> None:
+    with pytest.raises(ValueError):
+        HyperLogLog(precision=20)
+    with pytest.raises(ValueError):
+        HyperLogLog(precision=10).merge(HyperLogLog(precision=12))
+    with pytest.raises(ValueError):
+        HyperLogLog.from_bytes(bytes([12, 0, 0]))
@@ -65,4 +65,13 @@ def test_seconds_to_datetime_from_time():
     ]
     for fixture in fixtures:
         time = seconds_to_datetime_from_time(fixture[0], current_time)
-        assert time == fixture[1], f"Time is not matiching {time}"
\ No newline at end of file
+        assert time == fixture[1], f"Time is not matiching {time}"
+
+def test_metric_delta():
+    assert metric_delta({"TOTAL": 3, "SUBSCRIBED": 1}, {"TOTAL": 5}) == {"TOTAL": 2, "SUBSCRIBED": -1}
+    assert metric_delta({}, {"TOTAL": 0}) == {"TOTAL": 0}
+    assert metric_delta(4, 7) == 3
+    total = apply_metric_delta({"TOTAL": 10, "SUBSCRIBED": 1}, metric_delta({"TOTAL": 3, "SUBSCRIBED": 1}, {"TOTAL": 5}))
+    assert total == {"TOTAL": 12, "SUBSCRIBED": 0}
+    assert apply_metric_delta({}, 2) == 2
+    assert metric_total_value({"SUBSCRIBED": 2, "UNSUBSCRIBED": 3}) == 5
@@ -46,6 +46,35 @@ class RequestMethod:
     Post = "POST"
 
 
+class GraphErrorCodes:
+    """
+    `error.code` of the Graph API errors
+    """
+    # Invalid parameter, e.g a field or an insights metric the handle can't expand
+    InvalidParameter = 100
+    # Permission denied, insights which are not available yet ("Not enough viewers") come with it too
+    Permission = 10
+    # Invalid session and invalid, expired or revoked access token
+    Session = 102
+    AccessToken = 190
+
+
+class MetricTableLayout:
+    Rows = "rows"
+    Columnar = "columnar"
+
+
+class RollupGranularity:
+    Day = "day"
+    Week = "week"
+    Month = "month"
+
+
+class PartitionRetentionAction:
+    Drop = "drop"
+    Archive = "archive"  # Detached from the table and kept as <table>_archive_YYYY_MM
+
+
 class YTSubscriptionStatus:
     UNSUBSCRIBED = "UNSUBSCRIBED"
     SUBSCRIBED = "SUBSCRIBED"
@@ -101,6 +130,10 @@ class LinkwallManageActions:
     EditStyle= "edit_style"
     RemoveStyle = "remove_style"
 
+class LinkwallEventActions:
+    View = "view"
+    Click = "click"
+
 class LinkWallComponents:
     LinkButton = "link-button"
     LinkText = "link-text"